@@ -0,0 +1,401 @@
+"""Asynchronous client that talks to the Raft nodes directly instead of through the welcome server.
+
+AsyncPrinterClient learns the cluster's nodes and its leader from each node's
+/status. Writes go straight to the leader, and reads are spread over the nodes
+that are caught up. When a follower answers a write with the leader it last
+heard from, the write is resent there at once. Every node gets a pool of
+keep-alive connections, so one event loop can keep many calls in flight:
+
+    async with AsyncPrinterClient(nodes=["127.0.0.1:5000"]) as client:
+        await asyncio.gather(*(client.submit_print_job(f"job-{i}", "p1", "f1", "blob:...", 20)
+                               for i in range(1000)))
+
+SyncPrinterClient runs the same client on a background event loop for code that
+is not async. Sharded clusters serve each group under its own path; reach them
+through the welcome server with client.PrinterClient.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from requests.structures import CaseInsensitiveDict
+
+from client import retry_after
+
+Address = Tuple[str, int]
+
+# Direct responses worth retrying under the same request ID: an overloaded or restarting leader
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+CONNECTION_ERRORS = (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError)
+
+
+def parse_address(node: str) -> Address:
+    """'host:port' or 'http://host:port' as a (host, port) pair"""
+    parts = urlsplit(node if "//" in node else f"http://{node}")
+    return parts.hostname, parts.port or 80
+
+
+class HttpResponse:
+    def __init__(self, status_code: int, headers: CaseInsensitiveDict, content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class HttpConnection:
+    """One keep-alive HTTP/1.1 connection; requests on it are sent one after another"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.reusable = True
+
+    @classmethod
+    async def open(cls, host: str, port: int) -> "HttpConnection":
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, method: str, host: str, port: int, path: str,
+                      headers: Dict[str, str], body: bytes) -> HttpResponse:
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        version, status = status_line.split(b" ", 2)[:2]
+        response_headers = CaseInsensitiveDict()
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip()] = value.strip()
+
+        status = int(status)
+        if method == "HEAD" or status in (204, 304):
+            content = b""
+        elif response_headers.get("Transfer-Encoding", "").lower() == "chunked":
+            content = await self._read_chunked()
+        elif "Content-Length" in response_headers:
+            content = await self.reader.readexactly(int(response_headers["Content-Length"]))
+        else:
+            content = await self.reader.read()  # Delimited by the server closing the connection
+            self.reusable = False
+        if version != b"HTTP/1.1" or response_headers.get("Connection", "").lower() == "close":
+            self.reusable = False
+        return HttpResponse(status, response_headers, content)
+
+    async def _read_chunked(self) -> bytes:
+        parts = []
+        while True:
+            size = int((await self.reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                while await self.reader.readline() not in (b"\r\n", b"\n", b""):
+                    pass  # Trailers
+                return b"".join(parts)
+            parts.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+    def close(self):
+        self.reusable = False
+        self.writer.close()
+
+
+class ConnectionPool:
+    """Up to ``size`` keep-alive connections to one node, shared by every concurrent call"""
+
+    def __init__(self, host: str, port: int, size: int):
+        self.host = host
+        self.port = port
+        self.slots = asyncio.Semaphore(size)
+        self.idle: List[HttpConnection] = []
+
+    async def request(self, method: str, path: str, headers: Dict[str, str], body: bytes,
+                      timeout: float) -> HttpResponse:
+        async with self.slots:
+            while True:
+                reused = bool(self.idle)
+                connection = self.idle.pop() if reused else await asyncio.wait_for(
+                    HttpConnection.open(self.host, self.port), timeout)
+                try:
+                    response = await asyncio.wait_for(
+                        connection.request(method, self.host, self.port, path, headers, body), timeout)
+                except asyncio.TimeoutError:
+                    connection.close()
+                    raise
+                except CONNECTION_ERRORS:
+                    connection.close()
+                    # The server may have closed a connection that sat idle; that one is retried on a new
+                    # connection, and a write resent this way is deduplicated by its request ID
+                    if reused:
+                        continue
+                    raise
+                if connection.reusable:
+                    self.idle.append(connection)
+                else:
+                    connection.close()
+                return response
+
+    def close(self):
+        while self.idle:
+            self.idle.pop().close()
+
+
+class AsyncPrinterClient:
+    def __init__(self, nodes: Optional[Iterable[str]] = None, welcome_server_url: str = "http://127.0.0.1:5100",
+                 connections_per_node: int = 32, timeout: float = 10, max_retries: int = 5,
+                 retry_backoff: float = 0.1, refresh_interval: float = 30, max_read_lag: int = 50):
+        self.welcome_server_url = welcome_server_url  # asked for the node list when no nodes are given
+        self.connections_per_node = connections_per_node
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.refresh_interval = refresh_interval  # seconds before membership is read again
+        self.max_read_lag = max_read_lag  # most entries a node may trail the leader by and still serve reads
+        self.members = set(parse_address(node) for node in nodes or [])
+        self.leader: Optional[Address] = None
+        self.readers: List[Address] = []
+        self.refreshed_at = 0.0
+        self.client_id = str(uuid.uuid4())  # Nodes limit the write rate of each client ID
+        self._pools: Dict[Address, ConnectionPool] = {}
+        self._refresh_lock = asyncio.Lock()
+        self._next_reader = itertools.count()
+
+    async def __aenter__(self) -> "AsyncPrinterClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        for pool in self._pools.values():
+            pool.close()
+        self._pools.clear()
+
+    def _pool(self, address: Address) -> ConnectionPool:
+        pool = self._pools.get(address)
+        if pool is None:
+            pool = self._pools[address] = ConnectionPool(address[0], address[1], self.connections_per_node)
+        return pool
+
+    async def _get_json(self, address: Address, path: str, timeout: float):
+        try:
+            response = await self._pool(address).request("GET", path, {"Accept": "application/json"}, b"", timeout)
+            return response.json() if response.status_code == 200 else None
+        except CONNECTION_ERRORS:
+            return None
+
+    async def refresh(self):
+        """Ask every known node for its /status, to learn the members, the leader and which nodes may serve reads"""
+        started = time.monotonic()
+        async with self._refresh_lock:
+            if self.refreshed_at > started:
+                return  # Another call refreshed while this one waited
+            if not self.members:
+                welcome = await self._get_json(parse_address(self.welcome_server_url), "/peers", self.timeout)
+                self.members = {(peer["host"], int(peer["port"])) for peer in (welcome or {}).get("peers", [])}
+
+            statuses, pending = {}, set(self.members)
+            while pending:  # Nodes named as peers are asked too
+                results = await asyncio.gather(*(self._get_json(a, "/status", min(2.0, self.timeout)) for a in pending))
+                statuses.update((a, s) for a, s in zip(pending, results) if s is not None)
+                found = {(host, int(port)) for s in statuses.values() for host, port in s.get("peers", [])}
+                pending = found - self.members
+                self.members |= found
+
+            leaders = sorted((s.get("term", 0), a) for a, s in statuses.items() if s.get("role") == "leader")
+            hints = sorted((s.get("term", 0), (s["leader"]["host"], int(s["leader"]["port"])))
+                           for s in statuses.values() if s.get("leader"))
+            self.leader = leaders[-1][1] if leaders else hints[-1][1] if hints else None
+            leader_commit = statuses.get(self.leader, {}).get("commit_index")
+            self.readers = sorted(
+                a for a, s in statuses.items()
+                if s.get("ready") and (leader_commit is None
+                                       or leader_commit - s.get("last_applied", 0) <= self.max_read_lag))
+            self.refreshed_at = time.monotonic()
+
+    def _forget(self, address: Address):
+        if address == self.leader:
+            self.leader = None
+        if address in self.readers:
+            self.readers = [a for a in self.readers if a != address]
+
+    def _pick_reader(self) -> Optional[Address]:
+        readers = self.readers
+        return readers[next(self._next_reader) % len(readers)] if readers else self.leader
+
+    @staticmethod
+    def _leader_hint(response: HttpResponse) -> Optional[Address]:
+        hint = response.headers.get("X-Raft-Leader")
+        return parse_address(hint) if hint else None
+
+    @staticmethod
+    def _result(response: Optional[HttpResponse], error: str):
+        if response is None:
+            return {"success": False, "error": error}
+        try:
+            return response.json()
+        except ValueError:
+            return {"success": False, "error": "Invalid response from server"}
+
+    async def _call(self, method: str, path: str, data: Optional[Dict] = None):
+        """Send a write to the leader, or a read to a caught-up node, retrying writes under one request ID"""
+        write = method != "GET"
+        headers = {"X-Client-ID": self.client_id, "Accept": "application/json"}
+        body = b""
+        if data is not None:
+            body = json.dumps(data).encode()
+            headers["Content-Type"] = "application/json"
+        if write:
+            headers["X-Request-ID"] = str(uuid.uuid4())
+        if time.monotonic() - self.refreshed_at > self.refresh_interval:
+            await self.refresh()
+
+        failures = redirects = 0
+        while True:
+            address = self.leader if write else self._pick_reader()
+            response, error = None, "No leader found"
+            if address is not None:
+                try:
+                    response = await self._pool(address).request(method, path, headers, body, self.timeout)
+                except CONNECTION_ERRORS as e:
+                    error = f"Could not reach {address[0]}:{address[1]}: {e or type(e).__name__}"
+                    self._forget(address)
+
+            if response is not None and write and response.status_code == 403:
+                hint = self._leader_hint(response)
+                if hint is not None and hint != address and redirects <= len(self.members):
+                    # A follower named the leader it follows; nothing was proposed, so go there at once
+                    self.leader, redirects = hint, redirects + 1
+                    continue
+                retry, stale = True, True  # No leader known yet, an election is probably running
+            elif response is not None:
+                retry, stale = response.status_code in RETRYABLE_STATUS, False
+            else:
+                retry, stale = True, True
+            if not retry or failures >= self.max_retries:
+                return self._result(response, error)
+
+            delay = self.retry_backoff * (2 ** failures)
+            if response is not None:
+                delay = max(delay, retry_after(response))  # Overloaded leaders say when to come back
+            failures += 1
+            await asyncio.sleep(delay)
+            if stale:
+                await self.refresh()
+
+    async def get_cluster_status(self) -> Dict:
+        """Members, leader and read replicas, as just read from the nodes"""
+        await self.refresh()
+        return {
+            "success": self.leader is not None,
+            "leader": None if self.leader is None else {"host": self.leader[0], "port": self.leader[1]},
+            "readers": [{"host": host, "port": port} for host, port in self.readers],
+            "members": [{"host": host, "port": port} for host, port in sorted(self.members)]
+        }
+
+    async def add_printer(self, printer_id: str, company: str, model: str) -> Dict:
+        return await self._call("POST", "/api/v1/printers", {"id": printer_id, "company": company, "model": model})
+
+    async def list_printers(self) -> List[Dict]:
+        response = await self._call("GET", "/api/v1/printers")
+        return response if isinstance(response, list) else []
+
+    async def add_filament(self, filament_id: str, filament_type: str, color: str, weight: float) -> Dict:
+        return await self._call("POST", "/api/v1/filaments", {
+            "id": filament_id,
+            "type": filament_type.upper(),
+            "color": color,
+            "total_weight_in_grams": weight,
+            "remaining_weight_in_grams": weight
+        })
+
+    async def list_filaments(self) -> List[Dict]:
+        response = await self._call("GET", "/api/v1/filaments")
+        return response if isinstance(response, list) else []
+
+    async def submit_print_job(self, job_id: str, printer_id: str, filament_id: str, filepath: str,
+                               print_weight: Optional[float] = None, analysis_timeout: float = 120) -> Dict:
+        """Submit a print job; without a weight the leader derives it from the G-code file"""
+        data = {"id": job_id, "printer_id": printer_id, "filament_id": filament_id, "filepath": filepath}
+        if print_weight is not None:
+            data["print_weight_in_grams"] = print_weight
+        deadline = time.monotonic() + analysis_timeout
+        while True:
+            response = await self._call("POST", "/api/v1/jobs", data)
+            # Nothing was committed yet; the leader is still analyzing a file it had not seen
+            if not isinstance(response, dict) or response.get("status") != "analyzing" or time.monotonic() > deadline:
+                return response
+            await asyncio.sleep(1)
+
+    async def update_job_status(self, job_id: str, new_status: str) -> Dict:
+        return await self._call("PATCH", f"/api/v1/jobs/{job_id}/status", {"status": new_status})
+
+    async def list_jobs(self, status: Optional[str] = None) -> List[Dict]:
+        query = f"?{urlencode({'status': status})}" if status else ""
+        response = await self._call("GET", f"/api/v1/jobs{query}")
+        return response if isinstance(response, list) else []
+
+    async def get_summary(self) -> Dict:
+        return await self._call("GET", "/api/v1/summary")
+
+
+class SyncPrinterClient:
+    """AsyncPrinterClient for synchronous code: each call blocks, running on an event loop in a background thread.
+
+    Every coroutine method of AsyncPrinterClient is available under the same
+    name. ``map`` runs many calls of one method concurrently, which is how a
+    single thread keeps the leader busy with a large batch of jobs.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.client = AsyncPrinterClient(*args, **kwargs)
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def __getattr__(self, name):
+        if name == "client":
+            raise AttributeError(name)
+        attribute = getattr(self.client, name)
+        if not asyncio.iscoroutinefunction(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            return self._run(attribute(*args, **kwargs))
+        call.__doc__ = attribute.__doc__
+        return call
+
+    def map(self, method: str, calls: Iterable[Dict]) -> List:
+        """Run ``method`` once per dict of keyword arguments, all at once; results are in the same order"""
+        fn = getattr(self.client, method)
+
+        async def run_all():
+            return await asyncio.gather(*(fn(**kwargs) for kwargs in calls))
+        return self._run(run_all())
+
+    def close(self):
+        self._run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __enter__(self) -> "SyncPrinterClient":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
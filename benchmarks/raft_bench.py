@@ -0,0 +1,354 @@
+"""Multi-node benchmark for the consensus path.
+
+Starts N RaftNode + create_raft_server instances in one process, connected by
+an InMemoryNetwork instead of real sockets and peers.json, so latency, drops,
+partitions and crashes can be injected deterministically from a seed. Reports
+commit throughput, write/read latency percentiles, failover time after the
+leader is killed and catch-up time for a restarted follower.
+
+    python -m benchmarks.raft_bench --nodes 3 --writes 300 --concurrency 4 --output bench.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# Keep node logging quiet unless asked otherwise; must be set before raft modules load
+os.environ.setdefault('RAFT_LOG_LEVEL', 'ERROR')
+
+from raft.node import RaftNode
+from raft.server import create_raft_server
+from raft.transport import InMemoryNetwork
+
+
+class LocalCluster:
+    def __init__(self, size, network, base_port=7000, heartbeat_interval=0.2,
+                 election_timeout_range=(1.0, 2.0), learners=0, storage='file'):
+        self.network = network
+        self.storage = storage
+        self.host = '127.0.0.1'
+        self.ports = [base_port + i for i in range(size + learners)]
+        self.learner_ports = self.ports[size:]  # non-voting replicas, after the voters
+        self.nodes = {}
+        self.apps = {}
+        self.clients = {}
+        self.heartbeat_interval = heartbeat_interval
+        self.election_timeout_range = election_timeout_range
+
+        # Full membership is known up front, like a pre-populated peers.json
+        for port in self.ports:
+            self.network.join(self.host, port, 'learner' if port in self.learner_ports else None)
+        for port in self.ports:
+            self._start_node(port)
+
+    def _start_node(self, port):
+        peers = [[self.host, p] for p in self.ports if p != port]
+        node = RaftNode(node_id=f'node_{port}', peers=peers, host=self.host, port=port,
+                        transport=self.network.transport(self.host, port),
+                        membership=self.network.peer_table(), storage=self.storage)
+        node.heartbeat_interval = self.heartbeat_interval
+        node.election_check_interval = min(0.1, self.heartbeat_interval)
+        node.election_timeout_range = self.election_timeout_range
+        node.reset_election_timeout()
+        app = create_raft_server(node)
+        self.network.register(self.host, port, app)
+        self.nodes[port], self.apps[port], self.clients[port] = node, app, app.test_client()
+
+    def alive_ports(self):
+        return [p for p in self.ports if (self.host, p) not in self.network.down]
+
+    def leader(self):
+        leaders = [p for p in self.alive_ports() if self.nodes[p].role == 'leader']
+        return max(leaders, key=lambda p: self.nodes[p].term) if leaders else None
+
+    def wait_for_leader(self, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            port = self.leader()
+            if port is not None:
+                return port
+            time.sleep(0.01)
+        raise RuntimeError('No leader elected')
+
+    def kill(self, port):
+        """Simulate a crashed process: unreachable, and its own timers stop acting"""
+        node = self.nodes[port]
+        self.network.crash(self.host, port)
+        node.role = 'follower'  # Stops its heartbeat loop; volatile role is lost on crash
+        node.election_timeout = float('inf')
+
+    def restart(self, port):
+        self.network.recover(self.host, port)
+        self.nodes[port].reset_election_timeout()
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies):
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else None
+    }
+
+
+class Workload:
+    """Seeded mix of printer, filament and job commands, issued against the leader.
+
+    Entities only become schedulable once the command creating them committed,
+    so concurrent workers never race a job update ahead of its add_job.
+    """
+
+    def __init__(self, cluster, seed, mix):
+        self.cluster = cluster
+        self.random = random.Random(seed)
+        self.mix = mix
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.printers, self.filaments = [], []
+        self.queued, self.running = [], []
+
+    def _next_id(self, prefix):
+        self.counter += 1
+        return f'{prefix}{self.counter}'
+
+    def next_request(self):
+        """Pick the next command; falls back to add_printer until there is something to schedule"""
+        with self.lock:
+            ops = [op for op in self.mix if self._possible(op)] or ['add_printer']
+            op = self.random.choices(ops, weights=[self.mix.get(o, 1) for o in ops])[0]
+            if op == 'add_printer':
+                pid = self._next_id('p')
+                return op, pid, 'POST', '/api/v1/printers', {'id': pid, 'company': 'bench', 'model': 'm1'}
+            if op == 'add_filament':
+                fid = self._next_id('f')
+                return op, fid, 'POST', '/api/v1/filaments', {
+                    'id': fid, 'type': 'PLA', 'color': 'red',
+                    'total_weight_in_grams': 1e9, 'remaining_weight_in_grams': 1e9}
+            if op == 'add_job':
+                pid = self.printers.pop(self.random.randrange(len(self.printers)))
+                jid = self._next_id('j')
+                return op, (jid, pid), 'POST', '/api/v1/jobs', {
+                    'id': jid, 'printer_id': pid, 'filament_id': self.random.choice(self.filaments),
+                    'filepath': f'{jid}.gcode', 'print_weight_in_grams': self.random.randint(5, 50)}
+            if op == 'start_job':
+                job = self.queued.pop(0)
+                return op, job, 'PATCH', f'/api/v1/jobs/{job[0]}/status', {'status': 'Running'}
+            job = self.running.pop(0)
+            return op, job, 'PATCH', f'/api/v1/jobs/{job[0]}/status', {'status': 'Done'}
+
+    def complete(self, op, item, ok):
+        """Make whatever the command created (or freed) available to later commands"""
+        with self.lock:
+            if op == 'add_printer' and ok:
+                self.printers.append(item)
+            elif op == 'add_filament' and ok:
+                self.filaments.append(item)
+            elif op == 'add_job':
+                (self.queued if ok else self.printers).append(item if ok else item[1])
+            elif op == 'start_job':
+                (self.running if ok else self.queued).append(item)
+            elif op == 'finish_job':
+                if ok:
+                    self.printers.append(item[1])
+                else:
+                    self.running.append(item)
+
+    def _possible(self, op):
+        if op == 'add_job':
+            return bool(self.printers and self.filaments)
+        if op == 'start_job':
+            return bool(self.queued)
+        if op == 'finish_job':
+            return bool(self.running)
+        return True
+
+    def issue(self, timeout=10):
+        op, item, method, path, body = self.next_request()
+        ok = submit(self.cluster, method, path, body, timeout)
+        self.complete(op, item, ok)
+        return ok
+
+
+def submit(cluster, method, path, body, timeout=10):
+    """Send a write to whichever node is leader, retrying through elections"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        port = cluster.leader()
+        if port is not None:
+            response = cluster.clients[port].open(path, method=method, json=body,
+                                                  headers={'X-Client-ID': threading.current_thread().name})
+            if response.status_code < 300:
+                return True
+            if response.status_code in (429, 503) and 'Retry-After' in response.headers:
+                # Refused by admission control; nothing was proposed, so wait as asked and resend
+                time.sleep(min(float(response.headers['Retry-After']), max(0.0, deadline - time.time())))
+                continue
+            if response.status_code != 403:  # Anything but "not the leader" is final
+                return False
+        time.sleep(0.01)
+    return False
+
+
+def run_writes(cluster, workload, total, concurrency):
+    latencies, failures = [], [0]
+    lock = threading.Lock()
+
+    def worker(count):
+        for _ in range(count):
+            started = time.perf_counter()
+            ok = workload.issue()
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    failures[0] += 1
+
+    started = time.perf_counter()
+    per_worker = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(n,)) for n in per_worker]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    return {
+        'throughput_ops_per_s': round(len(latencies) / wall, 2) if wall else None,
+        'failures': failures[0],
+        'wall_s': round(wall, 3),
+        'latency': summarize(latencies)
+    }
+
+
+def run_reads(cluster, duration, via_client=None, ports=None):
+    """Read all three collections repeatedly, from the leader, the given ports in turn, or through PrinterClient"""
+    latencies = []
+    deadline = time.time() + duration
+    turn = 0
+    while time.time() < deadline:
+        started = time.perf_counter()
+        if via_client is not None:
+            via_client.list_printers(), via_client.list_filaments(), via_client.list_jobs()
+        else:
+            if ports:
+                port, turn = ports[turn % len(ports)], turn + 1
+            else:
+                port = cluster.leader() or cluster.alive_ports()[0]
+            client = cluster.clients[port]
+            for path in ('/api/v1/printers', '/api/v1/filaments', '/api/v1/jobs'):
+                client.get(path)
+        latencies.append(time.perf_counter() - started)
+    return {'latency': summarize(latencies)}
+
+
+def measure_failover(cluster, workload):
+    """Kill the leader and time until a new one commits a write"""
+    old_leader = cluster.wait_for_leader()
+    killed_at = time.perf_counter()
+    cluster.kill(old_leader)
+    new_leader = cluster.wait_for_leader()
+    elected = time.perf_counter() - killed_at
+    committed = workload.issue(timeout=30)
+    return {
+        'old_leader': old_leader,
+        'new_leader': new_leader,
+        'election_s': round(elected, 3),
+        'first_commit_s': round(time.perf_counter() - killed_at, 3) if committed else None
+    }
+
+
+def measure_catch_up(cluster, workload, writes, timeout=60):
+    """Stop a follower, commit more entries, restart it and time until its log matches"""
+    leader = cluster.wait_for_leader()
+    follower = next(p for p in cluster.alive_ports() if p != leader)
+    cluster.kill(follower)
+    for _ in range(writes):
+        workload.issue()
+
+    restarted_at = time.perf_counter()
+    cluster.restart(follower)
+    while time.perf_counter() - restarted_at < timeout:
+        leader = cluster.leader()
+        if leader is not None and cluster.nodes[follower].log_index >= cluster.nodes[leader].log_index:
+            return {'follower': follower, 'missing_entries': writes,
+                    'catch_up_s': round(time.perf_counter() - restarted_at, 3)}
+        time.sleep(0.01)
+    return {'follower': follower, 'missing_entries': writes, 'catch_up_s': None}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        op, weight = part.split('=')
+        mix[op.strip()] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Raft consensus path')
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--learners', type=int, default=0, help='Non-voting replicas added to the voters')
+    parser.add_argument('--writes', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--read-seconds', type=float, default=2.0)
+    parser.add_argument('--catch-up-writes', type=int, default=50)
+    parser.add_argument('--mix', type=parse_mix,
+                        default=parse_mix('add_printer=1,add_filament=0.2,add_job=3,start_job=2,finish_job=2'))
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='One-way delay added to every RPC')
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Fraction of RPCs that time out')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--client-url', help='Also read through PrinterClient against a live welcome server')
+    parser.add_argument('--storage', choices=('file', 'sqlite'), default='file', help='Storage engine of every node')
+    parser.add_argument('--skip-faults', action='store_true', help='Skip failover and catch-up phases')
+    parser.add_argument('--output', help='Write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)  # Election timeouts use the global generator
+    network = InMemoryNetwork(seed=args.seed, latency=args.latency_ms / 1000,
+                           jitter=args.jitter_ms / 1000, drop_rate=args.drop_rate)
+    workdir = tempfile.mkdtemp(prefix='raft-bench-')
+    os.chdir(workdir)  # Nodes keep state and logs relative to the working directory
+
+    cluster = LocalCluster(args.nodes, network, learners=args.learners, storage=args.storage)
+    election_started = time.perf_counter()
+    cluster.wait_for_leader()
+    results = {
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'workdir': workdir,
+        'initial_election_s': round(time.perf_counter() - election_started, 3)
+    }
+    workload = Workload(cluster, args.seed, args.mix)
+    results['writes'] = run_writes(cluster, workload, args.writes, args.concurrency)
+    results['reads'] = run_reads(cluster, args.read_seconds)
+    if cluster.learner_ports:
+        results['learner_reads'] = run_reads(cluster, args.read_seconds, ports=cluster.learner_ports)
+    if args.client_url:
+        from client import PrinterClient
+        results['client_reads'] = run_reads(cluster, args.read_seconds, PrinterClient(args.client_url))
+    if not args.skip_faults:
+        results['catch_up'] = measure_catch_up(cluster, workload, args.catch_up_writes)
+        results['failover'] = measure_failover(cluster, workload)
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,22 +1,185 @@
 import requests
+import hashlib
 import json
+import os
+import threading
+import time
+import uuid
 from typing import Dict, List, Optional
 
+# Proxy responses that mean the write may not have reached a leader (or may have
+# committed without us hearing back), so it is safe to retry with the same request ID
+RETRYABLE_STATUS = {404, 429, 502, 503, 504}
+
+class ClusterView:
+    """Local materialized view of printers, filaments and jobs.
+
+    Bootstraps from the leader's /state and then long-polls /watch for committed
+    changes, so readers are served locally and the cluster only sees traffic
+    proportional to the rate of change.
+    """
+
+    COLLECTIONS = ("printers", "filaments", "jobs")
+
+    def __init__(self, welcome_server_url: str = "http://127.0.0.1:5100", poll_timeout: float = 4):
+        self.welcome_server_url = welcome_server_url
+        self.poll_timeout = poll_timeout  # Must stay below the welcome server's proxy timeout
+        self.data = {name: {} for name in self.COLLECTIONS}
+        self.node_id = None
+        self.next_index = None
+        self.version = 0
+        self.ready = threading.Event()
+        self.changed = threading.Condition()
+        self._thread = None
+
+    def start(self) -> "ClusterView":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _bootstrap(self) -> bool:
+        response = requests.get(f"{self.welcome_server_url}/proxy/state", timeout=5)
+        if response.status_code != 200:
+            return False
+        state = response.json()
+        with self.changed:
+            for name in self.COLLECTIONS:
+                self.data[name] = state.get(name, {})
+            ledger = state.get("filament_ledger", {})
+            for filament_id, filament in self.data["filaments"].items():
+                entry = ledger.get(filament_id)
+                if entry:
+                    filament["reserved_weight"] = entry["reserved"]
+                    filament["consumed_weight"] = entry["consumed"]
+                    # Rounded like FilamentLedger.free, so it matches the free_weight later changes carry
+                    filament["free_weight"] = round(entry["total"] - entry["consumed"] - entry["reserved"], 6)
+            self.node_id = state.get("node_id")
+            self.next_index = state.get("log_index", 0)
+            self._bump()
+        self.ready.set()
+        return True
+
+    def _poll(self) -> bool:
+        """Apply one batch of changes, returning False when a resync is needed"""
+        response = requests.get(
+            f"{self.welcome_server_url}/proxy/watch",
+            params={"from_index": self.next_index, "timeout": self.poll_timeout},
+            timeout=self.poll_timeout + 5
+        )
+        if response.status_code != 200:
+            return False
+        body = response.json()
+        # Log indexes are per node, so a new leader means starting over
+        if body.get("node_id") != self.node_id:
+            return False
+        events = body.get("events", [])
+        if events:
+            with self.changed:
+                for event in events:
+                    for name, records in event.get("changes", {}).items():
+                        self.data.setdefault(name, {}).update(records)
+                self.next_index = body["next_index"]
+                self._bump()
+        return True
+
+    def _bump(self):
+        self.version += 1
+        self.changed.notify_all()
+
+    def _run(self):
+        synced = False
+        while True:
+            try:
+                if not synced:
+                    synced = self._bootstrap()
+                else:
+                    synced = self._poll()
+            except (requests.RequestException, ValueError):
+                synced = False
+            if not synced:
+                time.sleep(1)
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """Block until the view moves past version, returning the current version"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def _list(self, name: str) -> List[Dict]:
+        with self.changed:
+            return [{"id": key, **value} for key, value in self.data[name].items()]
+
+    def printers(self) -> List[Dict]:
+        return self._list("printers")
+
+    def filaments(self) -> List[Dict]:
+        return self._list("filaments")
+
+    def jobs(self) -> List[Dict]:
+        return self._list("jobs")
+
+
+def retry_after(response) -> float:
+    """Seconds a response's Retry-After header asks to wait, or 0"""
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", 0)))
+    except ValueError:
+        return 0.0
+
+
 class PrinterClient:
-    def __init__(self, welcome_server_url: str = "http://127.0.0.1:5100"):
+    def __init__(self, welcome_server_url: str = "http://127.0.0.1:5100",
+                 max_retries: int = 3, retry_backoff: float = 0.5, timeout: float = 10):
         self.welcome_server_url = welcome_server_url
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.view = None
+        self._etags = {}  # endpoint -> (ETag, body) for conditional GETs
+        self.client_id = str(uuid.uuid4())  # Nodes limit the write rate of each client ID
+
+    def enable_view(self) -> ClusterView:
+        """Serve list calls from a local view kept current by the watch API"""
+        if self.view is None:
+            self.view = ClusterView(self.welcome_server_url).start()
+        return self.view
+
+    def _view_ready(self) -> bool:
+        return self.view is not None and self.view.ready.is_set()
 
     def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict:
-        """Make a request through the welcome server"""
-        try:
-            url = f"{self.welcome_server_url}/proxy/{endpoint}"
-            if method == "GET":
-                response = requests.get(url)
-            else:
-                response = requests.request(method, url, json=data)
-            return response.json()
-        except requests.RequestException as e:
-            return {"success": False, "error": str(e)}
+        """Make a request through the welcome server, retrying writes under one request ID"""
+        url = f"{self.welcome_server_url}/proxy/{endpoint}"
+        headers = {"X-Client-ID": self.client_id}
+        if method != "GET":
+            headers["X-Request-ID"] = str(uuid.uuid4())
+
+        for attempt in range(self.max_retries + 1):
+            delay = self.retry_backoff * (2 ** attempt)
+            try:
+                if method == "GET":
+                    cached = self._etags.get(endpoint)
+                    if cached:
+                        headers["If-None-Match"] = cached[0]
+                    response = requests.get(url, headers=headers, timeout=self.timeout)
+                    if response.status_code == 304 and cached:
+                        return cached[1]
+                else:
+                    response = requests.request(method, url, json=data, headers=headers, timeout=self.timeout)
+                if response.status_code not in RETRYABLE_STATUS or attempt == self.max_retries:
+                    body = response.json()
+                    if method == "GET" and response.status_code == 200 and "ETag" in response.headers:
+                        self._etags[endpoint] = (response.headers["ETag"], body)
+                    return body
+                # An overloaded leader says when to come back (429 for this client, 503 for everyone)
+                delay = max(delay, retry_after(response))
+            except requests.RequestException as e:
+                if attempt == self.max_retries:
+                    return {"success": False, "error": str(e)}
+            except ValueError:
+                return {"success": False, "error": "Invalid response from server"}
+            time.sleep(delay)
 
     def get_cluster_status(self) -> Dict:
         """Get the status of the printer cluster"""
@@ -26,8 +189,8 @@ class PrinterClient:
         except requests.RequestException as e:
             return {"success": False, "error": str(e)}
 
-    def add_printer(self, printer_id: str, company: str, model: str) -> Dict:
-        """Add a new printer to the cluster"""
+    def add_printer(self, printer_id: str, company: str, model: str, group: Optional[str] = None) -> Dict:
+        """Add a new printer to the cluster, optionally in a given pool or site group"""
         if not all([printer_id, company, model]):
             return {"success": False, "error": "All printer fields are required"}
         
@@ -36,16 +199,20 @@ class PrinterClient:
             "company": company,
             "model": model
         }
+        if group:
+            data["group"] = group
         return self._make_request("POST", "api/v1/printers", data)
 
     def list_printers(self) -> List[Dict]:
         """Get list of all printers"""
+        if self._view_ready():
+            return self.view.printers()
         response = self._make_request("GET", "api/v1/printers")
         return response if isinstance(response, list) else []
 
     def add_filament(self, filament_id: str, filament_type: str, color: str, 
-                    weight: float) -> Dict:
-        """Add a new filament to the cluster"""
+                    weight: float, group: Optional[str] = None) -> Dict:
+        """Add a new filament to the cluster, optionally in a given pool or site group"""
         valid_types = ["PLA", "PETG", "ABS", "TPU"]
         if filament_type.upper() not in valid_types:
             return {"success": False, "error": f"Filament type must be one of: {', '.join(valid_types)}"}
@@ -60,30 +227,87 @@ class PrinterClient:
             "total_weight_in_grams": weight,
             "remaining_weight_in_grams": weight  # Set same as total weight initially
         }
+        if group:
+            data["group"] = group
         return self._make_request("POST", "api/v1/filaments", data)
 
     def list_filaments(self) -> List[Dict]:
         """Get list of all filaments"""
+        if self._view_ready():
+            return self.view.filaments()
         response = self._make_request("GET", "api/v1/filaments")
         return response if isinstance(response, list) else []
 
     def submit_print_job(self, job_id: str, printer_id: str, filament_id: str, 
-                        filepath: str, print_weight: float) -> Dict:
-        """Submit a new print job"""
-        if not all([job_id, printer_id, filament_id, filepath]) or print_weight <= 0:
+                        filepath: str, print_weight: Optional[float] = None,
+                        analysis_timeout: float = 120) -> Dict:
+        """Submit a new print job; without a weight the leader derives it from the G-code file"""
+        if not all([job_id, printer_id, filament_id, filepath]) or (print_weight is not None and print_weight <= 0):
             return {"success": False, "error": "All job fields are required and print weight must be positive"}
         
         data = {
             "id": job_id,
             "printer_id": printer_id,
             "filament_id": filament_id,
-            "filepath": filepath,
-            "print_weight_in_grams": print_weight
+            "filepath": filepath
         }
-        return self._make_request("POST", "api/v1/jobs", data)
+        if print_weight is not None:
+            data["print_weight_in_grams"] = print_weight
+        deadline = time.time() + analysis_timeout
+        while True:
+            response = self._make_request("POST", "api/v1/jobs", data)
+            # Nothing was committed yet; the leader is still analyzing a file it had not seen
+            if response.get("status") != "analyzing" or time.time() > deadline:
+                return response
+            time.sleep(1)
+
+    def upload_gcode(self, path: str, chunk_bytes: int = 4 << 20) -> Dict:
+        """Upload a local G-code file in chunks; its 'filepath' names it in submit_print_job.
+
+        A chunk that fails is resent from the offset the server reports, so an
+        interrupted upload continues instead of starting over.
+        """
+        base = f"{self.welcome_server_url}/proxy/blobs/uploads"
+        digest = hashlib.sha256()
+        try:
+            response = requests.post(base, timeout=self.timeout)
+            if response.status_code != 201:
+                return response.json()
+            url = f"{base}/{response.json()['upload_id']}"
+            size = os.path.getsize(path)
+            with open(path, "rb") as f:
+                offset = 0
+                failures = 0
+                while offset < size:
+                    f.seek(offset)
+                    chunk = f.read(chunk_bytes)
+                    try:
+                        response = requests.patch(url, data=chunk, headers={"Upload-Offset": str(offset)},
+                                                  timeout=self.timeout)
+                        if response.status_code not in (200, 409):
+                            raise requests.RequestException(f"HTTP {response.status_code}")
+                        offset = response.json()["offset"]
+                        failures = 0
+                    except requests.RequestException:
+                        failures += 1
+                        if failures > self.max_retries:
+                            raise
+                        time.sleep(self.retry_backoff * (2 ** failures))
+                        offset = requests.get(url, timeout=self.timeout).json()["offset"]
+                f.seek(0)
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            response = requests.post(f"{url}/complete", json={"sha256": digest.hexdigest()}, timeout=self.timeout)
+            return response.json()
+        except OSError as e:
+            return {"success": False, "error": str(e)}
+        except (requests.RequestException, ValueError, KeyError) as e:
+            return {"success": False, "error": f"Upload failed: {e}"}
 
     def list_jobs(self) -> List[Dict]:
         """Get list of all print jobs"""
+        if self._view_ready():
+            return self.view.jobs()
         response = self._make_request("GET", "api/v1/jobs")
         return response if isinstance(response, list) else []
 
@@ -205,7 +429,15 @@ def main():
             printer_id = input("Enter Printer ID: ")
             filament_id = input("Enter Filament ID: ")
             filepath = input("Enter G-code File Path: ")
-            print_weight = float(input("Enter Print Weight (g): "))
+            if os.path.isfile(filepath):
+                # A local file is uploaded so every node can read it; the job names it by hash
+                upload = client.upload_gcode(filepath)
+                if "filepath" not in upload:
+                    print("\nResponse:", format_response(upload))
+                    continue
+                filepath = upload["filepath"]
+            weight_text = input("Enter Print Weight (g, blank to derive it from the G-code): ").strip()
+            print_weight = float(weight_text) if weight_text else None
             
             response = client.submit_print_job(
                 job_id, printer_id, filament_id, filepath, print_weight
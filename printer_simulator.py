@@ -0,0 +1,125 @@
+"""Simulated printers that stream telemetry to the cluster.
+
+Each printer heats up, prints the queued job assigned to it (taking the
+job's estimated time divided by --speed, or --print-seconds without an
+estimate) and cools down again, sending its samples in batches through the
+welcome server. The leader turns progress into job status changes and
+reported errors into printer faults.
+
+    python printer_simulator.py --printers p1,p2 --rate 10 --speed 60
+"""
+import argparse
+import random
+import time
+
+import requests
+
+NOZZLE_TARGET = 210.0
+BED_TARGET = 60.0
+ROOM_TEMP = 22.0
+
+
+class SimulatedPrinter:
+    def __init__(self, printer_id, rng):
+        self.printer_id = printer_id
+        self.rng = rng
+        self.nozzle = ROOM_TEMP
+        self.bed = ROOM_TEMP
+        self.job_id = None
+        self.progress = 0.0
+        self.duration = None
+        self.fault_until = None
+
+    def start(self, job_id, duration):
+        self.job_id, self.duration, self.progress = job_id, duration, 0.0
+
+    def step(self, now, dt, fault_rate):
+        """Advance by dt seconds and return one sample"""
+        heating = self.job_id is not None and self.fault_until is None
+        # First-order approach to the target temperature, with sensor noise
+        for attr, target in (('nozzle', NOZZLE_TARGET), ('bed', BED_TARGET)):
+            current = getattr(self, attr)
+            goal = target if heating else ROOM_TEMP
+            setattr(self, attr, current + (goal - current) * min(1.0, dt / 8))
+        sample = {
+            'printer_id': self.printer_id,
+            't': now,
+            'nozzle_temp': round(self.nozzle + self.rng.gauss(0, 0.5), 2),
+            'bed_temp': round(self.bed + self.rng.gauss(0, 0.2), 2)
+        }
+
+        if self.fault_until is None and self.job_id is not None and self.rng.random() < fault_rate * dt:
+            self.fault_until = now + 10
+            sample['error'] = self.rng.choice(['Thermal runaway', 'Filament runout', 'Heater timeout'])
+        elif self.fault_until is not None and now >= self.fault_until:
+            self.fault_until = None
+            sample['error'] = None
+
+        if heating and self.nozzle > NOZZLE_TARGET - 5:
+            self.progress = min(100.0, self.progress + 100.0 * dt / self.duration)
+        sample['progress'] = round(self.progress, 2)
+        if self.progress >= 100.0:
+            self.job_id = None  # Report 100 until the next job starts at 0
+        return sample
+
+
+def queued_jobs(session, url):
+    try:
+        response = session.get(f'{url}/proxy/api/v1/jobs', params={'status': 'Queued'}, timeout=5)
+        return response.json() if response.status_code == 200 else []
+    except (requests.RequestException, ValueError):
+        return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream telemetry from simulated printers')
+    parser.add_argument('--url', default='http://127.0.0.1:5100', help='Welcome server')
+    parser.add_argument('--printers', required=True, help='Comma-separated printer IDs')
+    parser.add_argument('--rate', type=float, default=5.0, help='Samples per second per printer')
+    parser.add_argument('--batch-seconds', type=float, default=1.0, help='Time between batches')
+    parser.add_argument('--speed', type=float, default=60.0, help='Print this many times faster than estimated')
+    parser.add_argument('--print-seconds', type=float, default=60.0, help='Print time of jobs without an estimate')
+    parser.add_argument('--fault-rate', type=float, default=0.0, help='Faults per printer per second while printing')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    printers = {pid: SimulatedPrinter(pid, rng) for pid in args.printers.split(',') if pid}
+    session = requests.Session()
+    dt = 1.0 / args.rate
+    sent = 0
+    started = time.time()
+    clock = started
+
+    while True:
+        for job in queued_jobs(session, args.url):
+            printer = printers.get(job.get('printer_id'))
+            if printer is not None and printer.job_id is None:
+                estimate = job.get('estimated_seconds')
+                printer.start(job['id'], estimate / args.speed if estimate else args.print_seconds)
+
+        samples = []
+        deadline = clock + args.batch_seconds
+        while clock < deadline:
+            clock += dt
+            samples.extend(printer.step(clock, dt, args.fault_rate) for printer in printers.values())
+        try:
+            response = session.post(f'{args.url}/proxy/api/v1/telemetry', json={'samples': samples}, timeout=5)
+            if response.status_code == 200:
+                sent += response.json().get('accepted', 0)
+            else:
+                print(f'⚠️ Batch refused: {response.status_code} {response.text[:200]}')
+        except requests.RequestException as e:
+            print(f'⚠️ Batch failed: {e}')
+
+        elapsed = time.time() - started
+        print(f'\r📡 {sent} samples in {elapsed:.0f}s '
+              + ' '.join(f'{p.printer_id}:{p.progress:.0f}%' for p in printers.values()), end='', flush=True)
+        time.sleep(max(0.0, clock - time.time()))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print()
@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ProposalQueue:
+    """Bounds how many writes the leader replicates at once, and how many wait for a turn.
+
+    ``acquire`` returns True once the caller may propose. It returns False
+    at once when ``max_waiting`` callers are already queued, or after
+    ``wait_timeout`` seconds in the queue, so an overloaded leader refuses
+    work quickly instead of letting every request run into a timeout.
+    """
+
+    def __init__(self, max_in_flight=16, max_waiting=64, wait_timeout=1.0):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+
+    def acquire(self):
+        with self.cond:
+            if self.in_flight < self.max_in_flight and not self.waiting:
+                self.in_flight += 1
+                return True
+            if self.waiting >= self.max_waiting:
+                return False
+            self.waiting += 1
+            try:
+                deadline = time.monotonic() + self.wait_timeout
+                while self.in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self.cond.wait(remaining)
+                self.in_flight += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify()
+
+
+class ClientRateLimiter:
+    """A token bucket per client: ``rate`` requests per second on average, bursts of up to ``burst``.
+
+    Only the ``max_clients`` most recently seen clients are remembered, so
+    memory stays bounded; a forgotten client starts again with a full bucket.
+    A rate of None turns limiting off.
+    """
+
+    def __init__(self, rate=100.0, burst=200, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()  # client -> (tokens, last refill), least recently seen first
+
+    def take(self, client):
+        """Spend a token; returns 0 if the request may go ahead, else seconds until one is available"""
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated = self.buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            self.buckets[client] = (tokens, now)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+            return wait
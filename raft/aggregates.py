@@ -0,0 +1,202 @@
+import heapq
+from bisect import bisect_left, insort
+from collections import Counter, deque
+
+DEFAULT_LOW_STOCK_GRAMS = 100  # free grams below which a filament counts as low on stock
+
+
+def _usage():
+    return {'busy_seconds': 0.0, 'jobs_done': 0, 'running': {}}
+
+
+class Aggregates:
+    """Dashboard counters kept up to date as the state machine applies commands.
+
+    Before and after each command the records it touches are captured; the
+    contribution of the old records is subtracted and that of the new ones
+    added, so no query has to scan the printer, filament or job tables.
+    Free filament is also kept in order, which answers "which spools have
+    less than N grams" for any N without visiting the others.
+    """
+
+    def __init__(self, recent=10):
+        self.jobs_by_status = Counter()
+        self.printers_by_status = Counter()
+        self.faulted = set()
+        self.usage = {}  # printer ID -> busy seconds and jobs done so far, running job -> started at
+        self.stock = {}  # (type, color) -> spools, remaining, reserved and free grams
+        self.free = {}  # filament ID -> free grams, as stored in by_free
+        self.by_free = []  # (free grams, filament ID), ascending
+        self.recent = deque(maxlen=recent)  # IDs of the newest jobs, oldest first
+
+    @staticmethod
+    def capture(state, printer_ids=(), filament_ids=(), job_ids=()):
+        """Copies of the records a command may change, to diff against after applying it"""
+        printers = {pid: dict(state.printers[pid]) for pid in printer_ids if pid in state.printers}
+        filaments = {
+            fid: {**state.filaments[fid], **state.filament_ledger.view(fid)}
+            for fid in filament_ids if fid in state.filaments
+        }
+        jobs = {jid: dict(state.jobs[jid]) for jid in job_ids if jid in state.jobs}
+        return printers, filaments, jobs
+
+    def update(self, before, after):
+        self._count(before, -1)
+        self._count(after, 1)
+        self.recent.extend(jid for jid in after[2] if jid not in before[2])
+
+    def rebuild(self, state):
+        self.__init__(self.recent.maxlen)
+        self._count(self.capture(state, state.printers, state.filaments, state.jobs), 1)
+        # Jobs created at the same time keep the order they were added in
+        newest = heapq.nlargest(self.recent.maxlen, enumerate(state.jobs.items()),
+                                key=lambda item: (item[1][1].get('created_at') or 0, item[0]))
+        self.recent.extend(jid for _, (jid, _) in reversed(newest))
+
+    def _count(self, captured, sign):
+        printers, filaments, jobs = captured
+        for printer_id, printer in printers.items():
+            self.printers_by_status[printer.get('status')] += sign
+            if printer.get('fault') and sign > 0:
+                self.faulted.add(printer_id)
+            else:
+                self.faulted.discard(printer_id)
+            self.usage.setdefault(printer_id, _usage())
+
+        for filament_id, filament in filaments.items():
+            stock = self.stock.setdefault((filament.get('type'), filament.get('color')), {
+                'spools': 0, 'remaining_weight': 0, 'reserved_weight': 0, 'free_weight': 0
+            })
+            stock['spools'] += sign
+            stock['remaining_weight'] += sign * (filament.get('remaining_weight') or 0)
+            stock['reserved_weight'] += sign * filament.get('reserved_weight', 0)
+            stock['free_weight'] += sign * filament.get('free_weight', 0)
+            if filament_id in self.free:
+                del self.by_free[bisect_left(self.by_free, (self.free.pop(filament_id), filament_id))]
+            if sign > 0:
+                self.free[filament_id] = filament.get('free_weight', 0)
+                insort(self.by_free, (self.free[filament_id], filament_id))
+
+        for job_id, job in jobs.items():
+            self.jobs_by_status[job.get('status')] += sign
+            usage = self.usage.setdefault(job.get('printer_id'), _usage())
+            started_at = job.get('started_at')
+            if job.get('status') == 'Running' and sign > 0:
+                usage['running'][job_id] = started_at
+            else:
+                usage['running'].pop(job_id, None)
+            if job.get('status') in ('Done', 'Cancelled') and started_at and job.get('completed_at'):
+                usage['busy_seconds'] += sign * (job['completed_at'] - started_at)
+            if job.get('status') == 'Done':
+                usage['jobs_done'] += sign
+
+    def low_stock(self, grams, limit=None):
+        """Filament IDs with fewer than ``grams`` free, emptiest first"""
+        end = bisect_left(self.by_free, (grams,))
+        return [fid for _, fid in self.by_free[:end if limit is None else min(end, limit)]]
+
+    def low_stock_count(self, grams):
+        return bisect_left(self.by_free, (grams,))
+
+    def busiest_printers(self, printers, limit):
+        """Printers with the most finished print time, with what they are printing now"""
+        busiest = heapq.nlargest(limit, ((usage['busy_seconds'], pid) for pid, usage in list(self.usage.items())
+                                         if pid in printers))
+        result = []
+        for busy_seconds, printer_id in busiest:
+            running = self.usage[printer_id]['running']
+            current = min(running, key=lambda jid: running[jid] or 0) if running else None
+            result.append({
+                'id': printer_id,
+                'status': printers[printer_id].get('status'),
+                'fault': printers[printer_id].get('fault'),
+                'added_at': printers[printer_id].get('added_at'),
+                'busy_seconds': round(busy_seconds, 1),
+                'jobs_done': self.usage[printer_id]['jobs_done'],
+                'running_job': current,
+                'running_since': running.get(current)
+            })
+        return result
+
+    def summary(self, state, low_stock_grams=DEFAULT_LOW_STOCK_GRAMS, limit=5):
+        """Counts, stock and the top few printers, jobs and low filaments, in a body of bounded size"""
+        # Built while entries are being applied, so collections are copied before iterating
+        printers_by_status = {status: n for status, n in list(self.printers_by_status.items()) if n}
+        jobs_by_status = {status: n for status, n in list(self.jobs_by_status.items()) if n}
+        printers = sum(printers_by_status.values())
+        busy = printers_by_status.get('Busy', 0)
+        return {
+            'jobs': {
+                'total': sum(jobs_by_status.values()),
+                'active': jobs_by_status.get('Queued', 0) + jobs_by_status.get('Running', 0),
+                'by_status': jobs_by_status
+            },
+            'printers': {
+                'total': printers,
+                'by_status': printers_by_status,
+                'faulted': len(self.faulted),
+                'utilization': round(busy / printers, 4) if printers else 0.0,
+                'busiest': self.busiest_printers(state.printers, limit)
+            },
+            'filaments': {
+                'total': len(self.free),
+                'low_stock_grams': low_stock_grams,
+                'low_stock': self.low_stock_count(low_stock_grams),
+                'lowest': [
+                    {'id': fid, 'type': state.filaments[fid].get('type'), 'color': state.filaments[fid].get('color'),
+                     'free_weight': self.free.get(fid)}
+                    for fid in self.low_stock(low_stock_grams, limit)
+                ],
+                'stock': [
+                    {'type': filament_type, 'color': color, **{k: round(v, 3) for k, v in stock.items()},
+                     'low': stock['free_weight'] < low_stock_grams}
+                    for (filament_type, color), stock in sorted(list(self.stock.items()), key=lambda item: str(item[0]))
+                    if stock['spools']
+                ]
+            },
+            'recent_jobs': [
+                {'id': jid, **state.jobs[jid]} for jid in list(self.recent)[::-1] if jid in state.jobs
+            ][:limit]
+        }
+
+
+def merge_summaries(summaries, limit=5):
+    """Combine the summaries of several Raft groups into one of the same shape"""
+    merged = {
+        'jobs': {'total': 0, 'active': 0, 'by_status': Counter()},
+        'printers': {'total': 0, 'by_status': Counter(), 'faulted': 0, 'utilization': 0.0, 'busiest': []},
+        'filaments': {'total': 0, 'low_stock_grams': None, 'low_stock': 0, 'lowest': [], 'stock': []},
+        'recent_jobs': []
+    }
+    stock = {}
+    for summary in summaries:
+        for section in ('jobs', 'printers', 'filaments'):
+            for key in ('total', 'active', 'faulted', 'low_stock'):
+                if key in summary[section]:
+                    merged[section][key] += summary[section][key]
+        merged['jobs']['by_status'].update(summary['jobs']['by_status'])
+        merged['printers']['by_status'].update(summary['printers']['by_status'])
+        merged['printers']['busiest'].extend(summary['printers']['busiest'])
+        merged['filaments']['low_stock_grams'] = summary['filaments']['low_stock_grams']
+        merged['filaments']['lowest'].extend(summary['filaments']['lowest'])
+        merged['recent_jobs'].extend(summary['recent_jobs'])
+        for row in summary['filaments']['stock']:
+            total = stock.setdefault((row['type'], row['color']), dict(row, spools=0, remaining_weight=0,
+                                                                        reserved_weight=0, free_weight=0))
+            for key in ('spools', 'remaining_weight', 'reserved_weight', 'free_weight'):
+                total[key] += row[key]
+
+    printers = merged['printers']
+    printers['by_status'] = dict(printers['by_status'])
+    printers['utilization'] = round(printers['by_status'].get('Busy', 0) / printers['total'], 4) if printers['total'] else 0.0
+    printers['busiest'] = heapq.nlargest(limit, printers['busiest'], key=lambda p: p['busy_seconds'])
+    merged['jobs']['by_status'] = dict(merged['jobs']['by_status'])
+    filaments = merged['filaments']
+    filaments['lowest'] = heapq.nsmallest(limit, filaments['lowest'], key=lambda f: f['free_weight'] or 0)
+    threshold = filaments['low_stock_grams']
+    filaments['stock'] = [
+        dict(row, low=threshold is not None and row['free_weight'] < threshold)
+        for _, row in sorted(stock.items(), key=lambda item: str(item[0]))
+    ]
+    merged['recent_jobs'] = heapq.nlargest(limit, merged['recent_jobs'], key=lambda j: j.get('created_at') or 0)
+    return merged
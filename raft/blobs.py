@@ -0,0 +1,222 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from queue import Queue
+
+from raft.storage import _fsync_dir
+
+BLOB_PREFIX = 'blob:'  # job filepaths of this form name a blob by its SHA-256
+DIGEST = re.compile(r'^[0-9a-f]{64}$')
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+def blob_digest(filepath):
+    """SHA-256 named by a 'blob:<sha256>' job filepath, or None for a plain path"""
+    if filepath and filepath.startswith(BLOB_PREFIX):
+        digest = filepath[len(BLOB_PREFIX):].lower()
+        if DIGEST.match(digest):
+            return digest
+    return None
+
+
+class BlobStore:
+    """Files addressed by the SHA-256 of their content, kept outside the Raft log.
+
+    Uploads are appended to a staging file in chunks at an explicit offset,
+    so an interrupted upload resumes from the size already received. A blob
+    only appears under its digest once its content was hashed and matched,
+    and is never modified after that.
+    """
+
+    _open = {}  # root -> store, shared by the servers of every Raft group in a process
+    _open_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, root):
+        with cls._open_lock:
+            if root not in cls._open:
+                cls._open[root] = cls(root)
+            return cls._open[root]
+
+    def __init__(self, root):
+        self.root = root
+        self.uploads = os.path.join(root, 'uploads')
+        os.makedirs(self.uploads, exist_ok=True)
+        self.lock = threading.Lock()
+        self.fetching = set()  # digests being copied from a peer
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def size(self, digest):
+        return os.path.getsize(self.path(digest))
+
+    def _upload_path(self, upload_id):
+        if not re.match(r'^[0-9a-z]+$', upload_id):
+            raise KeyError(upload_id)
+        return os.path.join(self.uploads, upload_id)
+
+    def create_upload(self, upload_id=None):
+        upload_id = upload_id or uuid.uuid4().hex
+        open(self._upload_path(upload_id), 'ab').close()
+        return upload_id
+
+    def upload_offset(self, upload_id):
+        """Bytes received so far, or None for an unknown upload"""
+        try:
+            return os.path.getsize(self._upload_path(upload_id))
+        except (OSError, KeyError):
+            return None
+
+    def append(self, upload_id, offset, data):
+        """Append data at offset; returns (accepted, offset after the call)"""
+        path = self._upload_path(upload_id)
+        with self.lock:
+            current = os.path.getsize(path)
+            if offset != current:
+                return False, current
+            with open(path, 'ab') as f:
+                f.write(data)
+            return True, current + len(data)
+
+    def complete(self, upload_id, expected=None):
+        """Hash a finished upload and move it under its digest; returns (digest, size).
+
+        Raises ValueError if the content does not match the expected digest.
+        """
+        path = self._upload_path(upload_id)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+            os.fsync(f.fileno())
+        digest = digest.hexdigest()
+        if expected is not None and digest != expected:
+            raise ValueError(f'Content hashes to {digest}, not {expected}')
+        size = os.path.getsize(path)
+        final = self.path(digest)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.replace(path, final)
+        _fsync_dir(final)
+        return digest, size
+
+    def discard(self, upload_id):
+        try:
+            os.remove(self._upload_path(upload_id))
+        except (OSError, KeyError):
+            pass
+
+
+class BlobReplicator:
+    """Copies blobs that committed jobs reference from peers, outside the consensus path.
+
+    Follows the node's change feed, and for every job whose filepath names a
+    blob this node lacks, fetches it from a peer in ranged chunks. A fetch
+    resumes from the bytes already received and is verified by its digest.
+    """
+
+    def __init__(self, raft_node, store, chunk_bytes=4 << 20, missing_ttl=30):
+        self.raft_node = raft_node
+        self.store = store
+        self.chunk_bytes = chunk_bytes
+        self.missing_ttl = missing_ttl  # seconds before a blob no peer had is looked for again
+        self.missing = {}  # digest -> time a fetch last found no copy
+        self.queue = Queue()
+        self.log = raft_node.log
+
+    def start(self):
+        name = self.raft_node.log_name
+        threading.Thread(target=self._follow_changes, name=f'{name}-blob-changes', daemon=True).start()
+        threading.Thread(target=self._run_fetches, name=f'{name}-blob-fetches', daemon=True).start()
+        return self
+
+    def request(self, digest):
+        """Fetch a blob in the background unless it is here or on its way; False if no peer had it lately"""
+        with self.store.lock:
+            if digest in self.store.fetching or self.store.has(digest):
+                return True
+            if time.time() - self.missing.get(digest, 0) < self.missing_ttl:
+                return False
+            self.store.fetching.add(digest)
+        self.queue.put(digest)
+        return True
+
+    def _want_jobs(self, jobs):
+        for job in jobs:
+            digest = blob_digest(job.get('filepath'))
+            if digest is not None and not self.store.has(digest):
+                self.request(digest)
+
+    def _follow_changes(self):
+        self.raft_node.ready.wait()
+        next_index = None
+        while True:
+            if next_index is None:
+                next_index = self.raft_node.commit_index
+                self._want_jobs(list(self.raft_node.jobs.values()))
+            events = self.raft_node.wait_for_changes(next_index, timeout=15)
+            if events is None:
+                next_index = None  # State was replaced; rescan every job
+                continue
+            for event in events:
+                if event['op'] == 'add_job':
+                    self._want_jobs(event['changes'].get('jobs', {}).values())
+            if events:
+                next_index = events[-1]['index'] + 1
+
+    def _run_fetches(self):
+        while True:
+            digest = self.queue.get()
+            try:
+                for peer_host, peer_port in self.raft_node._get_alive_peers():
+                    if self._fetch_from(digest, peer_host, peer_port):
+                        self.log.info(f"📦 Fetched blob {digest[:12]} from {peer_host}:{peer_port}",
+                                      event='blob_fetched', digest=digest)
+                        break
+                else:
+                    self.missing[digest] = time.time()
+                    self.log.warning(f"⚠️ No peer could provide blob {digest[:12]}", event='blob_fetch_failed')
+            finally:
+                with self.store.lock:
+                    self.store.fetching.discard(digest)
+
+    def _fetch_from(self, digest, peer_host, peer_port):
+        """Copy a blob from one peer a range at a time; False if it does not have it"""
+        upload_id = f'fetch{digest}'
+        offset = self.store.upload_offset(upload_id)
+        if offset is None:
+            self.store.create_upload(upload_id)
+            offset = 0
+        while True:
+            try:
+                response = self.raft_node._peer_request(
+                    'GET', peer_host, peer_port, f'/blobs/{digest}', 'blob',
+                    headers={'Range': f'bytes={offset}-{offset + self.chunk_bytes - 1}'}, timeout=10)
+            except Exception:
+                return False
+            if response.status_code == 416:
+                break  # Everything was already received
+            if response.status_code not in (200, 206):
+                return False
+            if response.status_code == 200:
+                # The peer ignored the range and sent the whole blob
+                self.store.discard(upload_id)
+                self.store.create_upload(upload_id)
+                offset = 0
+            self.store.append(upload_id, offset, response.content)
+            offset += len(response.content)
+            match = CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+            if response.status_code == 200 or not match or offset >= int(match.group(3)):
+                break
+        try:
+            self.store.complete(upload_id, digest)
+            return True
+        except ValueError:
+            self.store.discard(upload_id)
+            return False
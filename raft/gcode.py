@@ -0,0 +1,252 @@
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+# Grams per cubic centimetre of each filament type the cluster accepts
+FILAMENT_DENSITY = {'PLA': 1.24, 'PETG': 1.27, 'ABS': 1.04, 'TPU': 1.21}
+FILAMENT_DIAMETER_MM = 1.75
+DEFAULT_FEED_RATE = 1500.0  # mm/min assumed until a file sets F
+
+# Moves, position resets and mode changes, with their words up to any comment
+LINE = re.compile(rb'^[ \t]*(G0?[01](?![\d.])|G92|G9[01]|M8[23])([^;\n]*)', re.M)
+AXES = b'XYZEF'
+WORDS = [re.compile(axis + rb'\s*(-?\d*\.?\d*)') for axis in (b'X', b'Y', b'Z', b'E', b'F')]
+MOVES = (b'G0', b'G1', b'G00', b'G01')
+
+
+def _to_floats(values):
+    try:
+        return np.array(values).astype(float)
+    except ValueError:
+        # A letter without a number somewhere in the chunk; parse one by one
+        return np.array([_to_float(v) for v in values])
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+
+def _parse(text):
+    """Command and X, Y, Z, E, F columns (NaN where a word is absent) of every relevant line in text"""
+    matches = LINE.findall(text)
+    if not matches:
+        return None, None
+    commands, words = zip(*matches)
+    # All words in one buffer: each letter found in it belongs to the line whose span holds it
+    blob = b'\n'.join(words)
+    lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words)) + 1
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    data = np.frombuffer(blob, dtype=np.uint8)
+    columns = np.full((len(words), 5), np.nan)
+    for i, axis in enumerate(AXES):
+        at = np.flatnonzero(data == axis)
+        if len(at):
+            columns[np.searchsorted(starts, at, side='right') - 1, i] = _to_floats(WORDS[i].findall(blob))
+    return np.array(commands), columns
+
+
+def _forward_fill(values, start):
+    """Replace NaNs with the last value before them, or start for leading ones"""
+    index = np.where(np.isnan(values), -1, np.arange(len(values)))
+    np.maximum.accumulate(index, out=index)
+    return np.where(index >= 0, values[index], start)
+
+
+class _Analysis:
+    """Running totals over a G-code file, updated a chunk of parsed lines at a time"""
+
+    def __init__(self):
+        self.position = np.zeros(4)  # X, Y, Z, E carried between chunks
+        self.feed_rate = DEFAULT_FEED_RATE
+        self.relative_xyz = 0.0  # G91, also taken by E
+        self.relative_e = 0.0  # M83
+        self.filament_mm = 0.0
+        self.seconds = 0.0
+        self.layers = set()
+        self.moves = 0
+
+    def apply(self, commands, columns):
+        n = len(commands)
+        rows = np.arange(n)
+        resets = commands == b'G92'
+        moves = np.isin(commands, MOVES)
+
+        # Positioning mode in effect at each row, carried from the last G90/G91/M82/M83
+        xyz_mode = np.select([commands == b'G90', commands == b'G91'], [0.0, 1.0], np.nan)
+        e_mode = np.select([commands == b'M82', commands == b'M83'], [0.0, 1.0], xyz_mode)
+        relative_xyz = _forward_fill(xyz_mode, self.relative_xyz) == 1
+        relative_e = _forward_fill(e_mode, self.relative_e) == 1
+
+        positions = np.empty((n, 4))
+        deltas = np.empty((n, 4))
+        for axis in range(4):
+            values = columns[:, axis]
+            given = ~np.isnan(values)
+            relative = relative_e if axis == 3 else relative_xyz
+            # Absolute coordinates and G92 set the position; relative moves add to it
+            anchor = given & (resets | ~relative)
+            steps = np.cumsum(np.where(given & ~anchor, values, 0.0))
+            last_anchor = np.where(anchor, rows, -1)
+            np.maximum.accumulate(last_anchor, out=last_anchor)
+            base = np.where(last_anchor >= 0, values[last_anchor] - steps[last_anchor], self.position[axis])
+            positions[:, axis] = base + steps
+            deltas[:, axis] = np.diff(positions[:, axis], prepend=self.position[axis])
+        deltas[resets] = 0.0
+
+        feed = _forward_fill(columns[:, 4], self.feed_rate)
+        travel = np.sqrt((deltas[:, :3] ** 2).sum(axis=1))
+        extruded = deltas[:, 3]
+        # Moves without travel (retractions) take as long as the filament takes to move
+        length = np.where(travel > 0, travel, np.abs(extruded))
+        self.seconds += float((length / np.maximum(feed, 1e-6) * 60).sum())
+        self.filament_mm += float(extruded.sum())
+        printing = moves & (extruded > 0) & (travel > 0)
+        self.layers.update(np.round(positions[printing, 2], 3).tolist())
+        self.moves += int(moves.sum())
+
+        self.position = positions[-1]
+        self.feed_rate = float(feed[-1])
+        self.relative_xyz = float(relative_xyz[-1])
+        self.relative_e = float(relative_e[-1])
+
+
+def hash_file(path, chunk_bytes=8 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def analyze_file(path, chunk_bytes=8 << 20):
+    """Read a G-code file once, a chunk at a time, returning its content hash, filament use and print time.
+
+    Only G0/G1 moves, G90/G91, M82/M83 and G92 are interpreted. Time is
+    distance over feed rate with no acceleration, so it is a lower bound.
+    """
+    digest = hashlib.sha256()
+    analysis = _Analysis()
+    size = 0
+    tail = b''
+
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            digest.update(chunk)
+            size += len(chunk)
+            # Parse whole lines only; a line cut by the chunk boundary waits for the next chunk
+            text = tail + chunk
+            cut = text.rfind(b'\n') + 1 if chunk else len(text)
+            text, tail = text[:cut], text[cut:]
+            commands, columns = _parse(text.upper())
+            if commands is not None:
+                analysis.apply(commands, columns)
+            if not chunk:
+                break
+
+    filament_mm = max(0.0, analysis.filament_mm)
+    volume_cm3 = filament_mm * np.pi * (FILAMENT_DIAMETER_MM / 2) ** 2 / 1000
+    return {
+        'sha256': digest.hexdigest(),
+        'bytes': size,
+        'moves': analysis.moves,
+        'filament_mm': round(filament_mm, 2),
+        'grams_by_type': {t: round(volume_cm3 * d, 2) for t, d in FILAMENT_DENSITY.items()},
+        'estimated_seconds': round(analysis.seconds, 1),
+        'layers': len(analysis.layers)
+    }
+
+
+class GcodeAnalyzer:
+    """Analyzes G-code files in worker processes and caches results by content hash.
+
+    ``lookup`` never blocks: it returns a cached result or starts an analysis
+    and returns None. A file is hashed first, which is much cheaper than
+    parsing it, and only parsed if no file with the same content was; it is
+    not read again until its size or modification time changes.
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self.pool = None
+        self.lock = threading.Lock()
+        self.by_content = {}  # sha256 -> analysis
+        self.by_stat = {}  # (path, size, mtime) -> sha256
+        self.pending = {}  # (path, size, mtime) -> Future of the analysis
+
+    def _stat_key(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    def _submit(self, fn, *args):
+        with self.lock:
+            if self.pool is None:
+                # Spawned workers do not inherit the server's threads and locks
+                self.pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self.pool.submit(fn, *args)
+
+    def lookup(self, path, on_done=None):
+        """Cached analysis of path, or None while it is analyzed (on_done(result) is called then).
+
+        Returns False if the file does not exist.
+        """
+        key = self._stat_key(path)
+        if key is None:
+            return False
+        with self.lock:
+            digest = self.by_stat.get(key)
+            if digest is not None:
+                return self.by_content[digest]
+            future = self.pending.get(key)
+            started = future is None
+            if started:
+                future = self.pending[key] = Future()
+        if started:
+            # Outside the lock: a callback added to a finished future runs right away and takes it
+            self._submit(hash_file, key[0]).add_done_callback(lambda f: self._hashed(key, future, f))
+        if on_done is not None:
+            future.add_done_callback(lambda f: f.exception() is None and on_done(f.result()))
+        return None
+
+    def _hashed(self, key, future, hashed):
+        if hashed.exception() is not None:
+            return self._finish(key, future, hashed)
+        with self.lock:
+            cached = self.by_content.get(hashed.result())
+        if cached is not None:
+            return self._finish(key, future, hashed, cached)
+        self._submit(analyze_file, key[0]).add_done_callback(lambda f: self._finish(key, future, f))
+
+    def _finish(self, key, future, done, result=None):
+        with self.lock:
+            self.pending.pop(key, None)
+            if done.exception() is None:
+                result = result or done.result()
+                result = self.by_content.setdefault(result['sha256'], result)
+                self.by_stat[key] = result['sha256']
+        if done.exception() is not None:
+            future.set_exception(done.exception())
+        else:
+            future.set_result(result)
+
+    def wait(self, path, timeout=None):
+        """Analysis of path, blocking until it is done; None if the file does not exist"""
+        result = self.lookup(path)
+        if result is None:
+            with self.lock:
+                future = self.pending.get(self._stat_key(path))
+            if future is not None:
+                future.result(timeout)
+            result = self.lookup(path)
+        return result or None
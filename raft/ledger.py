@@ -0,0 +1,89 @@
+ACTIVE_JOB_STATUSES = ('Queued', 'Running')
+
+# Gram amounts are rounded to this many decimals after every change. Otherwise
+# float error would build up, and reserving then releasing a weight would not
+# bring a filament back to the exact amount it started with.
+WEIGHT_DECIMALS = 6
+
+
+def _grams(weight):
+    return round(weight, WEIGHT_DECIMALS)
+
+
+class FilamentLedger:
+    """Per-filament reservation ledger maintained by the replicated state machine.
+
+    Every filament tracks how many grams are reserved by active (Queued/Running)
+    jobs and how many grams have been consumed by finished jobs, so admission
+    can check free weight without scanning the job table.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries if entries is not None else {}
+
+    @classmethod
+    def from_state(cls, filaments, jobs):
+        """Rebuild the ledger from filaments and jobs (used for older state files)"""
+        ledger = cls()
+        for filament_id, filament in filaments.items():
+            ledger.add_filament(filament_id, filament.get('total_weight'), filament.get('remaining_weight'))
+        for job in jobs.values():
+            if job.get('status') in ACTIVE_JOB_STATUSES:
+                ledger.reserve(job.get('filament_id'), job.get('print_weight_in_grams'))
+        return ledger
+
+    def add_filament(self, filament_id, total_weight, remaining_weight):
+        total_weight = total_weight or 0
+        remaining_weight = min(remaining_weight or 0, total_weight)
+        self.entries[filament_id] = {
+            'total': total_weight,
+            'reserved': 0,
+            'consumed': _grams(total_weight - remaining_weight)
+        }
+
+    def free(self, filament_id):
+        """Grams that are neither consumed nor reserved by an active job"""
+        entry = self.entries.get(filament_id)
+        if entry is None:
+            return 0
+        return _grams(entry['total'] - entry['consumed'] - entry['reserved'])
+
+    def remaining(self, filament_id):
+        entry = self.entries[filament_id]
+        return max(0, _grams(entry['total'] - entry['consumed']))
+
+    def can_reserve(self, filament_id, weight):
+        return filament_id in self.entries and weight <= self.free(filament_id)
+
+    def reserve(self, filament_id, weight):
+        if filament_id in self.entries:
+            entry = self.entries[filament_id]
+            entry['reserved'] = _grams(entry['reserved'] + (weight or 0))
+
+    def release(self, filament_id, weight):
+        """Drop a reservation without consuming it (job cancelled)"""
+        if filament_id in self.entries:
+            entry = self.entries[filament_id]
+            entry['reserved'] = max(0, _grams(entry['reserved'] - (weight or 0)))
+
+    def consume(self, filament_id, weight):
+        """Turn a reservation into consumed weight (job done)"""
+        if filament_id in self.entries:
+            entry = self.entries[filament_id]
+            weight = weight or 0
+            entry['reserved'] = max(0, _grams(entry['reserved'] - weight))
+            entry['consumed'] = min(entry['total'], _grams(entry['consumed'] + weight))
+
+    def view(self, filament_id):
+        """Reserved/consumed/free grams as exposed by the filaments API"""
+        entry = self.entries.get(filament_id)
+        if entry is None:
+            return {}
+        return {
+            'reserved_weight': entry['reserved'],
+            'consumed_weight': entry['consumed'],
+            'free_weight': self.free(filament_id)
+        }
+
+    def to_dict(self):
+        return self.entries
@@ -0,0 +1,139 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Configured from the environment so every process (node, bench, tools) logs the same way
+LOG_LEVEL = os.environ.get('RAFT_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('RAFT_LOG_FORMAT', 'text')  # 'text' or 'json'
+
+# Events that repeat on every heartbeat or RPC: at most `count` records per `window` seconds
+DEFAULT_RATE_LIMITS = {
+    'heartbeat_sent': (1, 30),
+    'heartbeat_received': (1, 30),
+    'heartbeat_failed': (5, 10),
+    'state_saved': (1, 10),
+    'peers_updated': (1, 60),
+    'peers_read_failed': (5, 30),
+    'replicate_failed': (5, 10),
+    'leader_synced': (1, 30),
+    'leader_sync_failed': (5, 30),
+}
+
+_RESERVED_KWARGS = ('exc_info', 'stack_info', 'stacklevel', 'extra')
+_setup_lock = threading.Lock()
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the node, event name and structured fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'node': getattr(record, 'node_id', None),
+            'event': getattr(record, 'event', None),
+            'msg': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The familiar `[node_id] message` console format"""
+
+    def format(self, record):
+        line = f"[{getattr(record, 'node_id', '-')}] {record.getMessage()}"
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            line += f" (+{suppressed} similar suppressed)"
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class RateLimitFilter(logging.Filter):
+    """Drop repetitive events beyond a per-window budget, reporting how many were dropped"""
+
+    def __init__(self, limits=None):
+        super().__init__()
+        self.limits = dict(DEFAULT_RATE_LIMITS if limits is None else limits)
+        self.windows = {}  # (node, event) -> [window start, emitted, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        limit = self.limits.get(event)
+        if limit is None:
+            return True
+        count, window = limit
+        key = (getattr(record, 'node_id', None), event)
+        now = time.monotonic()
+        with self.lock:
+            state = self.windows.get(key)
+            if state is None or now - state[0] >= window:
+                suppressed = state[2] if state else 0
+                self.windows[key] = [now, 1, 0]
+                record.suppressed = suppressed
+                return True
+            if state[1] < count:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class NodeLogger(logging.LoggerAdapter):
+    """Adapter that tags records with the node ID and turns keyword arguments into fields.
+
+    ``log.info('Voted', event='vote_granted', candidate=cid)`` produces a record with
+    ``event='vote_granted'`` and ``fields={'candidate': cid}``.
+    """
+
+    def process(self, msg, kwargs):
+        fields = {k: kwargs.pop(k) for k in list(kwargs) if k not in _RESERVED_KWARGS}
+        extra = dict(kwargs.get('extra') or {})
+        extra['node_id'] = self.extra['node_id']
+        extra['event'] = fields.pop('event', None)
+        extra['fields'] = fields
+        kwargs['extra'] = extra
+        return msg, kwargs
+
+
+def _configure():
+    """Route the 'raft' logger through a queue so callers never block on stdout"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(RateLimitFilter())
+
+        root = logging.getLogger('raft')
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(queue_handler)
+        root.propagate = False
+
+        _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def get_logger(node_id, component='node'):
+    _configure()
+    return NodeLogger(logging.getLogger(f'raft.{component}'), {'node_id': node_id})
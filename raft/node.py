@@ -1,166 +1,387 @@
 import time
 import threading
-import requests
 import random
 import os
 import json
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, takewhile
+from raft.state_machine import StateMachine
+from raft.metrics import MetricsRegistry
+from raft.profiling import InstrumentedLock
+from raft.logger import get_logger
+from raft.tracing import get_tracer, inject
+from raft.transport import HttpTransport, PeersFile
+from raft.sqlite_storage import SqliteStorage
+from raft.storage import FileStorage
 
 class RaftNode:
-    def __init__(self, node_id, peers, host, port):
+    def __init__(self, node_id, peers, host, port, transport=None, membership=None, group=None, storage='file'):
         self.node_id = node_id
+        # One process may run a node in each of several Raft groups (shards); each group has its
+        # own files and serves its peers under /groups/<group>
+        self.group = group
+        self.log_name = node_id if group is None else f'{node_id}/{group}'
+        self.rpc_prefix = '' if group is None else f'/groups/{group}'
+        file_suffix = '' if group is None else f'_{group}'
+        self.log = get_logger(self.log_name)
+        self.tracer = get_tracer(self.log_name)
         self.peers = [[p[0], p[1]] if isinstance(p, tuple) else p for p in peers]  # Convert any tuples to lists
         self.host = host
         self.port = port
+        self.transport = transport if transport is not None else HttpTransport()
+        self.membership = membership if membership is not None else PeersFile()
         self.role = 'follower'
         self.term = 0
         self.voted_for = None
         self.votes_received = 0
+        started = time.perf_counter()
+        self._init_metrics()
 
         self.heartbeat_enabled = True
-        self.state_file = f"state_{self.node_id}.json"
-        self._load_state()
+        self.meta_file = f"state_{self.node_id}{file_suffix}.meta"  # Term and vote, rewritten whenever they change
+        self.snapshot_file = f"state_{self.node_id}{file_suffix}.snapshot"
+        self.state_file = f"state_{self.node_id}{file_suffix}.json"  # Pre-snapshot state format, only read to migrate
+        self.snapshot_interval = 100  # log entries applied between state snapshots
+        self.snapshot_index = 0  # log entries covered by the last snapshot
+        self.unsaved_keys = {}  # collection -> keys applied since the last snapshot, for engines that save per key
+        self.log_page_bytes = 1 << 20  # most log bytes sent or fetched per /logs request
 
         self.last_heartbeat = time.time()
+        self.leader_hint = None  # node ID, host and port of the leader whose heartbeat was last accepted
         self.election_timeout_range = (5, 10)
+        self.election_check_interval = 0.5  # seconds between election timeout checks
+        self.heartbeat_interval = 2  # seconds between leader heartbeats
         self.reset_election_timeout()
 
-        self.lock = threading.Lock()
+        # Wait and hold times of these are reported by /admin/locks
+        self.lock = InstrumentedLock('lock')
+        self.admission_lock = InstrumentedLock('admission_lock')  # Serializes job admission checks with their apply
+        self.apply_lock = InstrumentedLock('apply_lock')  # Serializes log appends with applying and saving them
         self.discovery_interval = 30  # seconds between peer discovery attempts
+        self.promotion_max_lag = 10  # most entries a learner may trail the leader by to be promoted
+        # Write admission on the leader: proposals replicated at once, queued behind them and how long
+        # they may wait, then each client's sustained writes per second and burst (None for no limit)
+        self.max_inflight_proposals = 16
+        self.max_queued_proposals = 64
+        self.proposal_wait_timeout = 1.0
+        self.client_rate = 100.0
+        self.client_burst = 200
+        self.low_stock_grams = 100  # free grams below which the summary lists a filament as low
+        self.learner_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix=f'{self.log_name}-learners')
 
         # Change log file name to use port number
-        self.log_file = f"logs/log_{port}.json"
-        self.log_index = 0
+        self.log_file = f"logs/log_{port}{file_suffix}.wal"
+        self.legacy_log_file = f"logs/log_{port}{file_suffix}.json"
         os.makedirs('logs', exist_ok=True)
-        self._load_log()
+
+        # Only term, vote and last log index are read before joining the cluster; state
+        # collections stay empty and reads are rejected until recovery sets `ready`
+        self.ready = threading.Event()
+        self.storage = self._open_storage(storage, file_suffix)
+        self._load_metadata()
+        self.wal = self.storage.log
+        last_index = self.wal.peek_last_index()
+        self.log_index = 0 if last_index is None else last_index + 1
+        self.state_machine = StateMachine()
+
+        # Change feed of applied commands, streamed to watchers once committed
+        self.commit_index = self.log_index
+        self.change_feed = deque(maxlen=10000)
+        self.feed_start = self.log_index  # Oldest log index a watcher can resume from
+        self.change_cond = threading.Condition()
+
+        # Read caches are keyed on these; the epoch changes when state is replaced wholesale
+        self.last_applied = self.log_index
+        self.state_epoch = 0
 
         # Start election thread
-        self.election_thread = threading.Thread(target=self._run_election)
+        self.election_thread = threading.Thread(target=self._run_election, name=f'{self.log_name}-election')
         self.election_thread.daemon = True
         self.election_thread.start()
 
         # Start peer discovery thread
-        self.discovery_thread = threading.Thread(target=self._run_peer_discovery)
+        self.discovery_thread = threading.Thread(target=self._run_peer_discovery, name=f'{self.log_name}-discovery')
         self.discovery_thread.daemon = True
         self.discovery_thread.start()
 
+        self.log.info(f"🗳️ Joined cluster at term {self.term} after {round((time.perf_counter() - started) * 1000)}ms",
+                      event='started', term=self.term, log_index=self.log_index)
+        threading.Thread(target=self._recover, args=(started,), name=f'{self.log_name}-recovery', daemon=True).start()
+
+    def _init_metrics(self):
+        self.metrics = MetricsRegistry()
+        m = self.metrics
+        self.m_commit_latency = m.histogram(
+            'raft_commit_latency_seconds', 'Time from proposing a command to a majority acknowledging it')
+        self.m_peer_rtt = m.histogram('raft_peer_rpc_seconds', 'Round trip time of RPCs to peers')
+        self.m_peer_failures = m.counter('raft_peer_rpc_failures_total', 'RPCs to peers that raised an error')
+        self.m_elections = m.counter('raft_elections_total', 'Elections started by this node, by result')
+        self.m_election_duration = m.histogram('raft_election_duration_seconds', 'Time spent running an election')
+        self.m_log_bytes = m.counter('raft_log_bytes_written_total', 'Bytes written to the log file')
+        self.m_log_fsync = m.histogram('raft_log_fsync_seconds', 'Time spent in fsync of the log file')
+        self.m_state_write = m.histogram('raft_state_write_seconds', 'Time spent writing a state snapshot')
+        self.m_startup = m.gauge('raft_startup_seconds', 'Time from startup until state and log were recovered')
+        m.gauge('raft_ready', 'Whether startup recovery finished and reads are served', lambda: int(self.ready.is_set()))
+        m.gauge('raft_log_entries', 'Entries in the log', lambda: self.log_index)
+        m.gauge('raft_term', 'Current term', lambda: self.term)
+        m.gauge('raft_is_leader', 'Whether this node is the leader', lambda: int(self.role == 'leader'))
+        m.gauge('raft_is_learner', 'Whether this node is a non-voting learner', lambda: int(self.is_learner()))
+        m.gauge('raft_apply_lag_entries', 'Committed entries not yet applied',
+                lambda: max(0, self.commit_index - self.last_applied))
+
+    def _peer_request(self, method, peer_host, peer_port, path, rpc, **kwargs):
+        """Send an RPC to a peer, recording its round trip time or failure"""
+        peer = f'{peer_host}:{peer_port}'
+        started = time.perf_counter()
+        with self.tracer.span(f'rpc {rpc}', peer=peer) as span:
+            if span.context is not None:
+                kwargs['headers'] = inject(dict(kwargs.get('headers') or {}), span.context)
+            try:
+                response = self.transport.request(method, peer_host, peer_port, self.rpc_prefix + path, **kwargs)
+            except Exception:
+                self.m_peer_failures.inc(peer=peer, rpc=rpc)
+                raise
+            span.set(status=response.status_code)
+        self.m_peer_rtt.observe(time.perf_counter() - started, peer=peer, rpc=rpc)
+        return response
+
     def reset_election_timeout(self):
         self.last_heartbeat = time.time()
         self.election_timeout = random.uniform(*self.election_timeout_range)
 
-    def _load_state(self):
-        if os.path.exists(self.state_file):
-            with open(self.state_file, 'r') as f:
-                data = json.load(f)
+    def _recover(self, started):
+        """Rebuild state from the newest intact snapshot plus the log entries after it.
+
+        Runs in the background after startup. Nothing appends to the log until
+        `ready` is set: replication and catch-up are refused meanwhile.
+        """
+        with self.apply_lock:
+            snapshot_index = self._load_snapshot()
+            self._load_log()
+            self.snapshot_index = self.log_index if snapshot_index is None else snapshot_index
+
+            # Replay the log tail the snapshot does not cover; the log itself is already durable
+            replayed = self.state_machine.apply_entries(self.wal.read(self.snapshot_index))
+            if snapshot_index is None or replayed:
+                self._save_state()
+            self._reset_change_feed()
+            self.ready.set()
+
+        elapsed = time.perf_counter() - started
+        self.m_startup.set(elapsed)
+        self.log.info(f"🚀 Recovered {self.log_index} log entries ({replayed} replayed) in {round(elapsed * 1000)}ms",
+                      event='recovered', entries=self.log_index, replayed=replayed, seconds=round(elapsed, 4))
+
+    def _open_storage(self, engine, file_suffix):
+        """The engine holding term, vote, snapshots and the log: 'file' or 'sqlite'.
+
+        A new SQLite database starts from whatever the file engine stored before.
+        """
+        files = FileStorage(self.meta_file, self.snapshot_file, self.log_file)
+        if engine == 'file':
+            return files
+        if engine == 'sqlite':
+            return SqliteStorage(f"state_{self.node_id}{file_suffix}.db", previous=files)
+        raise ValueError(f"Unknown storage engine: {engine}")
+
+    def _load_metadata(self):
+        metadata = self.storage.load_metadata()
+        if metadata:
+            self.term = metadata.get('term', 0)
+            self.voted_for = metadata.get('voted_for')
+        elif os.path.exists(self.state_file) and not self.storage.has_snapshot():
+            # Older nodes kept term and vote in the state file; parsed this once while migrating
+            try:
+                with open(self.state_file, 'r') as f:
+                    data = json.load(f)
                 self.term = data.get('term', 0)
                 self.voted_for = data.get('voted_for', None)
-                # Initialize data structures
-                self.printers = data.get('printers', {})
-                self.filaments = data.get('filaments', {})
-                self.jobs = data.get('jobs', {})
-        else:
-            self.printers = {}
-            self.filaments = {}
-            self.jobs = {}
-
-    def _save_state(self):
-        with open(self.state_file, 'w') as f:
-            json.dump({
-                'term': self.term,
-                'voted_for': self.voted_for,
-                'printers': self.printers,
-                'filaments': self.filaments,
-                'jobs': self.jobs
-            }, f, indent=4)
-        print(f"[{self.node_id}] 💾 State saved to {self.state_file}")
+            except (ValueError, OSError):
+                pass
+
+    def _load_snapshot(self):
+        """Load state collections; returns the log index they cover, or None if they cover the whole log"""
+        snapshot = self.storage.load_snapshot()
+        if snapshot is not None:
+            log_index, collections = snapshot
+            self.state_machine = StateMachine.from_dict(collections)
+            return log_index
+
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as f:
+                    data = json.load(f)
+                self.state_machine = StateMachine.from_dict(data)
+                self.log.info(f"📂 Migrating state from {self.state_file}", event='state_migrated')
+                return None  # The old format was saved after every command
+            except (ValueError, OSError) as e:
+                self.log.warning(f"⚠️ Unreadable state file {self.state_file}: {str(e)}", event='state_corrupt')
+
+        self.state_machine = StateMachine()
+        return 0
+
+    # The collections live in the state machine; these keep reads on the node short
+    @property
+    def printers(self):
+        return self.state_machine.printers
+
+    @property
+    def filaments(self):
+        return self.state_machine.filaments
+
+    @property
+    def jobs(self):
+        return self.state_machine.jobs
+
+    @property
+    def filament_ledger(self):
+        return self.state_machine.filament_ledger
+
+    @property
+    def sessions(self):
+        return self.state_machine.sessions
+
+    @property
+    def filament_holds(self):
+        return self.state_machine.filament_holds
+
+    def _save_metadata(self):
+        self.storage.save_metadata({'term': self.term, 'voted_for': self.voted_for})
+
+    def _save_state(self, changed=None):
+        """Persist term and vote plus a snapshot of the state machine at the current log index.
+
+        ``changed`` lists the keys applied since the last snapshot; without it
+        (after state was replaced wholesale) the engine stores everything.
+        """
+        self._save_metadata()
+        with self.m_state_write.time():
+            self.storage.save_snapshot(self.log_index, self.state_machine.to_dict(), changed)
+        self.snapshot_index = self.log_index
+        self.unsaved_keys = {}
+        self.log.debug(f"💾 State saved to {self.storage.path}", event='state_saved')
+
+    def _maybe_snapshot(self):
+        """Snapshot once enough entries were applied; until then the log holds them durably"""
+        if self.log_index - self.snapshot_index >= self.snapshot_interval:
+            with self.tracer.span('snapshot', index=self.log_index):
+                self._save_state(self.unsaved_keys)
 
     def _load_log(self):
-        """Load operation log from file with better error handling"""
+        """Load the operation log, dropping a record torn by a crash mid-append"""
         try:
-            if os.path.exists(self.log_file):
-                with open(self.log_file, 'r') as f:
-                    try:
-                        self.log_entries = json.load(f)
-                        self.log_index = len(self.log_entries)
-                        print(f"[{self.node_id}] 📚 Loaded {self.log_index} existing log entries")
-                    except json.JSONDecodeError:
-                        print(f"[{self.node_id}] ⚠️ Corrupt log file, starting fresh")
-                        self.log_entries = []
-                        self.log_index = 0
-            else:
-                self.log_entries = []
-                self.log_index = 0
+            migrate = self.storage.created and os.path.exists(self.legacy_log_file)
+            self.wal.recover()
+            if migrate:
+                with open(self.legacy_log_file, 'r') as f:
+                    migrated = self.wal.rewrite(json.load(f))
+                self.log.info(f"📂 Migrated {migrated} entries from {self.legacy_log_file}", event='log_migrated')
+        except Exception as e:
+            self.log.error(f"❌ Error loading log: {str(e)}", event='log_load_failed')
+            self.wal.rewrite([])
+        self.log_index = len(self.wal)
+        if self.log_index:
+            self.log.info(f"📚 Loaded {self.log_index} existing log entries", event='log_loaded', entries=self.log_index)
+
+    def _append_log_entries(self, log_entries):
+        """Append entries to the log and fsync them before they are applied.
+
+        Raises if the write or the fsync fails. Whatever part of the entries
+        reached the log is cut off again and log_index is left as it was, so
+        the caller neither applies nor acknowledges them.
+        """
+        try:
+            with self.tracer.span('log append', entries=len(log_entries)):
+                self.m_log_bytes.inc(self.wal.append(log_entries))
+            with self.tracer.span('log fsync'), self.m_log_fsync.time():
+                self.wal.sync()
         except Exception as e:
-            print(f"[{self.node_id}] ❌ Error loading log: {str(e)}")
-            self.log_entries = []
-            self.log_index = 0
+            self.log.error(f"❌ Error saving log: {str(e)}", event='log_write_failed')
+            try:
+                self.wal.truncate(self.log_index)
+            except Exception as e:
+                self.log.error(f"❌ Error truncating log: {str(e)}", event='log_truncate_failed')
+            raise
+        self.log_index += len(log_entries)
 
-    def _save_log_entry(self, command, term):
-        """Save operation to log file"""
+    def _save_log_entry(self, command, term, timestamp=None):
+        """Save operation to log file; followers pass the leader's timestamp"""
         log_entry = {
             'index': self.log_index,
             'term': term,
             'command': command,
-            'timestamp': time.time()
+            'timestamp': time.time() if timestamp is None else timestamp
         }
-        self.log_entries.append(log_entry)
-        self.log_index += 1
-        
-        try:
-            with open(self.log_file, 'w') as f:
-                json.dump(self.log_entries, f, indent=4)
-        except Exception as e:
-            print(f"[{self.node_id}] ❌ Error saving log: {str(e)}")
+        self._append_log_entries([log_entry])
+        return log_entry
 
     def _get_alive_peers(self):
-        """Get list of peers that are marked as alive in peers.json"""
+        """Get list of peers that are marked as alive in the cluster membership"""
+        return self._get_alive_members()[0]
+
+    def _get_alive_members(self):
+        """Alive peers as [host, port] pairs, plus the set of those that are learners"""
         try:
-            with open('config/peers.json', 'r') as f:
-                peers_data = json.load(f)
-                alive_peers = []
-                for peer in peers_data.get('peers', []):
-                    if (peer.get('status') == 'alive' and 
-                        not (peer['port'] == self.port and peer['host'] == self.host)):
-                        alive_peers.append([peer['host'], peer['port']])
-                return alive_peers
+            members = self.membership.alive_members(self.host, self.port)
         except Exception as e:
-            print(f"[{self.node_id}] ❌ Error reading peers.json: {str(e)}")
-            return self.peers
+            self.log.warning(f"❌ Error reading peers.json: {str(e)}", event='peers_read_failed')
+            return self.peers, set()
+        return [[h, p] for h, p, _ in members], {(h, p) for h, p, role in members if role == 'learner'}
+
+    def is_learner(self):
+        """Learners replicate the log and serve reads but never vote, stand or count toward a commit"""
+        try:
+            return self.membership.role_of(self.host, self.port) == 'learner'
+        except Exception:
+            return False
 
     def _run_election(self):
         while True:
-            time.sleep(0.5)
+            time.sleep(self.election_check_interval)
             with self.lock:
-                if self.role != 'leader' and time.time() - self.last_heartbeat > self.election_timeout:
-                    print(f"[{self.node_id}] ⚠️ Starting election (no heartbeat in {round(self.election_timeout, 2)}s)")
+                # A node still recovering votes but does not stand, since it could not serve as leader
+                if (self.role != 'leader' and self.ready.is_set()
+                        and time.time() - self.last_heartbeat > self.election_timeout
+                        and not self.is_learner()):
+                    self.log.info(f"⚠️ Starting election (no heartbeat in {round(self.election_timeout, 2)}s)",
+                                  event='election_started', term=self.term + 1)
+                    election_started = time.perf_counter()
                     self.term += 1
                     self.role = 'candidate'
+                    self.leader_hint = None
                     self.voted_for = self.node_id
                     self.votes_received = 1
-                    self._save_state()
+                    self._save_metadata()
 
-                    current_peers = self._get_alive_peers()
+                    alive_peers, learners = self._get_alive_members()
+                    current_peers = [p for p in alive_peers if tuple(p) not in learners]
                     for peer_host, peer_port in current_peers:
                         try:
-                            res = requests.post(f'http://{peer_host}:{peer_port}/vote', json={
+                            res = self._peer_request('POST', peer_host, peer_port, '/vote', 'vote', json={
                                 'term': self.term,
                                 'candidate_id': self.node_id
                             }, timeout=1)
                             if res.status_code == 200 and res.json().get('vote_granted'):
                                 self.votes_received += 1
-                                print(f"[{self.node_id}] ✓ Received vote from {peer_host}:{peer_port}")
+                                self.log.info(f"✓ Received vote from {peer_host}:{peer_port}", event='vote_received')
                         except Exception:
-                            print(f"[{self.node_id}] ❌ Failed to get vote from {peer_host}:{peer_port}")
+                            self.log.warning(f"❌ Failed to get vote from {peer_host}:{peer_port}", event='vote_request_failed')
                             self._mark_peer_dead(peer_host, peer_port)
 
                     total_alive_nodes = len(current_peers) + 1  # Include self
-                    if self.votes_received > total_alive_nodes // 2:
-                        print(f"[{self.node_id}] 👑 Elected as leader for term {self.term}")
+                    won = self.votes_received > total_alive_nodes // 2
+                    self.m_elections.inc(result='won' if won else 'lost')
+                    self.m_election_duration.observe(time.perf_counter() - election_started)
+                    if won:
+                        self.log.info(f"👑 Elected as leader for term {self.term}", event='elected', term=self.term)
                         self.role = 'leader'
                         # Sync state with peers when becoming leader
                         self._sync_state_with_peers()
                         self._start_heartbeat()
                     else:
-                        print(f"[{self.node_id}] 🔄 Election failed, returning to follower state")
+                        self.log.info("🔄 Election failed, returning to follower state", event='election_lost', term=self.term)
                         self.role = 'follower'
 
                     self.reset_election_timeout()
@@ -170,17 +391,20 @@ class RaftNode:
         current_peers = self._get_alive_peers()
         for peer_host, peer_port in current_peers:
             try:
-                response = requests.get(f'http://{peer_host}:{peer_port}/state', timeout=2)
+                response = self._peer_request('GET', peer_host, peer_port, '/state', 'state', timeout=2)
                 if response.status_code == 200:
                     peer_state = response.json()
                     # Update local state with peer data
                     self.printers.update(peer_state.get('printers', {}))
                     self.filaments.update(peer_state.get('filaments', {}))
                     self.jobs.update(peer_state.get('jobs', {}))
-                    print(f"[{self.node_id}] 🔄 Synced state with peer {peer_host}:{peer_port}")
+                    self.log.info(f"🔄 Synced state with peer {peer_host}:{peer_port}", event='peer_state_synced')
             except Exception as e:
-                print(f"[{self.node_id}] ❌ Failed to sync with peer {peer_host}:{peer_port}: {str(e)}")
+                self.log.warning(f"❌ Failed to sync with peer {peer_host}:{peer_port}: {str(e)}", event='peer_state_sync_failed')
+        # Merged state may come from several peers, so derive reservations from it
+        self.state_machine.rebuild_derived()
         self._save_state()
+        self._reset_change_feed()
 
     def _start_heartbeat(self):
         def heartbeat_loop():
@@ -189,46 +413,47 @@ class RaftNode:
                     current_peers = self._get_alive_peers()
                     for peer_host, peer_port in current_peers:
                         try:
-                            requests.post(f'http://{peer_host}:{peer_port}/heartbeat', json={
+                            self._peer_request('POST', peer_host, peer_port, '/heartbeat', 'heartbeat', json={
                                 'term': self.term,
-                                'leader_id': self.node_id
+                                'leader_id': self.node_id,
+                                'leader_host': self.host,
+                                'leader_port': self.port
                             }, timeout=1)
-                            print(f"[{self.node_id}] 💗 Heartbeat sent to {peer_host}:{peer_port}")
+                            self.log.debug(f"💗 Heartbeat sent to {peer_host}:{peer_port}", event='heartbeat_sent')
                         except Exception:
-                            print(f"[{self.node_id}] ⚠️ Failed to reach {peer_host}:{peer_port}")
+                            self.log.warning(f"⚠️ Failed to reach {peer_host}:{peer_port}", event='heartbeat_failed')
                             self._mark_peer_dead(peer_host, peer_port)
-                time.sleep(2)
-        threading.Thread(target=heartbeat_loop, daemon=True).start()
+                time.sleep(self.heartbeat_interval)
+        threading.Thread(target=heartbeat_loop, name=f'{self.log_name}-heartbeat', daemon=True).start()
 
     def _mark_peer_dead(self, host, port):
-        """Mark a peer as dead in peers.json when it's unreachable"""
+        """Mark a peer as dead in the cluster membership when it's unreachable"""
         try:
-            with open('config/peers.json', 'r') as f:
-                peers_data = json.load(f)
-            
-            # Update status for the unreachable peer
-            for peer in peers_data.get('peers', []):
-                if peer['host'] == host and peer['port'] == port and peer['status'] != 'dead':
-                    peer['status'] = 'dead'
-                    print(f"[{self.node_id}] 💀 Marked peer {host}:{port} as dead")
-                    with open('config/peers.json', 'w') as f:
-                        json.dump(peers_data, f, indent=4)
-                    break
+            if self.membership.set_status(host, port, 'dead'):
+                self.log.warning(f"💀 Marked peer {host}:{port} as dead", event='peer_marked_dead')
         except Exception as e:
-            print(f"[{self.node_id}] ❌ Error marking peer as dead: {str(e)}")
+            self.log.error(f"❌ Error marking peer as dead: {str(e)}", event='peer_mark_failed')
 
-    def receive_heartbeat(self, term):
+    def receive_heartbeat(self, term, leader=None):
         with self.lock:
             if term >= self.term:
                 if self.role != 'follower':
-                    print(f"[{self.node_id}] ⬇️ Stepping down to follower (term {term})")
+                    self.log.info(f"⬇️ Stepping down to follower (term {term})", event='stepped_down', term=term)
                 self.term = term
                 self.role = 'follower'
+                self.leader_hint = leader
                 self.voted_for = None
                 self.reset_election_timeout()
-                print(f"[{self.node_id}] 💗 Heartbeat received (term {term})")
+                self.log.debug(f"💗 Heartbeat received (term {term})", event='heartbeat_received')
                 # Try to sync logs on heartbeat
-                self.sync_with_leader()
+                if self.ready.is_set():
+                    self.sync_with_leader()
+
+    def current_leader(self):
+        """Where clients should send writes: this node when leading, else the last leader heard from"""
+        if self.role == 'leader':
+            return {'node_id': self.node_id, 'host': self.host, 'port': self.port}
+        return self.leader_hint
 
     def receive_vote_request(self, term, candidate_id):
         with self.lock:
@@ -237,179 +462,262 @@ class RaftNode:
                 self.voted_for = None
                 self.role = 'follower'
 
-            if self.voted_for is None and term == self.term:
+            if self.voted_for is None and term == self.term and not self.is_learner():
                 self.voted_for = candidate_id
-                self._save_state()
+                self._save_metadata()
                 self.reset_election_timeout()
-                print(f"[{self.node_id}] 🗳️ Voted for {candidate_id} (term {term})")
+                self.log.info(f"🗳️ Voted for {candidate_id} (term {term})", event='vote_granted', term=term)
                 return True
             return False
 
-    def replicate_command(self, command):
-        """Replicate a command to all followers"""
+    def replicate_command(self, log_entry):
+        """Replicate a log entry to all followers"""
         if self.role != 'leader':
-            # Even if follower, save to log
-            self._save_log_entry(command, self.term)
             return False
             
         success_count = 1  # Count self
-        current_peers = self._get_alive_peers()
-        
-        for peer_host, peer_port in current_peers:
-            try:
-                response = requests.post(
-                    f'http://{peer_host}:{peer_port}/replicate',
-                    json={
-                        'term': self.term,
-                        'leader_id': self.node_id,
-                        'command': command,
-                        'log_index': self.log_index  # Include log index for synchronization
-                    },
-                    timeout=2
-                )
-                if response.status_code == 200:
+        current_peers, learners = self._get_alive_members()
+        payload = {
+            'term': self.term,
+            'leader_id': self.node_id,
+            'command': log_entry['command'],
+            'index': log_entry['index'],  # Followers append entries strictly in log order
+            'timestamp': log_entry['timestamp'],  # Applied with the leader's clock everywhere
+            'log_index': self.log_index
+        }
+
+        # Learners do not count toward the commit, so their copies are sent off the commit path
+        for peer_host, peer_port in learners:
+            # Run in a copy of this context so the learner RPCs join the request's trace
+            self.learner_pool.submit(contextvars.copy_context().run, self._send_replicate, peer_host, peer_port, payload)
+
+        voters = [p for p in current_peers if tuple(p) not in learners]
+        with self.tracer.span('replicate', index=log_entry['index'], voters=len(voters)) as span:
+            for peer_host, peer_port in voters:
+                if self._send_replicate(peer_host, peer_port, payload):
                     success_count += 1
-                    print(f"[{self.node_id}] ✅ Command replicated to {peer_host}:{peer_port}")
-                else:
-                    print(f"[{self.node_id}] ❌ Failed to replicate to {peer_host}:{peer_port}")
-            except Exception as e:
-                print(f"[{self.node_id}] ❌ Error replicating to {peer_host}:{peer_port}: {str(e)}")
-                self._mark_peer_dead(peer_host, peer_port)
+            span.set(acks=success_count)
         
-        # Command is successful if majority of nodes acknowledge it
-        return success_count > (len(current_peers) + 1) // 2
+        # Command is successful if majority of voting nodes acknowledge it
+        return success_count > (len(voters) + 1) // 2
+
+    def _send_replicate(self, peer_host, peer_port, payload):
+        """Send one entry to a follower; returns True if it was appended"""
+        try:
+            response = self._peer_request('POST', peer_host, peer_port, '/replicate', 'replicate',
+                                          json=payload, timeout=2)
+            if response.status_code == 200:
+                self.log.debug(f"✅ Command replicated to {peer_host}:{peer_port}", event='replicated')
+                return True
+            self.log.warning(f"❌ Failed to replicate to {peer_host}:{peer_port}", event='replicate_failed')
+        except Exception as e:
+            self.log.warning(f"❌ Error replicating to {peer_host}:{peer_port}: {str(e)}", event='replicate_failed')
+            self._mark_peer_dead(peer_host, peer_port)
+        return False
+
+    def promote_learner(self, host, port):
+        """Make a learner a voter once its log is within promotion_max_lag of ours.
+
+        Returns (promoted, lag); lag is None when the learner could not be asked.
+        """
+        response = self._peer_request('GET', host, port, '/status', 'status', timeout=2)
+        if response.status_code != 200:
+            return False, None
+        lag = self.log_index - response.json().get('log_index', 0)
+        if lag > self.promotion_max_lag:
+            return False, lag
+        if self.membership.set_role(host, port, 'voter'):
+            self.log.info(f"🎓 Promoted learner {host}:{port} to voter ({lag} entries behind)",
+                          event='learner_promoted', lag=lag)
+        return True, lag
 
     def apply_command(self, command):
         """Apply a command and replicate it to followers if leader"""
-        print(f"[{self.node_id}] ⚙️ Applying command: {command}")
-        
-        # Save to log first
-        self._save_log_entry(command, self.term)
-        
-        # Apply the change locally
-        self._apply_state_change(command)
+        self.log.debug("⚙️ Applying command: %s", command, event='command_applying')
         
+        started = time.perf_counter()
+        with self.tracer.span('apply_lock wait'):
+            self.apply_lock.acquire()
+        try:
+            # Save to log first
+            try:
+                log_entry = self._save_log_entry(command, self.term)
+            except Exception:
+                self.m_commit_latency.observe(time.perf_counter() - started, result='failed')
+                return False  # Not durable, so neither applied nor replicated
+
+            # Apply the change locally
+            self._apply_entries([log_entry])
+        finally:
+            self.apply_lock.release()
+
         if self.role == 'leader':
-            if self.replicate_command(command):
-                print(f"[{self.node_id}] ✅ Command successfully replicated to majority")
+            if self.replicate_command(log_entry):
+                self.log.debug("✅ Command successfully replicated to majority", event='command_committed')
+                self._advance_commit_index(log_entry['index'] + 1)
+                self.m_commit_latency.observe(time.perf_counter() - started, result='committed')
                 return True
             else:
-                print(f"[{self.node_id}] ❌ Failed to replicate command to majority")
+                self.log.warning("❌ Failed to replicate command to majority", event='commit_failed')
+                self.m_commit_latency.observe(time.perf_counter() - started, result='failed')
                 return False
+        self._advance_commit_index(log_entry['index'] + 1)
         return True
 
-    def _apply_state_change(self, command):
-        """Apply a state change from a command"""
-        op = command.get('op')
-        data = command.get('data', {})
-
-        if op == 'add_printer':
-            printer_id = data.get('id')
-            self.printers[printer_id] = {
-                'company': data.get('company'),
-                'model': data.get('model'),
-                'status': 'Available'  # Track printer status
-            }
-        elif op == 'add_filament':
-            filament_id = data.get('id')
-            total_weight = data.get('total_weight_in_grams')
-            remaining_weight = data.get('remaining_weight_in_grams')
-            
-            # Validate weights
-            if remaining_weight > total_weight:
-                remaining_weight = total_weight
-                
-            self.filaments[filament_id] = {
-                'type': data.get('type'),
-                'color': data.get('color'),
-                'total_weight': total_weight,
-                'remaining_weight': remaining_weight
-            }
-        elif op == 'add_job':
-            job_id = data.get('id')
-            self.jobs[job_id] = {
-                'printer_id': data.get('printer_id'),
-                'filament_id': data.get('filament_id'),
-                'filepath': data.get('filepath'),
-                'print_weight_in_grams': data.get('print_weight_in_grams'),
-                'status': 'Queued',  # Always start as Queued
-                'created_at': time.time()  # Track job creation time
-            }
-        elif op == 'update_job_status':
-            job_id = data.get('job_id')
-            new_status = data.get('status')
-            if job_id in self.jobs:
-                old_status = self.jobs[job_id]['status']
-                self.jobs[job_id]['status'] = new_status
-                
-                # Update filament weight when job is Done
-                if new_status == 'Done' and old_status != 'Done':
-                    f_id = self.jobs[job_id]['filament_id']
-                    used_weight = self.jobs[job_id]['print_weight_in_grams']
-                    current_weight = self.filaments[f_id]['remaining_weight']
-                    self.filaments[f_id]['remaining_weight'] = max(0, current_weight - used_weight)
-                
-                # Update job completion time
-                if new_status in ['Done', 'Cancelled']:
-                    self.jobs[job_id]['completed_at'] = time.time()
-        
-        self._save_state()
+    def _apply_entries(self, log_entries):
+        """Apply appended log entries and publish them to watchers, then persist at most once"""
+        with self.tracer.span('apply', entries=len(log_entries)):
+            for log_entry in log_entries:
+                self.state_machine.apply(log_entry['command'], log_entry.get('timestamp'), log_entry['index'])
+                self._publish_change(log_entry['index'], log_entry['command'])
+                for collection, keys in self.state_machine.changed_keys(log_entry['command']).items():
+                    self.unsaved_keys.setdefault(collection, set()).update(keys)
+        self._maybe_snapshot()
+
+    def _publish_change(self, index, command):
+        """Append an applied command to the change feed"""
+        event = {
+            'index': index,
+            'op': command.get('op'),
+            'changes': self.state_machine.changed_records(command)
+        }
+        with self.change_cond:
+            self.change_feed.append(event)
+            self.last_applied = max(self.last_applied, index + 1)
+            self.change_cond.notify_all()
+
+    def _advance_commit_index(self, index):
+        with self.change_cond:
+            if index > self.commit_index:
+                self.commit_index = index
+                self.change_cond.notify_all()
+
+    def _reset_change_feed(self):
+        """Drop buffered events after the state was replaced wholesale, forcing watchers to resync"""
+        with self.change_cond:
+            self.change_feed.clear()
+            self.feed_start = self.log_index
+            self.commit_index = self.log_index
+            self.last_applied = self.log_index
+            self.state_epoch += 1
+            self.change_cond.notify_all()
+
+    def wait_for_changes(self, from_index, timeout, limit=1000):
+        """Block until committed events at or after from_index exist, or the timeout passes.
+
+        Returns None when from_index is older than the buffered feed.
+        """
+        deadline = time.time() + timeout
+        with self.change_cond:
+            while True:
+                oldest = self.change_feed[0]['index'] if self.change_feed else self.feed_start
+                if from_index < oldest:
+                    return None
+                # Feed indexes are consecutive, so skip straight to from_index
+                skip = from_index - self.change_feed[0]['index'] if self.change_feed else 0
+                events = list(islice(takewhile(
+                    lambda e: e['index'] < self.commit_index,
+                    islice(self.change_feed, skip, None)
+                ), limit))
+                remaining = deadline - time.time()
+                if events or remaining <= 0:
+                    return events
+                self.change_cond.wait(remaining)
+
+    def wait_for_log_index(self, index, timeout):
+        """Block until the log holds entries up to index, e.g. when a replicated entry arrives early"""
+        deadline = time.time() + timeout
+        with self.change_cond:
+            while self.log_index < index:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.change_cond.wait(remaining)
+        return True
+
+    def state_version(self):
+        """Version of the readable state, used to validate cached responses"""
+        return (self.state_epoch, self.last_applied)
 
     def sync_with_leader(self):
-        """Sync state and logs with current leader when node comes back online"""
+        """Catch up with the current leader when node comes back online or falls behind.
+
+        Missing entries are fetched from the leader's log and applied in order.
+        Only a log that diverged from the leader's (longer than it) is replaced
+        by a full transfer of the leader's state and log.
+        """
         for peer_host, peer_port in self.peers:
             try:
                 # Check if peer is leader
-                status_resp = requests.get(f'http://{peer_host}:{peer_port}/status', timeout=2)
-                if status_resp.status_code == 200:
-                    peer_status = status_resp.json()
-                    if peer_status.get('role') == 'leader':
-                        # Get state and logs from leader
-                        state_resp = requests.get(f'http://{peer_host}:{peer_port}/state', timeout=2)
-                        
-                        # First check if we have existing logs
-                        existing_logs = []
-                        if os.path.exists(self.log_file):
-                            with open(self.log_file, 'r') as f:
-                                try:
-                                    existing_logs = json.load(f)
-                                except json.JSONDecodeError:
-                                    pass  # Ignore corrupt log file
-                        
-                        # Get only new logs from leader
-                        last_index = len(existing_logs)
-                        logs_resp = requests.get(f'http://{peer_host}:{peer_port}/logs/{last_index}', timeout=2)
-                        
-                        if state_resp.status_code == 200 and logs_resp.status_code == 200:
-                            leader_state = state_resp.json()
-                            new_logs = logs_resp.json()
-                            
-                            # Update local state with leader's data
-                            self.printers = leader_state.get('printers', {})
-                            self.filaments = leader_state.get('filaments', {})
-                            self.jobs = leader_state.get('jobs', {})
-                            
-                            # Merge existing logs with new logs
-                            self.log_entries = existing_logs
-                            for log_entry in new_logs:
-                                if log_entry['index'] >= last_index:
-                                    self.log_entries.append(log_entry)
-                                    self._apply_state_change(log_entry['command'])
-                            
-                            self.log_index = len(self.log_entries)
-                            
-                            # Save merged logs
-                            with open(self.log_file, 'w') as f:
-                                json.dump(self.log_entries, f, indent=4)
-                            
-                            self._save_state()
-                            print(f"[{self.node_id}] 🔄 Successfully synced state and preserved logs with leader")
-                            return True
+                status_resp = self._peer_request('GET', peer_host, peer_port, '/status', 'status', timeout=2)
+                if status_resp.status_code != 200 or status_resp.json().get('role') != 'leader':
+                    continue
+                leader_index = status_resp.json().get('log_index', 0)
+                if leader_index == self.log_index:
+                    return True
+                if leader_index > self.log_index and self._catch_up_from(peer_host, peer_port, leader_index):
+                    return True
+                return self._install_leader_state(peer_host, peer_port)
             except Exception as e:
-                print(f"[{self.node_id}] ❌ Failed to sync with potential leader: {str(e)}")
+                self.log.warning(f"❌ Failed to sync with potential leader: {str(e)}", event='leader_sync_failed')
                 continue
         return False
 
+    def _fetch_log_page(self, peer_host, peer_port, from_index):
+        """Up to log_page_bytes of the peer's log entries from from_index on, or None on error"""
+        response = self._peer_request('GET', peer_host, peer_port,
+                                      f'/logs/{from_index}?max_bytes={self.log_page_bytes}', 'logs', timeout=2)
+        return response.json() if response.status_code == 200 else None
+
+    def _catch_up_from(self, peer_host, peer_port, leader_index):
+        """Append and apply the leader's entries after our last one; False if they do not line up"""
+        caught_up = 0
+        while self.log_index < leader_index:
+            page = self._fetch_log_page(peer_host, peer_port, self.log_index)
+            if page is None:
+                return False
+            with self.apply_lock:
+                # Replication may have appended some of these while the page was in flight
+                new_logs = [e for e in page if e['index'] >= self.log_index]
+                if not new_logs:
+                    break
+                if new_logs[0]['index'] != self.log_index:
+                    return False
+                self._append_log_entries(new_logs)
+                self._apply_entries(new_logs)
+                self._advance_commit_index(self.log_index)
+            caught_up += len(new_logs)
+        if caught_up:
+            self.log.debug(f"🔄 Caught up {caught_up} entries from leader", event='leader_synced', entries=caught_up)
+        return self.log_index >= leader_index
+
+    def _install_leader_state(self, peer_host, peer_port):
+        """Replace our state and log with the leader's"""
+        state_resp = self._peer_request('GET', peer_host, peer_port, '/state', 'state', timeout=2)
+        if state_resp.status_code != 200:
+            return False
+        leader_state = state_resp.json()
+
+        def leader_log():
+            from_index = 0
+            while True:
+                page = self._fetch_log_page(peer_host, peer_port, from_index)
+                if page is None:
+                    raise RuntimeError(f'Could not fetch log from {peer_host}:{peer_port}')
+                if not page:
+                    return
+                yield from page
+                from_index = page[-1]['index'] + 1
+
+        with self.apply_lock:
+            # The log is streamed to a new file page by page and only swapped in once complete
+            self.log_index = self.wal.rewrite(leader_log())
+            self.state_machine = StateMachine.from_dict(leader_state)
+            self._save_state()
+            self._reset_change_feed()
+        self.log.info(f"🔄 Installed leader state and {self.log_index} log entries", event='leader_state_installed')
+        return True
+
     def _run_peer_discovery(self):
         """Run peer discovery and state sync loop"""
         prev_peers = set()
@@ -422,12 +730,12 @@ class RaftNode:
                 if current_peers_set != prev_peers and self.role != 'leader':
                     # Only sync if we have more peers than before (likely coming back online)
                     if len(current_peers_set) > len(prev_peers):
-                        print(f"[{self.node_id}] 📡 New peers detected, attempting to sync state with leader")
+                        self.log.info("📡 New peers detected, attempting to sync state with leader", event='peers_joined')
                         self.sync_with_leader()
                 
                 prev_peers = current_peers_set
                 self.peers = current_peers
-                print(f"[{self.node_id}] 📡 Updated peers list: {self.peers}")
+                self.log.debug("📡 Updated peers list: %s", self.peers, event='peers_updated')
             except Exception as e:
-                print(f"[{self.node_id}] ❌ Error updating peers: {str(e)}")
+                self.log.error(f"❌ Error updating peers: {str(e)}", event='peers_update_failed')
             time.sleep(self.discovery_interval)
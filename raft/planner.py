@@ -0,0 +1,125 @@
+import heapq
+import time
+
+import numpy as np
+
+from raft.ledger import ACTIVE_JOB_STATUSES
+
+DEFAULT_JOB_SECONDS = 3600.0  # assumed for jobs whose G-code was never analyzed
+
+
+def _cumsum_by_group(groups, values):
+    """Running total of values within each group, in the given order"""
+    order = np.argsort(groups, kind='stable')
+    sorted_values = values[order]
+    totals = np.cumsum(sorted_values)
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(groups[order])) + 1])
+    before_group = np.repeat(totals[starts] - sorted_values[starts], np.diff(np.append(starts, len(order))))
+    result = np.empty_like(totals)
+    result[order] = totals - before_group
+    return result
+
+
+def plan_queue(printers, jobs, remaining_grams, progress=None, add_printers=0, restock=None,
+               default_job_seconds=DEFAULT_JOB_SECONDS):
+    """When the active jobs finish as assigned, and an LPT assignment that finishes them sooner.
+
+    Running jobs stay on their printer for their estimated time, less the
+    progress telemetry reported. Queued jobs take filament in longest-first
+    order; those their filament cannot cover are returned as blocked. The
+    rest are placed longest first on whichever printer frees up first
+    (faulted printers excluded). ``add_printers`` and ``restock`` (filament
+    ID -> extra grams) ask what would change with more printers or filament.
+    Times are seconds from now.
+    """
+    started = time.perf_counter()
+    progress = progress or {}
+    restock = restock or {}
+
+    printer_ids = list(printers) + [f'new-{i + 1}' for i in range(add_printers)]
+    usable = np.array([not printers.get(pid, {}).get('fault') for pid in printer_ids], dtype=bool)
+    printer_index = {pid: i for i, pid in enumerate(printer_ids)}
+
+    # One pass over the job table into columns
+    columns = [(
+        jid,
+        job.get('estimated_seconds') or default_job_seconds,
+        job['status'] == 'Running',
+        progress.get(job['printer_id'], 0.0) if job['status'] == 'Running' else 0.0,
+        printer_index.get(job['printer_id'], -1),
+        # Jobs whose filament is held by another shard are not limited by stock here
+        0.0 if job.get('filament_group') else job.get('print_weight_in_grams') or 0.0,
+        str(job.get('filament_id'))
+    ) for jid, job in jobs.items() if job.get('status') in ACTIVE_JOB_STATUSES]
+    ids, seconds, running, done, printer_of, weight, filaments = zip(*columns) if columns else [()] * 7
+    job_ids = np.array(ids, dtype=object)
+    seconds = np.array(seconds, dtype=float)
+    running = np.array(running, dtype=bool)
+    seconds *= 1 - np.clip(np.array(done, dtype=float), 0, 100) / 100
+    printer_of = np.array(printer_of, dtype=np.int64)
+    weight = np.array(weight, dtype=float)
+    filament_ids, filament_of = np.unique(np.array(filaments, dtype=object), return_inverse=True)
+
+    # Stock left for queued jobs once running ones consume their weight
+    stock = np.array([(remaining_grams.get(fid) or 0.0) + restock.get(fid, 0.0) for fid in filament_ids])
+    stock -= np.bincount(filament_of[running], weight[running], minlength=len(filament_ids))
+
+    queued = np.flatnonzero(~running & (printer_of >= 0))
+    order = queued[np.argsort(-seconds[queued], kind='stable')]
+    needed = _cumsum_by_group(filament_of[order], weight[order]) if len(order) else np.zeros(0)
+    covered = needed <= stock[filament_of[order]] + 1e-9
+    ready, blocked = order[covered], order[~covered]
+
+    on_running = np.flatnonzero(running & (printer_of >= 0))
+    busy_until = np.bincount(printer_of[on_running], seconds[on_running], minlength=len(printer_ids))
+    as_assigned = busy_until + np.bincount(printer_of[ready], seconds[ready], minlength=len(printer_ids))
+
+    # Longest processing time first: each job goes to the printer that frees up first
+    heap = [(busy_until[i], i) for i in np.flatnonzero(usable)]
+    heapq.heapify(heap)
+    start = np.zeros(len(job_ids))
+    chosen = np.full(len(job_ids), -1, dtype=np.int64)
+    if heap:
+        for j in ready:
+            free_at, i = heapq.heappop(heap)
+            start[j], chosen[j] = free_at, i
+            heapq.heappush(heap, (free_at + seconds[j], i))
+    placed = ready[chosen[ready] >= 0]
+    optimized = busy_until + np.bincount(chosen[placed], seconds[placed], minlength=len(printer_ids))
+    if not heap:
+        optimized = as_assigned
+
+    # No schedule can beat the longest job or the total work spread evenly
+    work = busy_until[usable].sum() + seconds[ready].sum()
+    lower_bound = max(float(seconds[ready].max()) if len(ready) else 0.0,
+                      float(busy_until[usable].max()) if usable.any() else 0.0,
+                      work / max(1, int(usable.sum())))
+
+    names = np.array(printer_ids, dtype=object)
+    assignments = zip(job_ids[placed].tolist(), names[chosen[placed]].tolist(),
+                      np.round(start[placed], 1).tolist(), np.round(start[placed] + seconds[placed], 1).tolist())
+    return {
+        'printers': len(printer_ids),
+        'usable_printers': int(usable.sum()),
+        'running_jobs': int(running.sum()),
+        'queued_jobs': int(len(queued)),
+        'as_assigned': {
+            'makespan_seconds': round(float(as_assigned.max()) if len(printer_ids) else 0.0, 1),
+            'per_printer': dict(zip(printer_ids, np.round(as_assigned, 1).tolist()))
+        },
+        'optimized': {
+            'makespan_seconds': round(float(optimized.max()) if len(printer_ids) else 0.0, 1),
+            'lower_bound_seconds': round(float(lower_bound), 1),
+            'moved_jobs': int((chosen[placed] != printer_of[placed]).sum()),
+            'per_printer': dict(zip(printer_ids, np.round(optimized, 1).tolist())),
+            'assignments': [
+                {'job_id': job_id, 'printer_id': printer_id, 'start_seconds': begin, 'end_seconds': end}
+                for job_id, printer_id, begin, end in assignments
+            ]
+        },
+        'blocked': [
+            {'job_id': job_ids[j], 'filament_id': filament_ids[filament_of[j]], 'grams': float(weight[j])}
+            for j in blocked
+        ],
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
@@ -0,0 +1,172 @@
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+# One sampling profile per process at a time; a second request is refused rather than queued
+_profile_lock = threading.Lock()
+
+
+def _frame_label(code):
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)})"
+
+
+def _stack_labels(frame):
+    """Function labels of a frame's stack, outermost first"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def sample_stacks(seconds, interval=0.005):
+    """Sample every other thread's stack for ``seconds``; returns (Counter of stacks, samples taken).
+
+    Each stack is a tuple of the thread name and its function labels,
+    outermost first. Nothing runs between profiles, so a node pays for
+    sampling only while one is requested. Returns None if a profile is
+    already running in this process.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    stacks[(names.get(ident, str(ident)),) + tuple(_stack_labels(frame))] += 1
+            samples += 1
+            time.sleep(interval)
+        return stacks, samples
+    finally:
+        _profile_lock.release()
+
+
+def collapsed(stacks):
+    """Stacks in the folded format flamegraph.pl, speedscope and inferno read: 'a;b;c count' per line"""
+    return ''.join(f"{';'.join(label.replace(';', ':') for label in stack)} {count}\n"
+                   for stack, count in stacks.most_common())
+
+
+def top_functions(stacks, limit=30):
+    """Functions by samples spent in them (self) and under them (total)"""
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for label in set(stack[1:]):
+            total[label] += count
+    return [{'function': label, 'self': own[label], 'total': count} for label, count in total.most_common(limit)]
+
+
+def thread_dump():
+    """Name, daemon flag and current stack of every thread in the process"""
+    frames = sys._current_frames()
+    threads = []
+    for thread in sorted(threading.enumerate(), key=lambda t: t.name):
+        frame = frames.get(thread.ident)
+        threads.append({
+            'name': thread.name,
+            'ident': thread.ident,
+            'daemon': thread.daemon,
+            'stack': traceback.format_stack(frame) if frame is not None else []
+        })
+    return threads
+
+
+class InstrumentedLock:
+    """A threading.Lock that can time how long callers wait for it and hold it.
+
+    Timing is off until ``start_timing``; until then acquire and release
+    only add a flag check to the plain lock's cost.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.timing = False
+        self._acquired_at = 0.0
+        self._stats_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._stats_lock:
+            self.acquisitions = 0
+            self.contended = 0  # acquisitions that had to wait
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+            self.hold_seconds = 0.0
+            self.max_hold_seconds = 0.0
+
+    def start_timing(self):
+        self.reset()
+        self.timing = True
+
+    def stop_timing(self):
+        self.timing = False
+
+    def acquire(self, blocking=True, timeout=-1):
+        if not self.timing:
+            return self._lock.acquire(blocking, timeout)
+        if self._lock.acquire(False):
+            waited = 0.0
+        else:
+            started = time.perf_counter()
+            if not self._lock.acquire(blocking, timeout):
+                return False
+            waited = time.perf_counter() - started
+        self._acquired_at = time.perf_counter()
+        with self._stats_lock:
+            self.acquisitions += 1
+            if waited:
+                self.contended += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return True
+
+    def release(self):
+        acquired_at, self._acquired_at = self._acquired_at, 0.0
+        self._lock.release()
+        if acquired_at and self.timing:
+            held = time.perf_counter() - acquired_at
+            with self._stats_lock:
+                self.hold_seconds += held
+                self.max_hold_seconds = max(self.max_hold_seconds, held)
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        if self.timing:
+            self.acquire()
+        else:
+            self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._acquired_at:
+            self.release()
+        else:
+            self._lock.release()
+
+    def stats(self):
+        with self._stats_lock:
+            n = self.acquisitions
+            return {
+                'lock': self.name,
+                'acquisitions': n,
+                'contended': self.contended,
+                'wait_seconds_total': round(self.wait_seconds, 6),
+                'wait_seconds_mean': round(self.wait_seconds / n, 6) if n else 0.0,
+                'wait_seconds_max': round(self.max_wait_seconds, 6),
+                'hold_seconds_total': round(self.hold_seconds, 6),
+                'hold_seconds_mean': round(self.hold_seconds / n, 6) if n else 0.0,
+                'hold_seconds_max': round(self.max_hold_seconds, 6)
+            }
@@ -1,72 +1,110 @@
-from flask import Flask, request, jsonify
-import os, json
-import requests
+from flask import Flask, Response, g, request, jsonify, send_file
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+import json, math, os, threading, time, zlib
+from queue import Queue
+from raft.admission import ClientRateLimiter, ProposalQueue
+from raft.blobs import BLOB_PREFIX, DIGEST, BlobReplicator, BlobStore, blob_digest
+from raft.gcode import GcodeAnalyzer
+from raft.ledger import ACTIVE_JOB_STATUSES
+from raft.planner import DEFAULT_JOB_SECONDS, plan_queue
+from raft.profiling import collapsed, sample_stacks, thread_dump, top_functions
+from raft.telemetry import RESOLUTIONS, UNCHANGED, TelemetryStore, parse_samples
+from raft.logger import get_logger
+from raft.tracing import extract
 
 def create_raft_server(raft_node):
     app = Flask(__name__)
-
-    STATE_FILE = f"state_{raft_node.node_id}.json"  # Changed to match node state file
-
-    def save_all_state():
-        state = {
-            'term': raft_node.term,
-            'voted_for': raft_node.voted_for,
-            'printers': raft_node.printers,
-            'filaments': raft_node.filaments,
-            'jobs': raft_node.jobs
-        }
-        with open(STATE_FILE, 'w') as f:
-            json.dump(state, f, indent=4)
-        print(f"[{raft_node.node_id}] 💾 State saved to {STATE_FILE}")
-
-    def load_all_state():
-        if os.path.exists(STATE_FILE):
-            with open(STATE_FILE, 'r') as f:
-                data = json.load(f)
-                raft_node.printers.update(data.get('printers', {}))
-                raft_node.filaments.update(data.get('filaments', {}))
-                raft_node.jobs.update(data.get('jobs', {}))
-            print(f"[{raft_node.node_id}] 📂 State loaded from {STATE_FILE}")
-
-    def apply_state_change(command):
-        """Apply a state change from a command"""
-        op = command.get('op')
-        data = command.get('data', {})
-
-        if op == 'add_printer':
-            printer_id = data.get('id')
-            raft_node.printers[printer_id] = {
-                'company': data.get('company'),
-                'model': data.get('model')
-            }
-        elif op == 'add_filament':
-            filament_id = data.get('id')
-            raft_node.filaments[filament_id] = {
-                'type': data.get('type'),
-                'color': data.get('color'),
-                'total_weight': data.get('total_weight_in_grams'),
-                'remaining_weight': data.get('remaining_weight_in_grams')
-            }
-        elif op == 'add_job':
-            job_id = data.get('id')
-            raft_node.jobs[job_id] = {
-                'printer_id': data.get('printer_id'),
-                'filament_id': data.get('filament_id'),
-                'filepath': data.get('filepath'),
-                'print_weight_in_grams': data.get('print_weight_in_grams'),
-                'status': 'Queued'
-            }
-        elif op == 'update_job_status':
-            job_id = data.get('job_id')
-            new_status = data.get('status')
-            if job_id in raft_node.jobs:
-                raft_node.jobs[job_id]['status'] = new_status
-                if new_status == 'Done':
-                    f_id = raft_node.jobs[job_id]['filament_id']
-                    used = raft_node.jobs[job_id]['print_weight_in_grams']
-                    raft_node.filaments[f_id]['remaining_weight'] = max(0, raft_node.filaments[f_id]['remaining_weight'] - used)
-        
-        raft_node._save_state()
+    log = get_logger(raft_node.log_name, 'server')
+
+    request_latency = raft_node.metrics.histogram(
+        'raft_http_request_seconds', 'Latency of HTTP requests served by this node')
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.before_request
+    def start_trace():
+        """Continue the caller's trace; API requests that arrive without one may start their own"""
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.trace_span = raft_node.tracer.span(f'{request.method} {endpoint}', parent=extract(request.headers),
+                                             root=request.path.startswith('/api/'), role=raft_node.role)
+
+    @app.after_request
+    def record_request_latency(response):
+        started = g.get('request_started')
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            request_latency.observe(time.perf_counter() - started, endpoint=endpoint,
+                                    method=request.method, status=response.status_code)
+        if 'trace_span' in g:
+            g.trace_span.set(status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def end_trace(exc):
+        span = g.pop('trace_span', None)
+        if span is not None:
+            span.end(exc)
+
+    # Endpoints that only use term, vote and log position, which are loaded before startup recovery
+    AVAILABLE_WHILE_RECOVERING = {'metrics', 'vote', 'heartbeat', 'status', 'get_blob',
+                                  'profile', 'dump_threads', 'lock_stats'}
+
+    @app.before_request
+    def reject_until_recovered():
+        """Refuse reads and writes while state is still being loaded, instead of answering from it"""
+        if not raft_node.ready.is_set() and request.endpoint not in AVAILABLE_WHILE_RECOVERING:
+            response = jsonify({'success': False, 'error': 'Node is still recovering its state'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+
+    # Write admission: each client's token bucket first, then a bounded number of proposals at once
+    proposals = ProposalQueue(raft_node.max_inflight_proposals, raft_node.max_queued_proposals,
+                              raft_node.proposal_wait_timeout)
+    rate_limiter = ClientRateLimiter(raft_node.client_rate, raft_node.client_burst)
+    writes_rejected = raft_node.metrics.counter(
+        'raft_writes_rejected_total', 'API writes refused by admission control, by reason')
+    raft_node.metrics.gauge('raft_proposals_in_flight', 'API writes being proposed', lambda: proposals.in_flight)
+    raft_node.metrics.gauge('raft_proposals_queued', 'API writes waiting to be proposed', lambda: proposals.waiting)
+
+    # Writes that do not propose a command for every request
+    NOT_PROPOSED = {'ingest_telemetry'}
+
+    def overloaded(status, error, retry_after):
+        response = jsonify({'success': False, 'status': 'overloaded', 'error': error})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    @app.before_request
+    def admit_write():
+        """Refuse API writes over a client's rate with 429, and over the leader's capacity with 503"""
+        if request.method not in ('POST', 'PATCH') or not request.path.startswith('/api/'):
+            return None
+        client = request.headers.get('X-Client-ID') or request.remote_addr
+        wait = rate_limiter.take(client)
+        if wait:
+            writes_rejected.inc(reason='client_rate')
+            return overloaded(429, 'Too many writes from this client', wait)
+        if request.endpoint in NOT_PROPOSED or raft_node.role != 'leader':
+            return None
+        with raft_node.tracer.span('proposal queue'):
+            admitted = proposals.acquire()
+        if not admitted:
+            writes_rejected.inc(reason='queue_full')
+            return overloaded(503, 'The leader has too many writes in progress', proposals.wait_timeout)
+        g.proposal_slot = True
+
+    @app.teardown_request
+    def release_proposal_slot(exc):
+        if g.pop('proposal_slot', False):
+            proposals.release()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(raft_node.metrics.render(), mimetype='text/plain; version=0.0.4')
 
     @app.route('/replicate', methods=['POST'])
     def replicate():
@@ -75,7 +113,7 @@ def create_raft_server(raft_node):
         term = data.get('term')
         leader_id = data.get('leader_id')
         command = data.get('command')
-        leader_log_index = data.get('log_index')
+        index = data.get('index')
 
         if term < raft_node.term:
             return jsonify({'success': False, 'error': 'Term is outdated'}), 400
@@ -91,53 +129,175 @@ def create_raft_server(raft_node):
 
         # Apply the replicated command and save to log
         try:
-            # Save to log first
-            raft_node._save_log_entry(command, term)
-            
-            # Then apply the change
-            apply_state_change(command)
-            save_all_state()
+            # Concurrent replications can arrive out of order; give earlier entries a moment
+            if index is not None and not raft_node.wait_for_log_index(index, timeout=1):
+                return jsonify({'success': False, 'error': 'Missing earlier log entries'}), 409
+
+            with raft_node.apply_lock:
+                if index is not None and index < raft_node.log_index:
+                    # Already appended, e.g. fetched by catch-up before this request arrived
+                    return jsonify({'success': True, 'log_index': raft_node.log_index}), 200
+
+                # Save to log first, then apply it exactly as the leader did
+                log_entry = raft_node._save_log_entry(command, term, data.get('timestamp'))
+                raft_node._apply_entries([log_entry])
+            raft_node._advance_commit_index(log_entry['index'] + 1)
             
-            print(f"[{raft_node.node_id}] ✅ Applied and logged replicated command from leader {leader_id}")
+            log.debug(f"✅ Applied and logged replicated command from leader {leader_id}", event='replicated_command_applied')
             return jsonify({'success': True, 'log_index': raft_node.log_index}), 200
         except Exception as e:
-            print(f"[{raft_node.node_id}] ❌ Failed to apply replicated command: {str(e)}")
+            log.error(f"❌ Failed to apply replicated command: {str(e)}", event='replicated_command_failed')
             return jsonify({'success': False, 'error': str(e)}), 500
 
-    def sync_state_with_peers():
-        """Sync state with other nodes when becoming leader"""
-        if not is_leader():
-            return
-        
-        for peer in raft_node.peers:
-            try:
-                host, port = peer
-                # Get state from each peer
-                response = requests.get(f'http://{host}:{port}/state', timeout=2)
-                if response.status_code == 200:
-                    peer_state = response.json()
-                    # Merge state - take most recent updates
-                    raft_node.printers.update(peer_state.get('printers', {}))
-                    raft_node.filaments.update(peer_state.get('filaments', {}))
-                    raft_node.jobs.update(peer_state.get('jobs', {}))
-                    print(f"[{raft_node.node_id}] 🔄 Synced state with peer {host}:{port}")
-            except Exception as e:
-                print(f"[{raft_node.node_id}] ❌ Failed to sync with peer {host}:{port}: {str(e)}")
-        save_all_state()
-
-    def is_leader():
-        return raft_node.role == 'leader'
+    def not_leader():
+        """Refuse a write on a follower, naming the leader it last heard from so clients can go there"""
+        leader = raft_node.current_leader()
+        response = jsonify({'error': 'This node is not the leader', 'leader': leader})
+        if leader:
+            response.headers['X-Raft-Leader'] = f"{leader['host']}:{leader['port']}"
+        return response, 403
+
+    # Weight, print time and layers of job files, computed in worker processes
+    gcode = GcodeAnalyzer()
+    # Corrections from finished analyses are committed by one thread, so a burst of new files queues
+    # up here rather than as threads waiting on the admission lock
+    estimates = Queue()
+
+    # Uploaded G-code by content hash, shared by every group served from this process
+    blobs = BlobStore.open(f'blobs/{raft_node.port}')
+    blob_replicator = BlobReplicator(raft_node, blobs).start()
+
+    # Recent printer samples, held by the leader that ingests them and never replicated
+    telemetry = TelemetryStore()
+    telemetry_samples = raft_node.metrics.counter(
+        'raft_telemetry_samples_total', 'Printer telemetry samples ingested by this node')
+    # Transitions are committed by one thread, in the order their batches arrived
+    transitions = Queue()
+
+    # Serialized GET responses keyed by path and query, valid while the state version holds
+    response_cache = {}
+    RESPONSE_CACHE_SIZE = 256
+
+    def cached_json(build):
+        """Serve a JSON body built from state, reusing it until the next applied entry"""
+        version = raft_node.state_version()
+        key = request.full_path
+        cached = response_cache.get(key)
+        if cached is None or cached[0] != version:
+            body = json.dumps(build())
+            etag = f"{raft_node.node_id}-{version[0]}-{version[1]}-{zlib.crc32(key.encode()):08x}"
+            if len(response_cache) >= RESPONSE_CACHE_SIZE:
+                response_cache.clear()
+            cached = (version, etag, body)
+            response_cache[key] = cached
+
+        _, etag, body = cached
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response
+
+    # Status code returned for each write op, replayed for duplicate request IDs
+    SUCCESS_STATUS = {
+        'add_printer': 201,
+        'add_filament': 201,
+        'add_job': 201,
+        'update_job_status': 200,
+        'reserve_filament': 201,
+        'settle_filament_reservation': 200
+    }
+
+    def duplicate_response():
+        """Return the cached result if this client request ID was already committed"""
+        request_id = request.headers.get('X-Request-ID')
+        if not request_id:
+            return None
+        entry = raft_node.sessions.lookup(request_id)
+        if entry is None:
+            return None
+        # The leader applies, and so records, an entry before replicating it. If that replication
+        # failed, the retry must not be told it succeeded: commit an empty entry after it first,
+        # which commits it too, or fail as the first attempt did
+        if entry.get('index') is not None and entry['index'] >= raft_node.commit_index:
+            if not raft_node.apply_command({'op': 'noop'}):
+                return jsonify({'error': 'Failed to replicate command'}), 500
+        # Entries recorded before responses were logged get the response a success of their op had
+        response = entry.get('response') or {'status': SUCCESS_STATUS.get(entry['op'], 200), 'body': {'success': True}}
+        return jsonify({**response['body'], 'duplicate': True}), response['status']
+
+    def submit_command(command):
+        """Tag a command with the client request ID and replicate it"""
+        response = {'status': SUCCESS_STATUS[command['op']], 'body': {'success': True}}
+        request_id = request.headers.get('X-Request-ID')
+        if request_id:
+            # Logged with the command, so every node can answer a retry with what the first attempt got
+            command['request_id'] = request_id
+            command['response'] = response
+        with raft_node.tracer.span('propose', op=command['op']):
+            committed = raft_node.apply_command(command)
+        if committed:
+            return jsonify(response['body']), response['status']
+        return jsonify({'error': 'Failed to replicate command'}), 500
 
     @app.route('/state', methods=['GET'])
     def get_state():
         """Get current state for synchronization"""
         return jsonify({
+            'node_id': raft_node.node_id,
             'printers': raft_node.printers,
             'filaments': raft_node.filaments,
             'jobs': raft_node.jobs,
+            'filament_ledger': raft_node.filament_ledger.to_dict(),
+            'sessions': raft_node.sessions.to_list(),
+            'filament_holds': raft_node.filament_holds,
             'log_index': raft_node.log_index
         }), 200
 
+    @app.route('/watch', methods=['GET'])
+    def watch():
+        """Long-poll for committed state changes starting at a log index"""
+        from_index = request.args.get('from_index', raft_node.commit_index, type=int)
+        timeout = min(request.args.get('timeout', 25, type=float), 60)
+        events = raft_node.wait_for_changes(from_index, timeout)
+        if events is None:
+            return jsonify({
+                'error': 'Requested index is no longer buffered, resync from /state',
+                'node_id': raft_node.node_id
+            }), 410
+        next_index = events[-1]['index'] + 1 if events else from_index
+        return jsonify({
+            'node_id': raft_node.node_id,
+            'events': events,
+            'next_index': next_index,
+            'commit_index': raft_node.commit_index
+        }), 200
+
+    @app.route('/watch/stream', methods=['GET'])
+    def watch_stream():
+        """Stream committed state changes as server-sent events, resumable via Last-Event-ID"""
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        if last_event_id is not None:
+            from_index = last_event_id + 1
+        else:
+            from_index = request.args.get('from_index', raft_node.commit_index, type=int)
+
+        def generate(next_index):
+            while True:
+                events = raft_node.wait_for_changes(next_index, timeout=15)
+                if events is None:
+                    yield 'event: resync\ndata: {}\n\n'
+                    return
+                if not events:
+                    yield ': keepalive\n\n'
+                for event in events:
+                    yield f"id: {event['index']}\nevent: change\ndata: {json.dumps(event)}\n\n"
+                    next_index = event['index'] + 1
+
+        return Response(generate(from_index), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+
     @app.route('/vote', methods=['POST'])
     def vote():
         data = request.json
@@ -150,67 +310,305 @@ def create_raft_server(raft_node):
     def heartbeat():
         data = request.json
         term = data.get('term')
-        raft_node.receive_heartbeat(term)
+        leader = None
+        if data.get('leader_host'):
+            leader = {'node_id': data.get('leader_id'), 'host': data['leader_host'], 'port': data.get('leader_port')}
+        raft_node.receive_heartbeat(term, leader)
         return jsonify({'success': True}), 200
 
     @app.route('/status', methods=['GET'])
     def status():
         return jsonify({
             'node_id': raft_node.node_id,
+            'group': raft_node.group,
             'role': raft_node.role,
+            'leader': raft_node.current_leader(),
+            'learner': raft_node.is_learner(),
             'term': raft_node.term,
-            'peers': raft_node.peers
+            'peers': raft_node.peers,
+            'log_index': raft_node.log_index,
+            'commit_index': raft_node.commit_index,
+            'last_applied': raft_node.last_applied,
+            'ready': raft_node.ready.is_set()
         }), 200
 
+    @app.route('/membership/promote', methods=['POST'])
+    def promote_learner():
+        """Promote a learner to voter once it has caught up with the leader's log"""
+        if not raft_node.role == 'leader':
+            return not_leader()
+
+        data = request.json
+        host, port = data.get('host'), data.get('port')
+        if [host, port] not in raft_node._get_alive_peers():
+            return jsonify({'error': 'Peer not found or not alive'}), 404
+        try:
+            promoted, lag = raft_node.promote_learner(host, port)
+        except Exception as e:
+            return jsonify({'error': f'Could not reach learner: {str(e)}'}), 502
+        if not promoted:
+            return jsonify({'error': 'Learner is still catching up', 'lag': lag}), 409
+        return jsonify({'success': True, 'lag': lag}), 200
+
+    # ------------------ ADMIN ------------------
+    MAX_PROFILE_SECONDS = 60
+    lock_timing = threading.Lock()  # held while /admin/locks times this node's locks
+
+    def profile_window():
+        """The seconds= query argument, or None if it is not between 0 and MAX_PROFILE_SECONDS"""
+        try:
+            seconds = float(request.args.get('seconds', 5))
+        except ValueError:
+            return None
+        return seconds if 0 < seconds <= MAX_PROFILE_SECONDS else None
+
+    @app.route('/admin/profile', methods=['GET'])
+    def profile():
+        """Sample every thread's stack for a while; folded stacks for a flame graph, or top functions with format=json"""
+        seconds = profile_window()
+        interval = request.args.get('interval_ms', 5, type=float)
+        if seconds is None or not 1 <= interval <= 1000:
+            return jsonify({'error': f'seconds must be 0-{MAX_PROFILE_SECONDS} and interval_ms 1-1000'}), 400
+        log.info(f"🔬 Profiling for {seconds}s", event='profile_started', seconds=seconds)
+        result = sample_stacks(seconds, interval / 1000)
+        if result is None:
+            return jsonify({'error': 'A profile is already running in this process'}), 409
+        stacks, samples = result
+        if request.args.get('format') == 'json':
+            return jsonify({
+                'seconds': seconds,
+                'samples': samples,
+                'threads': sorted({stack[0] for stack in stacks}),
+                'top': top_functions(stacks, request.args.get('limit', 30, type=int))
+            }), 200
+        return Response(collapsed(stacks), mimetype='text/plain')
+
+    @app.route('/admin/threads', methods=['GET'])
+    def dump_threads():
+        """Current stack of every thread in the process, as text or with format=json"""
+        threads = thread_dump()
+        if request.args.get('format') == 'json':
+            return jsonify({'threads': threads}), 200
+        text = ''.join(f"Thread {t['name']} ({t['ident']}{', daemon' if t['daemon'] else ''}):\n{''.join(t['stack'])}\n"
+                       for t in threads)
+        return Response(text, mimetype='text/plain')
+
+    @app.route('/admin/locks', methods=['GET'])
+    def lock_stats():
+        """Time waits for and holds of the node's locks for a while, then report them"""
+        seconds = profile_window()
+        if seconds is None:
+            return jsonify({'error': f'seconds must be 0-{MAX_PROFILE_SECONDS}'}), 400
+        locks = [raft_node.lock, raft_node.apply_lock, raft_node.admission_lock]
+        if not lock_timing.acquire(blocking=False):
+            return jsonify({'error': 'Lock timing is already running on this node'}), 409
+        try:
+            for lock in locks:
+                lock.start_timing()
+            time.sleep(seconds)
+        finally:
+            for lock in locks:
+                lock.stop_timing()
+            lock_timing.release()
+        return jsonify({'seconds': seconds, 'locks': [lock.stats() for lock in locks]}), 200
+
+    # ------------------ SUMMARY ------------------
+    @app.route('/api/v1/summary', methods=['GET'])
+    def get_summary():
+        """Job, printer and filament counts for the dashboard, kept up to date as entries apply.
+
+        low_stock_grams overrides the node's threshold, and limit caps the
+        busiest printers, lowest filaments and recent jobs listed.
+        """
+        try:
+            low_stock_grams = float(request.args.get('low_stock_grams', raft_node.low_stock_grams))
+            limit = request.args.get('limit', 5, type=int)
+        except ValueError:
+            return jsonify({'error': 'low_stock_grams must be a number'}), 400
+        if not 0 <= limit <= 100:
+            return jsonify({'error': 'limit must be 0-100'}), 400
+        return cached_json(lambda: raft_node.state_machine.aggregates.summary(
+            raft_node.state_machine, low_stock_grams, limit))
+
     # ------------------ PRINTERS ------------------
     @app.route('/api/v1/printers', methods=['POST'])
     def create_printer():
         if not raft_node.role == 'leader':
-            return jsonify({'error': 'This node is not the leader'}), 403
+            return not_leader()
+
+        duplicate = duplicate_response()
+        if duplicate:
+            return duplicate
 
         data = request.json
         printer_id = data.get('id')
         if not printer_id or printer_id in raft_node.printers:
             return jsonify({'error': 'Invalid or duplicate printer ID'}), 400
 
-        command = {'op': 'add_printer', 'data': data}
-        if raft_node.apply_command(command):
-            return jsonify({'success': True}), 201
-        return jsonify({'error': 'Failed to replicate command'}), 500
+        return submit_command({'op': 'add_printer', 'data': data})
 
     @app.route('/api/v1/printers', methods=['GET'])
     def get_printers():
-        return jsonify([
+        return cached_json(lambda: [
             {'id': pid, **pdata} for pid, pdata in raft_node.printers.items()
-        ]), 200
+        ])
+
+    @app.route('/api/v1/printers/<printer_id>', methods=['GET'])
+    def get_printer(printer_id):
+        if printer_id not in raft_node.printers:
+            return jsonify({'error': 'Printer not found'}), 404
+        return jsonify({'id': printer_id, **raft_node.printers[printer_id]}), 200
+
+    # ------------------ TELEMETRY ------------------
+    @app.route('/api/v1/telemetry', methods=['POST'])
+    def ingest_telemetry():
+        """Store a batch of printer samples; only the transitions they reveal are committed"""
+        if not raft_node.role == 'leader':
+            return not_leader()
+        try:
+            batch = parse_samples((request.get_json(silent=True) or {}).get('samples'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        accepted, unknown = 0, []
+        for printer_id, (rows, fault) in batch.items():
+            if printer_id not in raft_node.printers:
+                unknown.append(printer_id)  # Bounds memory to the printers the cluster knows
+                continue
+            changed_fault, changed_phase = telemetry.ingest(printer_id, rows, fault)
+            accepted += len(rows)
+            if changed_fault is not UNCHANGED or changed_phase is not None:
+                transitions.put((printer_id, changed_fault, changed_phase))
+        telemetry_samples.inc(accepted)
+        return jsonify({'success': True, 'accepted': accepted, 'unknown_printers': unknown}), 200
+
+    def commit_transitions():
+        """Propose the printer faults and job starts and completions that telemetry revealed"""
+        while True:
+            printer_id, fault, phase = transitions.get()
+            printer = raft_node.printers.get(printer_id)
+            if raft_node.role != 'leader' or printer is None:
+                continue
+            if fault is not UNCHANGED and printer.get('fault') != fault:
+                raft_node.apply_command({'op': 'set_printer_fault', 'data': {'id': printer_id, 'fault': fault}})
+                log.info(f"🌡️ Printer {printer_id} fault: {fault or 'cleared'}", event='printer_fault',
+                         printer_id=printer_id)
+            if phase not in ('printing', 'finished'):
+                continue
+            job_id = next((jid for jid, job in raft_node.jobs.items()
+                           if job['printer_id'] == printer_id and job['status'] in ACTIVE_JOB_STATUSES), None)
+            # Cross-shard jobs advance too; the welcome server settles their filament hold once it sees them finish
+            if job_id is None:
+                continue
+            # A print first seen finished still passes through Running
+            steps = [('Queued', 'Running')] + ([('Running', 'Done')] if phase == 'finished' else [])
+            with raft_node.admission_lock:
+                for before, after in steps:
+                    if raft_node.jobs[job_id]['status'] == before:
+                        raft_node.apply_command({'op': 'update_job_status',
+                                                 'data': {'job_id': job_id, 'status': after}})
+                        log.info(f"🌡️ Job {job_id} is {after} per printer {printer_id}'s telemetry",
+                                 event='job_status_from_telemetry', job_id=job_id)
+
+    threading.Thread(target=commit_transitions, name=f'{raft_node.log_name}-transitions', daemon=True).start()
+
+    @app.route('/api/v1/printers/<printer_id>/telemetry', methods=['GET'])
+    def get_printer_telemetry(printer_id):
+        """A printer's latest sample and its history at one resolution (raw, 10s or 1m)"""
+        if printer_id not in raft_node.printers:
+            return jsonify({'error': 'Printer not found'}), 404
+        resolution = request.args.get('resolution', 'raw')
+        if resolution not in [name for name, _, _ in RESOLUTIONS]:
+            return jsonify({'error': f'Unknown resolution {resolution}'}), 400
+        printer = telemetry.get(printer_id)
+        if printer is None:
+            return jsonify({'printer_id': printer_id, 'latest': None, 'fault': None, 'phase': None,
+                            'resolution': resolution, 'series': {}}), 200
+        return jsonify({'printer_id': printer_id, **printer.snapshot(), 'resolution': resolution,
+                        'series': printer.series(resolution, request.args.get('since', type=float))}), 200
 
     # ------------------ FILAMENTS ------------------
     @app.route('/api/v1/filaments', methods=['POST'])
     def create_filament():
         if not raft_node.role == 'leader':
-            return jsonify({'error': 'This node is not the leader'}), 403
+            return not_leader()
+
+        duplicate = duplicate_response()
+        if duplicate:
+            return duplicate
 
         data = request.json
         filament_id = data.get('id')
         if not filament_id or filament_id in raft_node.filaments:
             return jsonify({'error': 'Invalid or duplicate filament ID'}), 400
 
-        command = {'op': 'add_filament', 'data': data}
-        if raft_node.apply_command(command):
-            return jsonify({'success': True}), 201
-        return jsonify({'error': 'Failed to replicate command'}), 500
+        return submit_command({'op': 'add_filament', 'data': data})
 
     @app.route('/api/v1/filaments', methods=['GET'])
     def get_filaments():
-        return jsonify([
-            {'id': fid, **fdata} for fid, fdata in raft_node.filaments.items()
-        ]), 200
+        ledger = raft_node.filament_ledger
+        return cached_json(lambda: [
+            {'id': fid, **fdata, **ledger.view(fid)} for fid, fdata in raft_node.filaments.items()
+        ])
+
+    @app.route('/api/v1/filaments/<filament_id>/reservations', methods=['POST'])
+    def reserve_filament(filament_id):
+        """Hold filament for a job that lives in another shard"""
+        if not raft_node.role == 'leader':
+            return not_leader()
+
+        duplicate = duplicate_response()
+        if duplicate:
+            return duplicate
+
+        data = request.json
+        job_id = data.get('job_id')
+        weight = data.get('weight')
+        if not job_id or not weight:
+            return jsonify({'error': 'Missing required fields'}), 400
+        if filament_id not in raft_node.filaments:
+            return jsonify({'error': 'Filament not found'}), 404
+
+        with raft_node.admission_lock:
+            if job_id in raft_node.filament_holds:
+                return jsonify({'success': True, 'duplicate': True}), 201
+            if not raft_node.filament_ledger.can_reserve(filament_id, weight):
+                available_weight = raft_node.filament_ledger.free(filament_id)
+                return jsonify({
+                    'error': f'Insufficient filament. Available: {available_weight}g, Required: {weight}g'
+                }), 400
+            return submit_command({'op': 'reserve_filament', 'data': {
+                'filament_id': filament_id, 'job_id': job_id, 'weight': weight
+            }})
+
+    @app.route('/api/v1/filaments/<filament_id>/reservations/<job_id>', methods=['PATCH'])
+    def settle_filament_reservation(filament_id, job_id):
+        """Consume or release a hold once its job finishes, is cancelled or failed to be created"""
+        if not raft_node.role == 'leader':
+            return not_leader()
+
+        hold = raft_node.filament_holds.get(job_id)
+        if hold is None or hold['filament_id'] != filament_id:
+            return jsonify({'error': 'Reservation not found'}), 404
+        outcome = request.json.get('outcome')
+        if outcome not in ('consume', 'release'):
+            return jsonify({'error': 'Outcome must be consume or release'}), 400
+        if hold['status'] != 'Reserved':
+            return jsonify({'success': True, 'duplicate': True}), 200
+
+        return submit_command({'op': 'settle_filament_reservation', 'data': {
+            'filament_id': filament_id, 'job_id': job_id, 'outcome': outcome
+        }})
 
     # ------------------ JOBS ------------------
     @app.route('/api/v1/jobs', methods=['POST'])
     def create_job():
         if not raft_node.role == 'leader':
-            return jsonify({'error': 'This node is not the leader'}), 403
+            return not_leader()
+
+        duplicate = duplicate_response()
+        if duplicate:
+            return duplicate
 
         data = request.json
         job_id = data.get('id')
@@ -218,56 +616,248 @@ def create_raft_server(raft_node):
         filament_id = data.get('filament_id')
         filepath = data.get('filepath')
         weight = data.get('print_weight_in_grams')
+        # Set by the welcome server once the filament's own shard has reserved the weight
+        filament_group = data.get('filament_group')
 
         # Validation checks
-        if not all([job_id, printer_id, filament_id, filepath, weight]):
+        if not all([job_id, printer_id, filament_id, filepath]):
             return jsonify({'error': 'Missing required fields'}), 400
         if job_id in raft_node.jobs:
             return jsonify({'error': 'Job ID already exists'}), 409
         if printer_id not in raft_node.printers:
             return jsonify({'error': 'Printer not found'}), 404
-        if filament_id not in raft_node.filaments:
+        if filament_id not in raft_node.filaments and not filament_group:
             return jsonify({'error': 'Filament not found'}), 404
 
-        # Check printer availability
-        printer_busy = any(
-            job['printer_id'] == printer_id and job['status'] in ['Queued', 'Running']
-            for job in raft_node.jobs.values()
-        )
-        if printer_busy:
-            return jsonify({'error': 'Printer is currently busy'}), 400
-
-        # Calculate available filament weight
-        filament = raft_node.filaments[filament_id]
-        queued_weight = sum(
-            job['print_weight_in_grams']
-            for job in raft_node.jobs.values()
-            if job['filament_id'] == filament_id and job['status'] in ['Queued', 'Running']
-        )
-        available_weight = filament['remaining_weight'] - queued_weight
-
-        if weight > available_weight:
-            return jsonify({
-                'error': f'Insufficient filament. Available: {available_weight}g, Required: {weight}g'
-            }), 400
+        # A 'blob:<sha256>' filepath names an uploaded file; only that name goes into the log
+        digest = blob_digest(filepath)
+        if digest is not None and not blobs.has(digest):
+            if not blob_replicator.request(digest):
+                return jsonify({'error': 'G-code blob not found'}), 404
+            response = jsonify({'success': False, 'status': 'analyzing', 'error': 'Fetching G-code blob from peers'})
+            response.status_code = 202
+            response.headers['Retry-After'] = '1'
+            return response
+        local_path = blobs.path(digest) if digest is not None else filepath
+
+        # Weight and duration come from the G-code when the leader can read it; analysis runs in
+        # worker processes, so a file seen for the first time is admitted with the declared weight
+        # and corrected once analyzed, or, with no declared weight, retried by the client
+        analysis = gcode.lookup(local_path, on_done=lambda result: correct_job_estimate(job_id, result))
+        if analysis:
+            data.update(job_estimate(analysis, filament_id, filament_group, weight))
+            weight = data['print_weight_in_grams']
+        elif not weight:
+            if analysis is None:
+                response = jsonify({'success': False, 'status': 'analyzing', 'error': 'G-code analysis in progress'})
+                response.status_code = 202
+                response.headers['Retry-After'] = '1'
+                return response
+            return jsonify({'error': 'Missing required fields'}), 400
 
-        # Add job with initial status
-        data['status'] = 'Queued'
-        command = {'op': 'add_job', 'data': data}
-        if raft_node.apply_command(command):
-            return jsonify({'success': True}), 201
-        return jsonify({'error': 'Failed to replicate command'}), 500
+        # Availability checks and the reservation made by applying add_job must not
+        # interleave with another submission for the same printer or filament
+        with raft_node.admission_lock:
+            # A concurrent retry of the same request may have committed meanwhile
+            duplicate = duplicate_response()
+            if duplicate:
+                return duplicate
+            if job_id in raft_node.jobs:
+                return jsonify({'error': 'Job ID already exists'}), 409
+
+            # Check printer availability
+            if raft_node.printers[printer_id].get('status') == 'Busy':
+                return jsonify({'error': 'Printer is currently busy'}), 400
+            if raft_node.printers[printer_id].get('fault'):
+                return jsonify({'error': f"Printer reports a fault: {raft_node.printers[printer_id]['fault']}"}), 400
+
+            # Check unreserved filament weight
+            if not filament_group and not raft_node.filament_ledger.can_reserve(filament_id, weight):
+                available_weight = raft_node.filament_ledger.free(filament_id)
+                return jsonify({
+                    'error': f'Insufficient filament. Available: {available_weight}g, Required: {weight}g'
+                }), 400
+
+            # Add job with initial status
+            data['status'] = 'Queued'
+            result = submit_command({'op': 'add_job', 'data': data})
+
+        # An analysis that finished before add_job committed found no job to correct
+        if analysis is None and job_id in raft_node.jobs:
+            analysis = gcode.lookup(local_path)
+            if analysis:
+                correct_job_estimate(job_id, analysis)
+        return result
+
+    def job_estimate(analysis, filament_id, filament_group, declared_weight):
+        """Job fields from a G-code analysis, with the weight for the job's filament type"""
+        estimate = {
+            'estimated_seconds': analysis['estimated_seconds'],
+            'layers': analysis['layers'],
+            'gcode_sha256': analysis['sha256']
+        }
+        filament = raft_node.filaments.get(filament_id)
+        # Another shard already reserved the declared weight, so that one stands
+        if filament is not None and not filament_group:
+            grams = analysis['grams_by_type'].get(filament.get('type'))
+            if grams:
+                estimate['print_weight_in_grams'] = grams
+                if declared_weight and declared_weight != grams:
+                    estimate['declared_weight_in_grams'] = declared_weight
+        if 'print_weight_in_grams' not in estimate:
+            estimate['print_weight_in_grams'] = declared_weight or analysis['grams_by_type']['PLA']
+        return estimate
+
+    def correct_job_estimate(job_id, analysis):
+        """Replace a job's declared weight once its file is analyzed, off the analysis callback thread"""
+        estimates.put((job_id, analysis))
+
+    def commit_estimates():
+        """Propose the corrections of finished analyses, one at a time"""
+        while True:
+            job_id, analysis = estimates.get()
+            try:
+                propose_estimate(job_id, analysis)
+            except Exception as e:
+                log.error(f"❌ Failed to correct the estimate of job {job_id}: {str(e)}",
+                          event='job_estimate_failed', job_id=job_id)
+
+    threading.Thread(target=commit_estimates, name=f'{raft_node.log_name}-estimates', daemon=True).start()
+
+    def propose_estimate(job_id, analysis):
+        # Under the admission lock, so the capacity check is not raced by admissions
+        with raft_node.admission_lock:
+            job = raft_node.jobs.get(job_id)
+            if raft_node.role != 'leader' or job is None or job['status'] != 'Queued' or 'gcode_sha256' in job:
+                return
+            estimate = job_estimate(analysis, job['filament_id'], job.get('filament_group'),
+                                    job['print_weight_in_grams'])
+            extra = estimate['print_weight_in_grams'] - job['print_weight_in_grams']
+            if extra > 0 and not job.get('filament_group') and \
+                    not raft_node.filament_ledger.can_reserve(job['filament_id'], extra):
+                # The print would run out of filament other jobs have reserved meanwhile
+                log.warning(f"📐 Job {job_id} needs {estimate['print_weight_in_grams']}g per its G-code, "
+                            f"more than is free; cancelling it", event='job_estimate_over_capacity', job_id=job_id)
+                raft_node.apply_command({'op': 'update_job_status',
+                                         'data': {'job_id': job_id, 'status': 'Cancelled'}})
+                return
+            raft_node.apply_command({'op': 'set_job_estimate', 'data': {'job_id': job_id, **estimate}})
+        log.info(f"📐 Job {job_id} weighs {estimate['print_weight_in_grams']}g per its G-code",
+                 event='job_estimate_set', job_id=job_id)
+
+    @app.route('/api/v1/gcode/analysis', methods=['GET'])
+    def get_gcode_analysis():
+        """Analysis of a G-code file readable by this node; 202 while it is being analyzed"""
+        filepath = request.args.get('filepath')
+        if not filepath:
+            return jsonify({'error': 'Missing filepath'}), 400
+        analysis = gcode.lookup(filepath)
+        if analysis is False:
+            return jsonify({'error': 'File not found'}), 404
+        if analysis is None:
+            response = jsonify({'success': False, 'status': 'analyzing'})
+            response.status_code = 202
+            response.headers['Retry-After'] = '1'
+            return response
+        return jsonify(analysis), 200
+
+    # ------------------ BLOBS ------------------
+    @app.route('/blobs/uploads', methods=['POST'])
+    def create_upload():
+        """Start a chunked upload; chunks go to PATCH /blobs/uploads/<id> at the returned offset"""
+        return jsonify({'upload_id': blobs.create_upload(), 'offset': 0}), 201
+
+    @app.route('/blobs/uploads/<upload_id>', methods=['GET'])
+    def get_upload(upload_id):
+        """Bytes received so far, where an interrupted upload resumes"""
+        offset = blobs.upload_offset(upload_id)
+        if offset is None:
+            return jsonify({'error': 'Upload not found'}), 404
+        return jsonify({'upload_id': upload_id, 'offset': offset}), 200
+
+    @app.route('/blobs/uploads/<upload_id>', methods=['PATCH'])
+    def append_upload(upload_id):
+        """Append the request body at the Upload-Offset header; 409 with the current offset if it differs"""
+        offset = blobs.upload_offset(upload_id)
+        if offset is None:
+            return jsonify({'error': 'Upload not found'}), 404
+        try:
+            start = int(request.headers.get('Upload-Offset', offset))
+        except ValueError:
+            return jsonify({'error': 'Invalid Upload-Offset'}), 400
+        accepted, offset = blobs.append(upload_id, start, request.get_data())
+        return jsonify({'upload_id': upload_id, 'offset': offset}), 200 if accepted else 409
+
+    @app.route('/blobs/uploads/<upload_id>/complete', methods=['POST'])
+    def complete_upload(upload_id):
+        """Store a finished upload under its SHA-256, checked against the client's if given"""
+        if blobs.upload_offset(upload_id) is None:
+            return jsonify({'error': 'Upload not found'}), 404
+        expected = (request.get_json(silent=True) or {}).get('sha256')
+        try:
+            digest, size = blobs.complete(upload_id, expected.lower() if expected else None)
+        except ValueError as e:
+            blobs.discard(upload_id)
+            return jsonify({'error': str(e)}), 400
+        log.info(f"📦 Stored blob {digest[:12]} ({size} bytes)", event='blob_stored', digest=digest, size=size)
+        return jsonify({'sha256': digest, 'size': size, 'filepath': BLOB_PREFIX + digest}), 201
+
+    @app.route('/blobs/<digest>', methods=['GET'])
+    def get_blob(digest):
+        """Blob content, with Range support; peers fetch missing blobs from here a chunk at a time"""
+        if not DIGEST.match(digest) or not blobs.has(digest):
+            return jsonify({'error': 'Blob not found'}), 404
+        # The open file goes to the server's wsgi.file_wrapper, which uses sendfile where it can
+        response = send_file(os.path.abspath(blobs.path(digest)), mimetype='text/x-gcode',
+                             conditional=True, etag=digest, max_age=365 * 24 * 3600)
+        response.cache_control.immutable = True
+        return response
+
+    @app.route('/api/v1/plan', methods=['GET'])
+    def get_plan():
+        """When the active jobs finish, and a job-to-printer assignment that finishes them sooner.
+
+        What-if options: add_printers=<n> and restock=<filament>:<grams>,...;
+        default_job_seconds stands in for jobs without an estimate.
+        """
+        try:
+            add_printers = request.args.get('add_printers', 0, type=int)
+            default_seconds = float(request.args.get('default_job_seconds', DEFAULT_JOB_SECONDS))
+            restock = {}
+            for item in filter(None, request.args.get('restock', '').split(',')):
+                filament_id, grams = item.rsplit(':', 1)
+                restock[filament_id] = float(grams)
+        except ValueError:
+            return jsonify({'error': 'Expected add_printers=<n>, restock=<filament>:<grams>,...'}), 400
+        if not 0 <= add_printers <= 1000 or default_seconds <= 0:
+            return jsonify({'error': 'add_printers must be 0-1000 and default_job_seconds positive'}), 400
+
+        remaining = {fid: raft_node.filament_ledger.remaining(fid) for fid in raft_node.filaments}
+        plan = plan_queue(raft_node.printers, raft_node.jobs, remaining, progress=telemetry.progress(),
+                          add_printers=add_printers, restock=restock, default_job_seconds=default_seconds)
+        now = time.time()
+        plan['generated_at'] = now
+        plan['as_assigned']['drains_at'] = now + plan['as_assigned']['makespan_seconds']
+        plan['optimized']['drains_at'] = now + plan['optimized']['makespan_seconds']
+        plan['what_if'] = {'add_printers': add_printers, 'restock': restock}
+        return jsonify(plan), 200
 
     @app.route('/api/v1/jobs', methods=['GET'])
     def get_jobs():
-        return jsonify([
+        status = request.args.get('status')
+        return cached_json(lambda: [
             {'id': jid, **jdata} for jid, jdata in raft_node.jobs.items()
-        ]), 200
+            if status is None or jdata.get('status') == status
+        ])
 
     @app.route('/api/v1/jobs/<job_id>/status', methods=['PATCH'])
     def update_job_status(job_id):
         if not raft_node.role == 'leader':
-            return jsonify({'error': 'This node is not the leader'}), 403
+            return not_leader()
+
+        duplicate = duplicate_response()
+        if duplicate:
+            return duplicate
         
         if job_id not in raft_node.jobs:
             return jsonify({'error': 'Job not found'}), 404
@@ -289,43 +879,51 @@ def create_raft_server(raft_node):
                 'error': f'Invalid status transition: {current_status} → {new_status}'
             }), 400
 
-        # Check printer availability for 'Running' status
-        if new_status == 'Running':
-            printer_id = raft_node.jobs[job_id]['printer_id']
-            printer_busy = any(
-                j['printer_id'] == printer_id and j['status'] == 'Running'
-                for jid, j in raft_node.jobs.items()
-                if jid != job_id
-            )
-            if printer_busy:
-                return jsonify({'error': 'Printer is currently busy with another job'}), 400
-
-        command = {'op': 'update_job_status', 'data': {'job_id': job_id, 'status': new_status}}
-        if raft_node.apply_command(command):
-            return jsonify({'success': True}), 200
-        return jsonify({'error': 'Failed to replicate command'}), 500
+        # No printer check for 'Running': create_job admits a job only to an Available printer, which
+        # then stays Busy until the job is done or cancelled, so no other job of it can be running
+
+        return submit_command({'op': 'update_job_status', 'data': {'job_id': job_id, 'status': new_status}})
 
     @app.route('/logs/<int:from_index>', methods=['GET'])
     def get_logs(from_index):
-        """Get log entries from a specific index"""
-        missing_logs = [
-            log for log in raft_node.log_entries 
-            if log['index'] >= from_index
-        ]
-        return jsonify(missing_logs), 200
-
-    def find_current_leader():
-        """Find the current leader node by checking each peer"""
-        for peer_host, peer_port in raft_node.peers:
-            try:
-                response = requests.get(f'http://{peer_host}:{peer_port}/status', timeout=1)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('role') == 'leader':
-                        return peer_host, peer_port
-            except:
-                continue
-        return None, None
+        """Stream log entries from a specific index, at most max_bytes of them per response.
+
+        Entries are copied straight from the memory-mapped log file. X-Next-Index
+        tells the caller where the next page starts.
+        """
+        max_bytes = request.args.get('max_bytes', raft_node.log_page_bytes, type=int)
+        payloads = raft_node.wal.read_raw(from_index, max_bytes)
+
+        def generate():
+            yield b'['
+            for i, payload in enumerate(payloads):
+                yield b',' + payload if i else payload
+            yield b']'
+
+        return Response(generate(), mimetype='application/json', headers={
+            'X-Next-Index': str(from_index + len(payloads)),
+            'X-Log-Index': str(raft_node.log_index)
+        })
+
+    return app
+
+
+def create_sharded_server(raft_nodes):
+    """Serve the nodes of several Raft groups from one process, each under /groups/<group>"""
+    app = Flask(__name__)
+    app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
+        f'/groups/{node.group}': create_raft_server(node) for node in raft_nodes
+    })
+
+    @app.route('/groups', methods=['GET'])
+    def groups():
+        return jsonify({
+            node.group: {
+                'role': node.role,
+                'term': node.term,
+                'log_index': node.log_index,
+                'ready': node.ready.is_set()
+            } for node in raft_nodes
+        }), 200
 
-    load_all_state()
     return app
@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionTable:
+    """Bounded table of committed client request IDs.
+
+    Entries are recorded when a command carrying a ``request_id`` is applied, so
+    every node ends up with the same table and a new leader can still answer
+    retries of commands committed under the old one. Eviction happens only in
+    ``record``, against the timestamp of the entry being applied: the oldest
+    entries go once the table exceeds ``max_entries`` and entries expire
+    ``ttl`` seconds after they were applied. Lookups never change the table,
+    so it stays the same on every node.
+    """
+
+    def __init__(self, entries=None, max_entries=10000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        # Request threads look up and snapshot the table while the apply path records into it
+        self.lock = threading.Lock()
+        for request_id, entry in (entries or []):
+            self.entries[request_id] = entry
+
+    def record(self, request_id, op, applied_at=None, index=None, response=None):
+        """Remember a request applied at a log index, with the response its retries get.
+
+        The index tells a committed entry from one still in flight.
+        """
+        applied_at = applied_at if applied_at is not None else time.time()
+        with self.lock:
+            self.entries[request_id] = {'op': op, 'applied_at': applied_at, 'index': index, 'response': response}
+            self.entries.move_to_end(request_id)
+            self._evict(applied_at)
+
+    def __contains__(self, request_id):
+        with self.lock:
+            return request_id in self.entries
+
+    def lookup(self, request_id):
+        """Return the session entry for a committed request, or None"""
+        with self.lock:
+            return self.entries.get(request_id)
+
+    def _evict(self, now):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        # Entries are kept in the order they were recorded, so expired ones collect at the front
+        while self.entries:
+            request_id, entry = next(iter(self.entries.items()))
+            if now - entry['applied_at'] <= self.ttl:
+                break
+            del self.entries[request_id]
+
+    def to_list(self):
+        with self.lock:
+            return [[request_id, entry] for request_id, entry in self.entries.items()]
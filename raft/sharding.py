@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+import zlib
+
+from raft.storage import WriteAheadLog, atomic_write_json, decode_record
+
+
+class ShardMap:
+    """Which Raft group owns each printer, filament and job.
+
+    Kept in config/shards.json. ``groups`` names the consensus groups every
+    node process hosts; the welcome server records the owner of each record
+    it creates there so later requests for it go to the same group, and
+    ``reservations`` maps a job to the group holding its filament when that
+    is not the job's own group. Without the file (or with no groups listed)
+    the cluster runs a single group.
+
+    Each placement is appended to a log next to the file (config/shards.log),
+    so recording one costs a single small write however many there are. The
+    log is folded into the file once it holds more records than the map.
+    """
+
+    COLLECTIONS = ('printers', 'filaments', 'jobs', 'reservations')
+    COMPACT_MIN = 1000  # logged placements always allowed before compacting
+
+    def __init__(self, path='config/shards.json'):
+        self.path = path
+        self.log_path = f'{os.path.splitext(path)[0]}.log'
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = {}
+        self.groups = data.get('groups', [])
+        self.placement = {name: data.get(name, {}) for name in self.COLLECTIONS}
+        self.log = None  # Opened by the first placement, so processes that only read the groups never write it
+        self._replay()
+
+    @property
+    def sharded(self):
+        return bool(self.groups)
+
+    def group_of(self, collection, key):
+        """Group that owns a record, or None if it was never placed"""
+        return self.placement[collection].get(key)
+
+    def choose(self, key, requested=None):
+        """Group for a new record: the requested pool or site, else a stable hash of its ID"""
+        if requested is not None:
+            return requested if requested in self.groups else None
+        return self.groups[zlib.crc32(str(key).encode('utf-8')) % len(self.groups)]
+
+    def assign(self, collection, key, group):
+        with self.lock:
+            if self.placement[collection].get(key) == group:
+                return
+            self._record(collection, key, group)
+
+    def forget(self, collection, key):
+        """Drop a placement that is no longer needed, e.g. a settled filament hold"""
+        with self.lock:
+            if key in self.placement[collection]:
+                self._record(collection, key, None)
+
+    def _apply(self, collection, key, group):
+        if group is None:
+            self.placement[collection].pop(key, None)
+        else:
+            self.placement[collection][key] = group
+
+    def _replay(self):
+        """Apply the placements logged since the file was last compacted"""
+        try:
+            with open(self.log_path, 'rb') as f:
+                for line in f:
+                    record = decode_record(line)
+                    if record is None:
+                        break  # Torn by a crash mid-append; truncated when the log is next opened
+                    self._apply(*record)
+        except FileNotFoundError:
+            pass
+
+    def _record(self, collection, key, group):
+        """Apply and durably log one placement (None removes it), compacting when the log outgrows the map"""
+        self._apply(collection, key, group)
+        if self.log is None:
+            self.log = WriteAheadLog(self.log_path)
+            self.log.recover()
+        self.log.append([[collection, key, group]])
+        self.log.sync()
+        if len(self.log) > max(self.COMPACT_MIN, sum(len(p) for p in self.placement.values())):
+            # Replaying the log over the new file gives the same map, so a crash in between loses nothing
+            atomic_write_json(self.path, {'groups': self.groups, **self.placement})
+            self.log.rewrite([])
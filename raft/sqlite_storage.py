@@ -0,0 +1,282 @@
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS log (idx INTEGER PRIMARY KEY, entry BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS records (
+    collection TEXT NOT NULL,
+    key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (collection, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS records_by_seq ON records (collection, seq);
+"""
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+class SqliteLog:
+    """The Raft log as rows of a SQLite table keyed by log index.
+
+    Has the interface of WriteAheadLog: ``append`` inserts rows in an open
+    transaction and ``sync`` commits it, and reading from an index is a
+    range scan of the primary key.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.path = storage.path
+        self.count = None
+
+    def __len__(self):
+        if self.count is None:
+            self.recover()
+        return self.count
+
+    def recover(self):
+        with self.storage.lock:
+            self.count = self.storage.db.execute('SELECT COUNT(*) FROM log').fetchone()[0]
+        return self.count
+
+    def peek_last_index(self):
+        """Index of the last entry; rows are numbered by log index, so this is a key lookup"""
+        with self.storage.lock:
+            return self.storage.db.execute('SELECT MAX(idx) FROM log').fetchone()[0]
+
+    def append(self, entries):
+        """Insert entries; returns bytes written. Call sync() to commit them."""
+        rows = [_dumps(e).encode('utf-8') for e in entries]
+        with self.storage.lock:
+            self.storage.begin()
+            start = len(self)
+            self.storage.db.executemany('INSERT INTO log (idx, entry) VALUES (?, ?)',
+                                        ((start + i, row) for i, row in enumerate(rows)))
+            self.count += len(rows)
+        return sum(len(row) for row in rows)
+
+    def sync(self):
+        with self.storage.lock:
+            self.storage.commit()
+
+    def truncate(self, count):
+        """Cut the log back to its first count entries, e.g. after an append or commit failed"""
+        with self.storage.lock:
+            if self.storage.db.in_transaction:
+                self.storage.db.execute('ROLLBACK')
+            self.storage.begin()
+            self.storage.db.execute('DELETE FROM log WHERE idx >= ?', (count,))
+            self.storage.commit()
+        return self.recover()
+
+    def read_raw(self, start, max_bytes=None):
+        """JSON of the entries from start on, as bytes, stopping before max_bytes is exceeded.
+
+        At least one entry is returned when any exist, however large it is.
+        """
+        payloads = []
+        if start < 0:
+            return payloads
+        total = 0
+        with self.storage.lock:
+            for (entry,) in self.storage.db.execute('SELECT entry FROM log WHERE idx >= ? ORDER BY idx', (start,)):
+                if payloads and max_bytes is not None and total + len(entry) > max_bytes:
+                    break
+                payloads.append(entry)
+                total += len(entry)
+        return payloads
+
+    def read(self, start, max_bytes=1 << 20):
+        """Yield decoded entries from start to the end of the log, a page at a time"""
+        while True:
+            page = self.read_raw(start, max_bytes)
+            if not page:
+                return
+            for payload in page:
+                yield json.loads(payload)
+            start += len(page)
+
+    def rewrite(self, entries):
+        """Atomically replace the whole log with entries (any iterable), e.g. the leader's log.
+
+        The old log stays in place if ``entries`` raises before it is exhausted.
+        """
+        with self.storage.lock:
+            self.storage.commit()
+            self.storage.begin()
+            try:
+                self.storage.db.execute('DELETE FROM log')
+                count = 0
+                for entry in entries:
+                    self.storage.db.execute('INSERT INTO log (idx, entry) VALUES (?, ?)',
+                                            (count, _dumps(entry).encode('utf-8')))
+                    count += 1
+            except BaseException:
+                self.storage.db.execute('ROLLBACK')
+                raise
+            self.storage.commit()
+            self.count = count
+        return count
+
+    def close(self):
+        pass
+
+
+class SqliteStorage:
+    """Term and vote, state and log in one SQLite database in WAL mode.
+
+    State is stored one row per record. A snapshot given the keys changed
+    since the previous one upserts and deletes only those rows, so its cost
+    follows what changed rather than the size of the state. Commits are
+    fsynced (synchronous=FULL), matching the file engine's durability.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, previous=None):
+        self.path = path
+        self.created = not os.path.exists(path)
+        # One connection shared by the node's threads; ``lock`` serializes its use
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=FULL')
+        self.db.executescript(SCHEMA)
+        self.lock = threading.RLock()
+        self.stored = {}  # collection -> keys of its rows, known once the snapshot was loaded or saved whole
+        self.seq = self.db.execute('SELECT COALESCE(MAX(seq), 0) FROM records').fetchone()[0]
+        self.log = SqliteLog(self)
+        if self.created and previous is not None:
+            self.created = not self._import(previous)
+
+    def begin(self):
+        if not self.db.in_transaction:
+            self.db.execute('BEGIN')
+
+    def commit(self):
+        if self.db.in_transaction:
+            self.db.execute('COMMIT')
+
+    def _get(self, key):
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _put(self, key, value):
+        self.db.execute('INSERT INTO meta (key, value) VALUES (?, ?) '
+                        'ON CONFLICT (key) DO UPDATE SET value = excluded.value', (key, _dumps(value)))
+
+    def load_metadata(self):
+        with self.lock:
+            return self._get('metadata')
+
+    def save_metadata(self, metadata):
+        with self.lock:
+            self.begin()
+            self._put('metadata', metadata)
+            self.commit()
+
+    def has_snapshot(self):
+        with self.lock:
+            return self._get('snapshot') is not None
+
+    def load_snapshot(self):
+        """(log_index, collections) of the stored state, or None if none was saved"""
+        with self.lock:
+            header = self._get('snapshot')
+            if header is None:
+                return None
+            collections = {}
+            for name, shape in header['collections'].items():
+                rows = [(key, json.loads(value)) for key, value in self.db.execute(
+                    'SELECT key, value FROM records WHERE collection = ? ORDER BY seq', (name,))]
+                collections[name] = [list(row) for row in rows] if shape == 'pairs' else dict(rows)
+                self.stored[name] = {key for key, _ in rows}
+            return header['log_index'], collections
+
+    def save_snapshot(self, log_index, collections, changed=None):
+        """Store the state covering log entries [0, log_index).
+
+        ``changed`` maps collection names to the keys that may have changed
+        since the last snapshot; collections it leaves out are unchanged. With
+        None every collection is rewritten. Collections are dicts, or lists of
+        [key, value] pairs whose order is the order keys were last written.
+        """
+        with self.lock:
+            # Log rows appended but not yet synced are committed first, so a rollback cannot drop them
+            self.commit()
+            self.begin()
+            try:
+                shapes = {}
+                for name, value in collections.items():
+                    shapes[name] = 'pairs' if isinstance(value, list) else 'dict'
+                    records = dict(value) if shapes[name] == 'pairs' else value
+                    if changed is None or name not in self.stored:
+                        self._write_collection(name, records)
+                    else:
+                        self._update_collection(name, records, changed.get(name, ()), shapes[name] == 'pairs')
+                self._put('snapshot', {'log_index': log_index, 'collections': shapes})
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                self.stored = {}  # Rewrite everything next time rather than trust what was rolled back
+                raise
+            self.commit()
+
+    def _next_seq(self):
+        self.seq += 1
+        return self.seq
+
+    def _write_collection(self, name, records):
+        self.db.execute('DELETE FROM records WHERE collection = ?', (name,))
+        self.db.executemany('INSERT INTO records (collection, key, seq, value) VALUES (?, ?, ?, ?)',
+                            ((name, str(key), self._next_seq(), _dumps(value)) for key, value in records.items()))
+        self.stored[name] = {str(key) for key in records}
+
+    def _update_collection(self, name, records, keys, move_to_end):
+        stored = self.stored[name]
+        # Pairs are kept in the order keys were last written, dicts in the order they were added
+        on_conflict = 'seq = excluded.seq, value = excluded.value' if move_to_end else 'value = excluded.value'
+        if move_to_end:
+            keys = set(keys)
+            keys = [key for key in records if key in keys] + [key for key in keys if key not in records]
+        for key in keys:
+            if key in records:
+                self.db.execute('INSERT INTO records (collection, key, seq, value) VALUES (?, ?, ?, ?) '
+                                f'ON CONFLICT (collection, key) DO UPDATE SET {on_conflict}',
+                                (name, str(key), self._next_seq(), _dumps(records[key])))
+                stored.add(str(key))
+            elif str(key) in stored:
+                self.db.execute('DELETE FROM records WHERE collection = ? AND key = ?', (name, str(key)))
+                stored.discard(str(key))
+        if len(stored) != len(records):
+            # Something outside ``keys`` was added or removed, e.g. an evicted session
+            current = {str(key): key for key in records}
+            for key in stored - current.keys():
+                self.db.execute('DELETE FROM records WHERE collection = ? AND key = ?', (name, key))
+            for key in current.keys() - stored:
+                self.db.execute('INSERT INTO records (collection, key, seq, value) VALUES (?, ?, ?, ?)',
+                                (name, key, self._next_seq(), _dumps(records[current[key]])))
+            self.stored[name] = set(current)
+
+    def _import(self, previous):
+        """Copy what the file engine stored before this database existed; returns True if there was anything"""
+        metadata = previous.load_metadata()
+        snapshot = previous.load_snapshot()
+        entries = 0
+        if not previous.created:
+            previous.log.recover()
+            entries = self.log.rewrite(previous.log.read(0))
+        previous.close()
+        if metadata is not None:
+            self.save_metadata(metadata)
+        if snapshot is not None:
+            self.save_snapshot(*snapshot)
+        return bool(metadata or snapshot or entries)
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.db.close()
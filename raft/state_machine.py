@@ -0,0 +1,291 @@
+from raft.aggregates import Aggregates
+from raft.ledger import FilamentLedger, ACTIVE_JOB_STATUSES
+from raft.sessions import SessionTable
+
+# Command op -> handler(state, data, timestamp), filled in by @handler below
+HANDLERS = {}
+
+# Job fields derived from analyzing its G-code file
+JOB_ESTIMATE_FIELDS = ('estimated_seconds', 'layers', 'gcode_sha256')
+
+
+def handler(op):
+    """Register a function as the state change for a command op"""
+    def register(fn):
+        HANDLERS[op] = fn
+        return fn
+    return register
+
+
+class StateMachine:
+    """Printers, filaments and jobs, changed only by applying log entries.
+
+    Every node applies the same entries through the same handlers, and the
+    only time a handler sees is the timestamp the leader wrote into the
+    entry, so replaying a log gives identical state on every node.
+    """
+
+    def __init__(self, printers=None, filaments=None, jobs=None, filament_ledger=None, sessions=None,
+                 filament_holds=None):
+        self.printers = printers if printers is not None else {}
+        self.filaments = filaments if filaments is not None else {}
+        self.jobs = jobs if jobs is not None else {}
+        self.filament_ledger = filament_ledger if filament_ledger is not None else FilamentLedger()
+        self.sessions = sessions if sessions is not None else SessionTable()
+        # Reservations for jobs in another shard: job ID -> filament, weight and status
+        self.filament_holds = filament_holds if filament_holds is not None else {}
+        # Dashboard counters, derived from the collections and never persisted
+        self.aggregates = Aggregates()
+        self.aggregates.rebuild(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        ledger = FilamentLedger(data['filament_ledger']) if 'filament_ledger' in data else None
+        state = cls(data.get('printers', {}), data.get('filaments', {}), data.get('jobs', {}), ledger,
+                    sessions=SessionTable(data.get('sessions', [])),
+                    filament_holds=data.get('filament_holds', {}))
+        if ledger is None:
+            # Older state files have no ledger, derive it once from the job table
+            state.rebuild_derived()
+        return state
+
+    def to_dict(self):
+        return {
+            'printers': self.printers,
+            'filaments': self.filaments,
+            'jobs': self.jobs,
+            'filament_ledger': self.filament_ledger.to_dict(),
+            'sessions': self.sessions.to_list(),
+            'filament_holds': self.filament_holds
+        }
+
+    def apply(self, command, timestamp=None, index=None):
+        """Apply one command, the entry at ``index`` of the log; ops without a handler are ignored"""
+        request_id = command.get('request_id')
+        if request_id and request_id in self.sessions:
+            return  # A request logged twice, e.g. by concurrent retries, takes effect once
+        fn = HANDLERS.get(command.get('op'))
+        if fn is not None:
+            touched = self.touched(command)
+            before = self.aggregates.capture(self, *touched)
+            fn(self, command.get('data', {}), timestamp)
+            self.aggregates.update(before, self.aggregates.capture(self, *touched))
+        # Remember the client request ID of an applied command, and its response, for retry deduplication
+        if request_id:
+            self.sessions.record(request_id, command.get('op'), timestamp, index, command.get('response'))
+
+    def apply_entries(self, log_entries):
+        """Apply log entries in order, using the timestamp each was logged with; returns how many"""
+        applied = 0
+        for log_entry in log_entries:
+            self.apply(log_entry['command'], log_entry.get('timestamp'), log_entry.get('index'))
+            applied += 1
+        return applied
+
+    def rebuild_derived(self):
+        """Recompute filament reservations and printer status from the job table"""
+        self.filament_ledger = FilamentLedger.from_state(self.filaments, self.jobs)
+        for hold in self.filament_holds.values():
+            if hold['status'] == 'Reserved':
+                self.filament_ledger.reserve(hold['filament_id'], hold['weight'])
+        for printer in self.printers.values():
+            printer['status'] = 'Available'
+        for job in self.jobs.values():
+            if job.get('status') in ACTIVE_JOB_STATUSES and job.get('printer_id') in self.printers:
+                self.printers[job['printer_id']]['status'] = 'Busy'
+        self.aggregates.rebuild(self)
+
+    def reserve_job_resources(self, job):
+        """Reserve filament and mark the printer busy for a newly queued job"""
+        if not job.get('filament_group'):  # Otherwise reserved by the filament's own shard
+            self.filament_ledger.reserve(job['filament_id'], job['print_weight_in_grams'])
+        if job['printer_id'] in self.printers:
+            self.printers[job['printer_id']]['status'] = 'Busy'
+
+    def settle_job_resources(self, job, old_status, new_status):
+        """Consume or release a job's reservation once, when it leaves the active states"""
+        if old_status not in ACTIVE_JOB_STATUSES or new_status in ACTIVE_JOB_STATUSES:
+            return
+        if not job.get('filament_group'):
+            self.settle_filament(job['filament_id'], job['print_weight_in_grams'], new_status == 'Done')
+        if job['printer_id'] in self.printers:
+            self.printers[job['printer_id']]['status'] = 'Available'
+
+    def settle_filament(self, filament_id, weight, consumed):
+        """Turn a reservation into consumed weight, or drop it"""
+        if consumed:
+            self.filament_ledger.consume(filament_id, weight)
+            if filament_id in self.filaments:
+                self.filaments[filament_id]['remaining_weight'] = self.filament_ledger.remaining(filament_id)
+        else:
+            self.filament_ledger.release(filament_id, weight)
+
+    def touched(self, command):
+        """IDs of the printers, filaments and jobs a command can change"""
+        op = command.get('op')
+        data = command.get('data', {})
+        if op in ('add_printer', 'set_printer_fault'):
+            return [data.get('id')], [], []
+        if op == 'add_filament':
+            return [], [data.get('id')], []
+        if op in ('reserve_filament', 'settle_filament_reservation'):
+            return [], [data.get('filament_id')], []
+        job_id = data.get('id') if op == 'add_job' else data.get('job_id')
+        # A job being added is not in the table yet; its printer and filament are in the command
+        job = self.jobs.get(job_id) or (data if op == 'add_job' else None)
+        if job is None:
+            return [], [], []
+        return [job.get('printer_id')], [job.get('filament_id')], [job_id]
+
+    def changed_keys(self, command):
+        """Keys of each collection in to_dict() that applying a command may have changed"""
+        printer_ids, filament_ids, job_ids = self.touched(command)
+        keys = {'printers': printer_ids, 'filaments': filament_ids, 'filament_ledger': filament_ids, 'jobs': job_ids}
+        if command.get('op') in ('reserve_filament', 'settle_filament_reservation'):
+            keys['filament_holds'] = [command.get('data', {}).get('job_id')]
+        if command.get('request_id'):
+            keys['sessions'] = [command['request_id']]
+        return keys
+
+    def changed_records(self, command):
+        """Snapshot the printer, filament and job records touched by a command"""
+        printer_ids, filament_ids, job_ids = self.touched(command)
+        changes = {'printers': {}, 'filaments': {}, 'jobs': {}}
+        for job_id in job_ids:
+            if job_id in self.jobs:
+                changes['jobs'][job_id] = dict(self.jobs[job_id])
+        for printer_id in printer_ids:
+            if printer_id in self.printers:
+                changes['printers'][printer_id] = dict(self.printers[printer_id])
+        for filament_id in filament_ids:
+            if filament_id in self.filaments:
+                changes['filaments'][filament_id] = {
+                    **self.filaments[filament_id], **self.filament_ledger.view(filament_id)
+                }
+        return changes
+
+
+@handler('add_printer')
+def add_printer(state, data, timestamp):
+    state.printers[data.get('id')] = {
+        'company': data.get('company'),
+        'model': data.get('model'),
+        'status': 'Available',  # Track printer status
+        'added_at': timestamp
+    }
+
+
+@handler('set_printer_fault')
+def set_printer_fault(state, data, timestamp):
+    """Record the error a printer reports through telemetry, or clear it with a null fault"""
+    printer = state.printers.get(data.get('id'))
+    if printer is None:
+        return
+    if data.get('fault'):
+        printer['fault'] = data['fault']
+        printer['fault_at'] = timestamp
+    else:
+        printer.pop('fault', None)
+        printer.pop('fault_at', None)
+
+
+@handler('add_filament')
+def add_filament(state, data, timestamp):
+    filament_id = data.get('id')
+    if filament_id in state.filaments:
+        return  # Replayed add_filament entries must not reset consumed weight
+    total_weight = data.get('total_weight_in_grams')
+    remaining_weight = data.get('remaining_weight_in_grams')
+
+    # Validate weights
+    if remaining_weight > total_weight:
+        remaining_weight = total_weight
+
+    state.filaments[filament_id] = {
+        'type': data.get('type'),
+        'color': data.get('color'),
+        'total_weight': total_weight,
+        'remaining_weight': remaining_weight
+    }
+    state.filament_ledger.add_filament(filament_id, total_weight, remaining_weight)
+
+
+@handler('add_job')
+def add_job(state, data, timestamp):
+    job_id = data.get('id')
+    if job_id in state.jobs:
+        return  # Replayed add_job entries must not reserve filament twice
+    state.jobs[job_id] = {
+        'printer_id': data.get('printer_id'),
+        'filament_id': data.get('filament_id'),
+        'filepath': data.get('filepath'),
+        'print_weight_in_grams': data.get('print_weight_in_grams'),
+        'status': 'Queued',  # Always start as Queued
+        'created_at': timestamp
+    }
+    for key in JOB_ESTIMATE_FIELDS + ('filament_group', 'declared_weight_in_grams'):
+        if data.get(key) is not None:
+            state.jobs[job_id][key] = data[key]
+    state.reserve_job_resources(state.jobs[job_id])
+
+
+@handler('update_job_status')
+def update_job_status(state, data, timestamp):
+    job = state.jobs.get(data.get('job_id'))
+    if job is None:
+        return
+    old_status, new_status = job['status'], data.get('status')
+    job['status'] = new_status
+    state.settle_job_resources(job, old_status, new_status)
+    if new_status == 'Running' and old_status != 'Running':
+        job['started_at'] = timestamp
+    if new_status in ['Done', 'Cancelled']:
+        job['completed_at'] = timestamp
+
+
+@handler('set_job_estimate')
+def set_job_estimate(state, data, timestamp):
+    """Replace a queued job's declared weight with the one analyzed from its G-code"""
+    job = state.jobs.get(data.get('job_id'))
+    if job is None or job['status'] != 'Queued':
+        return
+    weight = data.get('print_weight_in_grams')
+    # A job in another shard than its filament keeps the weight that shard holds for it, and a
+    # heavier weight is only taken if the filament's free weight covers the difference
+    if weight is not None and weight != job['print_weight_in_grams'] and not job.get('filament_group') and \
+            (weight < job['print_weight_in_grams'] or
+             state.filament_ledger.can_reserve(job['filament_id'], weight - job['print_weight_in_grams'])):
+        state.filament_ledger.release(job['filament_id'], job['print_weight_in_grams'])
+        state.filament_ledger.reserve(job['filament_id'], weight)
+        job.setdefault('declared_weight_in_grams', job['print_weight_in_grams'])
+        job['print_weight_in_grams'] = weight
+    for key in JOB_ESTIMATE_FIELDS:
+        if data.get(key) is not None:
+            job[key] = data[key]
+
+
+@handler('reserve_filament')
+def reserve_filament(state, data, timestamp):
+    """Hold filament for a job whose printer is in another shard"""
+    job_id = data.get('job_id')
+    if job_id in state.filament_holds:
+        return  # Replayed or retried reservations hold the filament once
+    state.filament_holds[job_id] = {
+        'filament_id': data.get('filament_id'),
+        'weight': data.get('weight'),
+        'status': 'Reserved',
+        'created_at': timestamp
+    }
+    state.filament_ledger.reserve(data.get('filament_id'), data.get('weight'))
+
+
+@handler('settle_filament_reservation')
+def settle_filament_reservation(state, data, timestamp):
+    """Consume or release a hold once its job is done or cancelled, or was never created"""
+    hold = state.filament_holds.get(data.get('job_id'))
+    if hold is None or hold['status'] != 'Reserved':
+        return
+    consumed = data.get('outcome') == 'consume'
+    hold['status'] = 'Consumed' if consumed else 'Released'
+    hold['settled_at'] = timestamp
+    state.settle_filament(hold['filament_id'], hold['weight'], consumed)
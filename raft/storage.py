@@ -0,0 +1,293 @@
+import json
+import mmap
+import os
+import threading
+import zlib
+from array import array
+
+# Every persisted record is one line: 8 hex digits of CRC32, a space, compact JSON, newline.
+# A record that fails its checksum or lacks the newline was torn by a crash.
+RECORD_HEADER_SIZE = 9
+
+
+def encode_record(obj):
+    payload = json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return b'%08x ' % (zlib.crc32(payload) & 0xffffffff) + payload + b'\n'
+
+
+def decode_record(line):
+    """Return the object stored in a record line, or None if it is torn or corrupt"""
+    if len(line) <= RECORD_HEADER_SIZE or line[8:9] != b' ' or not line.endswith(b'\n'):
+        return None
+    payload = line[RECORD_HEADER_SIZE:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload) & 0xffffffff:
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def _fsync_dir(path):
+    """Persist a rename by syncing the directory that holds the file"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return  # Not supported on this platform
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, data, keep_previous=False):
+    """Replace path with data so readers see either the old or the new file, never a mix.
+
+    With keep_previous the replaced file is kept as ``path + '.prev'`` to fall
+    back on if the new one is found damaged.
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    if keep_previous and os.path.exists(path):
+        os.replace(path, f'{path}.prev')
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+def atomic_write_json(path, obj):
+    """Atomically write a human-readable JSON file such as peers.json"""
+    atomic_write(path, json.dumps(obj, indent=4).encode('utf-8'))
+
+
+def write_records(path, records, keep_previous=False):
+    atomic_write(path, b''.join(encode_record(r) for r in records), keep_previous)
+
+
+def read_records(path):
+    """Return every record in a file written by write_records, or None if any is damaged"""
+    try:
+        with open(path, 'rb') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return None
+    records = [decode_record(line) for line in lines]
+    if not records or any(r is None for r in records):
+        return None
+    return records
+
+
+def write_snapshot(path, log_index, collections):
+    """Write a state snapshot covering log entries [0, log_index).
+
+    The header record lists the collections that follow, one record each, so
+    a truncated snapshot is detected even when every record present is intact.
+    """
+    header = {'log_index': log_index, 'collections': list(collections)}
+    records = [header] + [{'name': name, 'value': value} for name, value in collections.items()]
+    write_records(path, records, keep_previous=True)
+
+
+def read_snapshot(path):
+    """Return (log_index, collections) from the newest intact snapshot at path, or None"""
+    for candidate in (path, f'{path}.prev'):
+        records = read_records(candidate)
+        if not records or 'collections' not in records[0]:
+            continue
+        header, body = records[0], records[1:]
+        if [r.get('name') for r in body] != header['collections']:
+            continue
+        return header['log_index'], {r['name']: r['value'] for r in body}
+    return None
+
+
+class WriteAheadLog:
+    """Append-only log file of checksummed entries.
+
+    Appends are a single write of whole records, and ``recover`` drops a torn
+    tail left by a crash mid-append so the file always ends on a record
+    boundary. Reads go through a memory map of the file and an index of each
+    record's byte offset, so entries are never all held in memory and reading
+    from an index costs only the entries returned.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.size = 0
+        self.offsets = array('Q')  # byte offset of each record, by log index
+        self.reader = None
+        self.map = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def recover(self):
+        """Index the valid prefix of the log, truncating anything after it"""
+        offsets = array('Q')
+        valid_size = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if decode_record(line) is None:
+                        break
+                    offsets.append(valid_size)
+                    valid_size += len(line)
+            if valid_size != os.path.getsize(self.path):
+                with open(self.path, 'r+b') as f:
+                    f.truncate(valid_size)
+        with self.lock:
+            self.file = open(self.path, 'ab')
+            self.reader = open(self.path, 'rb')
+            self.map = None
+            self.size = valid_size
+            self.offsets = offsets
+        return len(offsets)
+
+    def peek_last_index(self, window=1 << 16):
+        """Index of the last intact entry, read from the end of the file without scanning it"""
+        try:
+            with open(self.path, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(0, size - window))
+                lines = f.read().split(b'\n')
+        except FileNotFoundError:
+            return None
+        # The piece after the last newline is torn or empty; the first may start mid-record
+        candidates = lines[1 if size > window else 0:-1]
+        for line in reversed(candidates):
+            entry = decode_record(line + b'\n')
+            if entry is not None:
+                return entry.get('index')
+        return None
+
+    def append(self, entries):
+        """Write entries to the OS; returns bytes written. Call sync() to make them durable."""
+        records = [encode_record(e) for e in entries]
+        data = b''.join(records)
+        with self.lock:
+            self.file.write(data)
+            self.file.flush()
+            for record in records:
+                self.offsets.append(self.size)
+                self.size += len(record)
+        return len(data)
+
+    def _view(self):
+        """Memory map covering every appended record, remapped as the file grows"""
+        if self.map is None or len(self.map) < self.size:
+            self.map = mmap.mmap(self.reader.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def read_raw(self, start, max_bytes=None):
+        """JSON of the entries from start on, as bytes, stopping before max_bytes is exceeded.
+
+        At least one entry is returned when any exist, however large it is.
+        """
+        payloads = []
+        with self.lock:
+            if start >= len(self.offsets) or start < 0:
+                return payloads
+            view = self._view()
+            total = 0
+            for index in range(start, len(self.offsets)):
+                begin = self.offsets[index]
+                end = self.offsets[index + 1] if index + 1 < len(self.offsets) else self.size
+                if payloads and max_bytes is not None and total + end - begin > max_bytes:
+                    break
+                payloads.append(view[begin + RECORD_HEADER_SIZE:end - 1])
+                total += end - begin
+        return payloads
+
+    def read(self, start, max_bytes=1 << 20):
+        """Yield decoded entries from start to the end of the log, a page at a time"""
+        while True:
+            page = self.read_raw(start, max_bytes)
+            if not page:
+                return
+            for payload in page:
+                yield json.loads(payload)
+            start += len(page)
+
+    def rewrite(self, entries):
+        """Atomically replace the whole log with entries (any iterable), e.g. the leader's log"""
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            for entry in entries:
+                f.write(encode_record(entry))
+            f.flush()
+            os.fsync(f.fileno())
+        with self.lock:
+            self._close()
+            os.replace(tmp_path, self.path)
+        _fsync_dir(self.path)
+        return self.recover()
+
+    def sync(self):
+        os.fsync(self.file.fileno())
+
+    def truncate(self, count):
+        """Cut the log back to its first count entries, e.g. after an append or fsync failed.
+
+        Also drops the part of a record a failed write left behind, which the
+        offsets do not cover.
+        """
+        with self.lock:
+            size = self.offsets[count] if count < len(self.offsets) else self.size
+            self._close()
+            with open(self.path, 'r+b') as f:
+                f.truncate(size)
+                os.fsync(f.fileno())
+        return self.recover()
+
+    def _close(self):
+        for handle in (self.map, self.file, self.reader):
+            if handle is not None:
+                handle.close()
+        self.map = self.file = self.reader = None
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+
+class FileStorage:
+    """The default storage engine: term and vote, state snapshots and the log, each in its own file.
+
+    Every snapshot rewrites the whole state, so the keys changed since the
+    last one are not needed and ``changed`` is ignored.
+    """
+
+    name = 'file'
+
+    def __init__(self, meta_file, snapshot_file, log_file):
+        self.meta_file = meta_file
+        self.snapshot_file = snapshot_file
+        self.path = snapshot_file
+        self.created = not os.path.exists(log_file)  # no log existed before this process opened it
+        self.log = WriteAheadLog(log_file)
+
+    def load_metadata(self):
+        records = read_records(self.meta_file)
+        return records[0] if records else None
+
+    def save_metadata(self, metadata):
+        write_records(self.meta_file, [metadata])
+
+    def has_snapshot(self):
+        return os.path.exists(self.snapshot_file)
+
+    def load_snapshot(self):
+        """(log_index, collections) of the newest intact snapshot, or None"""
+        return read_snapshot(self.snapshot_file)
+
+    def save_snapshot(self, log_index, collections, changed=None):
+        write_snapshot(self.snapshot_file, log_index, collections)
+
+    def close(self):
+        self.log.close()
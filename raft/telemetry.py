@@ -0,0 +1,204 @@
+import threading
+import time
+
+import numpy as np
+
+# Numeric sample fields, stored as columns after the sample time
+FIELDS = ('nozzle_temp', 'bed_temp', 'progress')
+
+# Resolutions kept per printer: name, bucket seconds (0 for raw samples) and rows kept
+RESOLUTIONS = (('raw', 0, 512), ('10s', 10, 360), ('1m', 60, 720))
+
+UNCHANGED = object()  # A batch that says nothing about the printer's fault
+
+
+def phase_of(progress):
+    """What a printer's progress says it is doing: idle, printing or finished (None if not reported)"""
+    if np.isnan(progress):
+        return None
+    if progress <= 0:
+        return 'idle'
+    return 'finished' if progress >= 100 else 'printing'
+
+
+class RingBuffer:
+    """The last ``capacity`` rows written, in a preallocated array overwritten oldest first"""
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.data = np.full((capacity, width), np.nan)
+        self.written = 0  # rows ever written; the next one goes to written % capacity
+
+    def extend(self, rows):
+        # Rows that would be overwritten within this call are skipped
+        self.written += max(0, len(rows) - self.capacity)
+        rows = rows[-self.capacity:]
+        start = self.written % self.capacity
+        head = min(len(rows), self.capacity - start)
+        self.data[start:start + head] = rows[:head]
+        self.data[:len(rows) - head] = rows[head:]
+        self.written += len(rows)
+
+    def rows(self):
+        """Rows oldest first"""
+        if self.written <= self.capacity:
+            return self.data[:self.written].copy()
+        start = self.written % self.capacity
+        return np.concatenate([self.data[start:], self.data[:start]])
+
+
+class Downsampled:
+    """Mean and maximum of each field per time bucket; the newest bucket stays open until a later one starts"""
+
+    def __init__(self, seconds, capacity):
+        self.seconds = seconds
+        self.ring = RingBuffer(capacity, 1 + 2 * len(FIELDS))  # bucket start, means, maxima
+        self.bucket = None  # open bucket: its number, per-field sums, counts and maxima
+
+    def _rows(self, buckets, sums, counts, maxima):
+        """Stored rows for buckets given as a column of numbers and per-field 2-D sums, counts and maxima"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, sums / counts, np.nan)
+        return np.column_stack([buckets * float(self.seconds), means, np.where(counts > 0, maxima, np.nan)])
+
+    def _open_row(self):
+        bucket, sums, counts, maxima = self.bucket
+        return self._rows(np.array([bucket]), sums[None, :], counts[None, :], maxima[None, :])
+
+    def extend(self, times, values):
+        """Fold time-sorted samples into their buckets"""
+        buckets = np.floor(times / self.seconds).astype(np.int64)
+        if self.bucket is not None:
+            # Late samples count toward the open bucket; closed ones are never reopened
+            np.maximum(buckets, self.bucket[0], out=buckets)
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(buckets)) + 1])
+        present = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+        counts = np.add.reduceat(present.astype(np.int64), starts)
+        maxima = np.maximum.reduceat(np.where(present, values, -np.inf), starts)
+        numbers = buckets[starts]
+
+        if self.bucket is not None:
+            if numbers[0] == self.bucket[0]:
+                sums[0] += self.bucket[1]
+                counts[0] += self.bucket[2]
+                np.maximum(maxima[0], self.bucket[3], out=maxima[0])
+            else:
+                self.ring.extend(self._open_row())
+        if len(numbers) > 1:
+            self.ring.extend(self._rows(numbers[:-1], sums[:-1], counts[:-1], maxima[:-1]))
+        self.bucket = (numbers[-1], sums[-1], counts[-1], maxima[-1])
+
+    def rows(self):
+        rows = self.ring.rows()
+        if self.bucket is not None:
+            rows = np.concatenate([rows, self._open_row()])
+        return rows
+
+
+class PrinterTelemetry:
+    """One printer's samples at every resolution, plus what it last reported"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.raw = RingBuffer(RESOLUTIONS[0][2], 1 + len(FIELDS))
+        self.levels = {name: Downsampled(seconds, rows) for name, seconds, rows in RESOLUTIONS[1:]}
+        self.latest = None  # newest sample as a row
+        self.fault = None
+        self.phase = None  # None until the first sample, so the first batch always reports a phase
+
+    def ingest(self, rows, fault=UNCHANGED):
+        """Store a batch of rows; returns (fault, phase), each UNCHANGED/None unless it changed"""
+        with self.lock:
+            rows = rows[np.argsort(rows[:, 0], kind='stable')]
+            self.raw.extend(rows)
+            for level in self.levels.values():
+                level.extend(rows[:, 0], rows[:, 1:])
+            if self.latest is None or rows[-1, 0] >= self.latest[0]:
+                self.latest = rows[-1]
+
+            changed_fault = UNCHANGED
+            if fault is not UNCHANGED and fault != self.fault:
+                self.fault = changed_fault = fault
+            phase = phase_of(self.latest[1 + FIELDS.index('progress')]) or self.phase
+            changed_phase = phase if phase != self.phase else None
+            self.phase = phase
+            return changed_fault, changed_phase
+
+    def series(self, resolution='raw', since=None):
+        """Columns of the samples (or bucket means and maxima) at a resolution, oldest first"""
+        with self.lock:
+            rows = self.raw.rows() if resolution == 'raw' else self.levels[resolution].rows()
+        if since is not None:
+            rows = rows[rows[:, 0] >= since]
+        names = FIELDS if resolution == 'raw' else (
+            tuple(f'{f}_mean' for f in FIELDS) + tuple(f'{f}_max' for f in FIELDS))
+        # NaN is not valid JSON; a missing value is null
+        columns = {'t': rows[:, 0].tolist()}
+        for i, name in enumerate(names):
+            column = rows[:, 1 + i]
+            columns[name] = np.where(np.isnan(column), None, column).tolist()
+        return columns
+
+    def snapshot(self):
+        with self.lock:
+            latest = None if self.latest is None else {
+                't': float(self.latest[0]),
+                **{f: None if np.isnan(v) else float(v) for f, v in zip(FIELDS, self.latest[1:])}
+            }
+            return {'latest': latest, 'fault': self.fault, 'phase': self.phase}
+
+
+class TelemetryStore:
+    """Printer telemetry held in memory on the node that receives it, never in the Raft log.
+
+    Memory is bounded: every printer gets fixed-size buffers, and only
+    printers known to the state machine are tracked.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.printers = {}
+
+    def get(self, printer_id):
+        return self.printers.get(printer_id)
+
+    def progress(self):
+        """Latest progress each printer reported, for those that reported one"""
+        with self.lock:
+            printers = list(self.printers.items())
+        latest = {printer_id: printer.snapshot()['latest'] for printer_id, printer in printers}
+        return {pid: sample['progress'] for pid, sample in latest.items() if sample and sample['progress'] is not None}
+
+    def ingest(self, printer_id, rows, fault=UNCHANGED):
+        with self.lock:
+            printer = self.printers.get(printer_id)
+            if printer is None:
+                printer = self.printers[printer_id] = PrinterTelemetry()
+        return printer.ingest(rows, fault)
+
+
+def parse_samples(samples, now=None):
+    """Group a batch of sample dicts by printer into (rows, fault) pairs.
+
+    A sample's ``error`` sets the printer's fault, and an explicit null clears
+    it; samples without the key leave it as it is. Raises ValueError for a
+    malformed batch.
+    """
+    if not isinstance(samples, list):
+        raise ValueError('samples must be a list')
+    now = time.time() if now is None else now
+    grouped = {}
+    for sample in samples:
+        printer_id = sample.get('printer_id') if isinstance(sample, dict) else None
+        if not printer_id:
+            raise ValueError('Every sample needs a printer_id')
+        rows, fault = grouped.get(printer_id, ([], UNCHANGED))
+        rows.append([sample.get('t', now)] + [sample.get(f) for f in FIELDS])
+        if 'error' in sample:
+            fault = sample['error'] or None
+        grouped[printer_id] = (rows, fault)
+    try:
+        return {pid: (np.array(rows, dtype=float), fault) for pid, (rows, fault) in grouped.items()}
+    except (TypeError, ValueError):
+        raise ValueError('Sample times and fields must be numbers')
@@ -0,0 +1,286 @@
+import atexit
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+import requests
+
+# Configured from the environment so the GUI, welcome server and nodes export to the same place
+TRACE_EXPORT = os.environ.get('RAFT_TRACE_EXPORT', '')  # '' (off), 'file:<path>' or an OTLP/HTTP JSON URL
+TRACE_SAMPLE = float(os.environ.get('RAFT_TRACE_SAMPLE', '1.0'))  # fraction of new traces recorded
+
+_current = contextvars.ContextVar('raft_trace', default=None)  # SpanContext of the active span
+_setup_lock = threading.Lock()
+_exporter = None
+
+
+class SpanContext:
+    """What crosses process boundaries: the trace, the span to parent under and the sampling decision"""
+
+    __slots__ = ('trace_id', 'span_id', 'sampled')
+
+    def __init__(self, trace_id, span_id, sampled=True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value):
+    """SpanContext of a W3C traceparent header, or None if it is missing or malformed"""
+    parts = (value or '').strip().lower().split('-')
+    if len(parts) < 4 or parts[0] == 'ff' or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        if not int(parts[1], 16) or not int(parts[2], 16):
+            return None
+    except ValueError:
+        return None
+    return SpanContext(parts[1], parts[2], bool(flags & 1))
+
+
+def current():
+    return _current.get()
+
+
+def inject(headers, context=None):
+    """Add the traceparent of ``context`` (by default the active span) to a dict of outgoing headers"""
+    context = context or _current.get()
+    if context is not None:
+        headers['traceparent'] = context.traceparent()
+    return headers
+
+
+def extract(headers):
+    return parse_traceparent(headers.get('traceparent'))
+
+
+class Span:
+    """A timed operation; the active span while open, so spans started meanwhile become its children.
+
+    Use as a context manager, or call ``end`` from the same thread that
+    started it. Unsampled spans only carry the context along.
+    """
+
+    def __init__(self, tracer, name, context, parent_id, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = _current.set(context)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error=None):
+        if self._token is None:
+            return
+        duration = time.perf_counter() - self._started
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            pass  # Ended in another context, e.g. after a streamed response; that context ends with it
+        self._token = None
+        if self.context.sampled:
+            self.tracer.exporter.export({
+                'trace_id': self.context.trace_id,
+                'span_id': self.context.span_id,
+                'parent_id': self.parent_id,
+                'name': self.name,
+                'service': self.tracer.service,
+                'start': round(self.start, 6),
+                'duration_ms': round(duration * 1000, 3),
+                'attributes': self.attributes,
+                'error': None if error is None else f'{type(error).__name__}: {error}'
+            })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc)
+
+
+class _NoSpan:
+    """Stands in for a span when tracing is off or there is no trace to join"""
+
+    context = None
+
+    def set(self, **attributes):
+        pass
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """Starts spans for one service (a node, the welcome server, the GUI)"""
+
+    def __init__(self, service, exporter=None, sample=TRACE_SAMPLE):
+        self.service = service
+        self.exporter = exporter
+        self.sample = sample
+
+    @property
+    def enabled(self):
+        return self.exporter is not None
+
+    def span(self, name, parent=None, root=False, **attributes):
+        """Start a span under ``parent`` (by default the active span).
+
+        With no parent a new trace is started only when ``root`` is set, and
+        only for the sampled fraction of them; otherwise nothing is recorded,
+        so background work such as heartbeats stays out of the traces.
+        """
+        if self.exporter is None:
+            return NO_SPAN
+        parent = parent or _current.get()
+        if parent is None:
+            if not root:
+                return NO_SPAN
+            context = SpanContext(os.urandom(16).hex(), os.urandom(8).hex(), random.random() < self.sample)
+            return Span(self, name, context, None, attributes)
+        return Span(self, name, SpanContext(parent.trace_id, os.urandom(8).hex(), parent.sampled),
+                    parent.span_id, attributes)
+
+
+class SpanExporter:
+    """Writes finished spans in batches from a background thread.
+
+    ``target`` is 'file:<path>', which appends one JSON span per line, or the
+    URL of an OTLP/HTTP collector taking JSON. Spans are dropped, and
+    counted, rather than slowing requests down when the exporter falls behind.
+    """
+
+    def __init__(self, target, max_queue=10000, batch_size=512, interval=1.0):
+        self.target = target
+        self.batch_size = batch_size
+        self.interval = interval
+        self.spans = queue.Queue(max_queue)
+        self.dropped = 0
+        self.failed = 0
+        self.write_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True, name='trace-export')
+        self.thread.start()
+
+    def export(self, span):
+        try:
+            self.spans.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def _write(self, batch):
+        try:
+            if self.target.startswith('file:'):
+                with open(self.target[len('file:'):], 'a') as f:
+                    f.write(''.join(json.dumps(span, default=str) + '\n' for span in batch))
+            else:
+                requests.post(self.target, json=to_otlp(batch), timeout=5).raise_for_status()
+        except Exception:
+            self.failed += len(batch)
+
+    def flush(self):
+        """Write whatever is queued; also called at exit so the last requests' spans are kept"""
+        with self.write_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.spans.get_nowait())
+                    except queue.Empty:
+                        break
+                if batch:
+                    self._write(batch)
+                if len(batch) < self.batch_size:
+                    return
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(spans):
+    """Spans as an OTLP/JSON ExportTraceServiceRequest, one resource per service"""
+    by_service = {}
+    for span in spans:
+        by_service.setdefault(span['service'], []).append(span)
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service}}]},
+        'scopeSpans': [{'scope': {'name': 'raft'}, 'spans': [{
+            'traceId': span['trace_id'],
+            'spanId': span['span_id'],
+            'parentSpanId': span['parent_id'] or '',
+            'name': span['name'],
+            'startTimeUnixNano': str(int(span['start'] * 1e9)),
+            'endTimeUnixNano': str(int((span['start'] + span['duration_ms'] / 1000) * 1e9)),
+            'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in span['attributes'].items()],
+            'status': {'code': 2, 'message': span['error']} if span['error'] else {}
+        } for span in service_spans]}]
+    } for service, service_spans in by_service.items()]}
+
+
+def from_otlp(body):
+    """The spans of an OTLP/JSON export request, in the flat form the file exporter writes"""
+    spans = []
+    for resource in body.get('resourceSpans', []):
+        attributes = {a['key']: a['value'] for a in resource.get('resource', {}).get('attributes', [])}
+        service = attributes.get('service.name', {}).get('stringValue', 'unknown')
+        for scope in resource.get('scopeSpans', []):
+            for span in scope.get('spans', []):
+                start, end = int(span['startTimeUnixNano']), int(span['endTimeUnixNano'])
+                spans.append({
+                    'trace_id': span['traceId'],
+                    'span_id': span['spanId'],
+                    'parent_id': span.get('parentSpanId') or None,
+                    'name': span['name'],
+                    'service': service,
+                    'start': round(start / 1e9, 6),
+                    'duration_ms': round((end - start) / 1e6, 3),
+                    'attributes': {a['key']: next(iter(a['value'].values()), None)
+                                   for a in span.get('attributes', [])},
+                    'error': span.get('status', {}).get('message')
+                })
+    return spans
+
+
+def _configure():
+    global _exporter
+    with _setup_lock:
+        if _exporter is None and TRACE_EXPORT:
+            _exporter = SpanExporter(TRACE_EXPORT)
+            atexit.register(_exporter.flush)
+        return _exporter
+
+
+def get_tracer(service):
+    return Tracer(service, _configure())
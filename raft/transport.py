@@ -0,0 +1,235 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import requests
+
+from raft.storage import atomic_write_json
+
+
+class HttpTransport:
+    """Peer RPCs as HTTP requests to http://host:port/path"""
+
+    def request(self, method, host, port, path, json=None, timeout=None, headers=None):
+        return requests.request(method, f'http://{host}:{port}{path}', json=json, timeout=timeout, headers=headers)
+
+
+class PeersFile:
+    """Cluster membership shared through config/peers.json.
+
+    A peer's ``role`` is ``voter`` (the default when absent) or ``learner``:
+    learners receive the log but never vote or count toward a commit.
+
+    The parsed file is cached and read again only once it was replaced, which
+    every membership change does (see atomic_write_json), so the checks made
+    on each vote and status request cost a stat rather than a parse.
+    """
+
+    def __init__(self, path='config/peers.json'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.cached = None  # (identity of the file read, its parsed contents)
+
+    def _read(self):
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def _load(self):
+        """Contents of the file, shared between callers: never modify them"""
+        stat = os.stat(self.path)
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if self.cached is not None and self.cached[0] == key:
+                return self.cached[1]
+        data = self._read()
+        with self.lock:
+            self.cached = (key, data)
+        return data
+
+    def alive_members(self, host, port):
+        """Alive peers other than (host, port), as [host, port, role] triples"""
+        return [[peer['host'], peer['port'], peer.get('role', 'voter')] for peer in self._load().get('peers', [])
+                if peer.get('status') == 'alive' and not (peer['port'] == port and peer['host'] == host)]
+
+    def alive_peers(self, host, port):
+        """Alive peers other than (host, port), as [host, port] pairs"""
+        return [[h, p] for h, p, _ in self.alive_members(host, port)]
+
+    def role_of(self, host, port):
+        for peer in self._load().get('peers', []):
+            if peer['host'] == host and peer['port'] == port:
+                return peer.get('role', 'voter')
+        return 'voter'
+
+    def _update(self, host, port, key, value):
+        peers_data = self._read()
+        for peer in peers_data.get('peers', []):
+            if peer['host'] == host and peer['port'] == port and peer.get(key) != value:
+                peer[key] = value
+                atomic_write_json(self.path, peers_data)
+                return True
+        return False
+
+    def set_status(self, host, port, status):
+        """Update a peer's status; returns True if it changed"""
+        return self._update(host, port, 'status', status)
+
+    def set_role(self, host, port, role):
+        """Make a peer a voter or a learner; returns True if it changed"""
+        return self._update(host, port, 'role', role)
+
+
+class InMemoryResponse:
+    """The parts of requests.Response that RaftNode uses"""
+
+    def __init__(self, status_code, body, headers=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = headers or {}
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class InMemoryNetwork:
+    """In-process network of Raft servers with simulated latency, drops, crashes and partitions.
+
+    Each node's Flask app is registered under its address and requests are
+    dispatched to the app's test client on a worker thread, so a slow or
+    partitioned peer times out the caller just like a real socket would.
+    Failures raise the same requests exceptions as HttpTransport. All random
+    choices come from ``seed`` so runs are reproducible.
+    """
+
+    def __init__(self, seed=0, latency=0.0, jitter=0.0, drop_rate=0.0, max_workers=64):
+        self.random = random.Random(seed)
+        self.latency = latency  # seconds added to every request
+        self.jitter = jitter  # extra uniform delay in [0, jitter)
+        self.drop_rate = drop_rate  # fraction of requests that time out
+        self.apps = {}
+        self.down = set()
+        self.groups = {}  # address -> partition group, empty when the network is whole
+        self.membership = {}  # shared peers.json equivalent: address -> status
+        self.roles = {}  # address -> 'learner' for non-voting members; voters are absent
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='inmem-net')
+
+    def transport(self, host, port):
+        return InMemoryTransport(self, host, port)
+
+    def peer_table(self):
+        return PeerTable(self)
+
+    def join(self, host, port, role=None):
+        """Mark a node alive in the shared membership, as run_node does in peers.json"""
+        with self.lock:
+            self.membership[(host, port)] = 'alive'
+            if role == 'learner':
+                self.roles[(host, port)] = role
+
+    def register(self, host, port, app):
+        """Attach a node's server so requests to its address reach it"""
+        with self.lock:
+            self.apps[(host, port)] = app
+
+    def crash(self, host, port):
+        with self.lock:
+            self.down.add((host, port))
+
+    def recover(self, host, port):
+        with self.lock:
+            self.down.discard((host, port))
+        self.join(host, port)
+
+    def partition(self, *groups):
+        """Split the network; nodes in different groups (or in no group) cannot reach each other"""
+        with self.lock:
+            self.groups = {tuple(addr): i for i, group in enumerate(groups) for addr in group}
+
+    def heal(self):
+        with self.lock:
+            self.groups = {}
+
+    def _route(self, src, dst):
+        """Return the delay for a request, or the exception it fails with"""
+        with self.lock:
+            if dst not in self.apps or src in self.down or dst in self.down:
+                return requests.ConnectionError(f'{dst[0]}:{dst[1]} unreachable')
+            if self.groups and self.groups.get(src) != self.groups.get(dst):
+                return requests.ConnectionError(f'{dst[0]}:{dst[1]} partitioned')
+            if self.drop_rate and self.random.random() < self.drop_rate:
+                return requests.Timeout(f'{dst[0]}:{dst[1]} dropped')
+            return self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+
+    def send(self, src, method, host, port, path, json=None, timeout=None, headers=None):
+        dst = (host, int(port))
+        route = self._route(src, dst)
+        if isinstance(route, Exception):
+            raise route
+        app = self.apps[dst]
+
+        def deliver():
+            time.sleep(route)
+            response = app.test_client().open(path, method=method, json=json, headers=headers)
+            return InMemoryResponse(response.status_code, response.get_data(), dict(response.headers))
+
+        try:
+            return self.pool.submit(deliver).result(timeout=timeout)
+        except FutureTimeout:
+            raise requests.Timeout(f'{host}:{port} timed out')
+
+
+class InMemoryTransport:
+    """One node's endpoint on an InMemoryNetwork"""
+
+    def __init__(self, network, host, port):
+        self.network = network
+        self.address = (host, port)
+
+    def request(self, method, host, port, path, json=None, timeout=None, headers=None):
+        return self.network.send(self.address, method, host, port, path, json=json, timeout=timeout,
+                                 headers=headers)
+
+
+class PeerTable:
+    """Membership kept by an InMemoryNetwork instead of config/peers.json"""
+
+    def __init__(self, network):
+        self.network = network
+
+    def alive_members(self, host, port):
+        with self.network.lock:
+            return [[h, p, self.network.roles.get((h, p), 'voter')]
+                    for (h, p), status in self.network.membership.items()
+                    if status == 'alive' and (h, p) != (host, port)]
+
+    def alive_peers(self, host, port):
+        return [[h, p] for h, p, _ in self.alive_members(host, port)]
+
+    def role_of(self, host, port):
+        with self.network.lock:
+            return self.network.roles.get((host, port), 'voter')
+
+    def set_role(self, host, port, role):
+        with self.network.lock:
+            if self.network.roles.get((host, port), 'voter') == role:
+                return False
+            if role == 'learner':
+                self.network.roles[(host, port)] = role
+            else:
+                self.network.roles.pop((host, port), None)
+            return True
+
+    def set_status(self, host, port, status):
+        with self.network.lock:
+            if self.network.membership.get((host, port), status) == status:
+                return False
+            self.network.membership[(host, port)] = status
+            return True
@@ -2,7 +2,9 @@ import sys
 import json
 import signal
 from raft.node import RaftNode
-from raft.server import create_raft_server
+from raft.server import create_raft_server, create_sharded_server
+from raft.sharding import ShardMap
+from raft.storage import atomic_write_json
 import threading
 import time
 import atexit
@@ -26,6 +28,16 @@ def create_node_config(port):
     print(f"[node_{port}] ✨ Created new node configuration at {config_path}")
     return config
 
+# Write admission limits and the low-stock threshold a node's config file may set (see RaftNode for the defaults)
+NODE_SETTINGS = ('max_inflight_proposals', 'max_queued_proposals', 'proposal_wait_timeout',
+                 'client_rate', 'client_burst', 'low_stock_grams')
+
+def configure_node(raft_node, config):
+    for key in NODE_SETTINGS:
+        if key in config:
+            setattr(raft_node, key, config[key])
+    return raft_node
+
 def update_peer_status(host, port, status):
     peers_file = 'config/peers.json'
     try:
@@ -38,9 +50,8 @@ def update_peer_status(host, port, status):
                 peer['status'] = status
                 break
         
-        with open(peers_file, 'w') as f:
-            json.dump(peers_data, f, indent=4)
-            print(f"[{node_id}] 📝 Updated peer {host}:{port} status to {status}")
+        atomic_write_json(peers_file, peers_data)
+        print(f"[{node_id}] 📝 Updated peer {host}:{port} status to {status}")
     except Exception as e:
         print(f"[{node_id}] ❌ Error updating peer status: {str(e)}")
 
@@ -61,11 +72,15 @@ def register_peer(node_info):
         "status": "alive"
     }
     
+    # Learners replicate the log and serve reads without voting; otherwise keep the existing role
+    if node_info.get('role'):
+        new_peer['role'] = node_info['role']
+
     # Check if peer already exists
     peer_exists = False
     for peer in peers_data['peers']:
         if peer['host'] == new_peer['host'] and peer['port'] == new_peer['port']:
-            peer['status'] = "alive"  # Update existing peer status
+            peer.update(new_peer)  # Update existing peer status
             peer_exists = True
             break
     
@@ -73,8 +88,7 @@ def register_peer(node_info):
         peers_data['peers'].append(new_peer)
     
     try:
-        with open(peers_file, 'w') as f:
-            json.dump(peers_data, f, indent=4)
+        atomic_write_json(peers_file, peers_data)
         print(f"[{node_id}] ✅ Successfully registered peer: {new_peer}")
     except Exception as e:
         print(f"[{node_id}] ❌ Error writing to {peers_file}: {str(e)}")
@@ -91,20 +105,14 @@ def cleanup():
     update_peer_status(host, port, "dead")
     print(f"\n[{node_id}] 💀 Node marked as dead in peers.json")
 
-# Register cleanup handler
-atexit.register(cleanup)
-
 # Handle SIGINT (Ctrl+C) and SIGTERM
 def signal_handler(signum, frame):
     print(f"\n[{node_id}] ⚡ Received termination signal")
     sys.exit(0)  # This will trigger the cleanup handler
 
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
-
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python run_node.py <port>")
+    if len(sys.argv) not in (2, 3) or (len(sys.argv) == 3 and sys.argv[2] != '--learner'):
+        print("Usage: python run_node.py <port> [--learner]")
         sys.exit(1)
 
     try:
@@ -125,18 +133,34 @@ if __name__ == "__main__":
     host = config['host']
     port = config['port']
 
+    # Registered here rather than on import, since worker processes (G-code analysis) import this module
+    atexit.register(cleanup)
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
     # Register this node and get updated peers list
-    peers = register_peer({"host": host, "port": port})
+    peers = register_peer({"host": host, "port": port, "role": "learner" if "--learner" in sys.argv else None})
     print(f"[{node_id}] 📋 Initial peers list: {peers}")
 
     # Ensure logs directory exists
     os.makedirs('logs', exist_ok=True)
     
-    # Start Raft node
-    raft_node = RaftNode(node_id=node_id, peers=peers, host=host, port=port)
+    # 'file' (the default) or 'sqlite'; a new SQLite database takes over what the files held
+    storage = config.get('storage', 'file')
+
+    # Start a Raft node for each group listed in config/shards.json, or a single one
+    groups = ShardMap().groups
+    if groups:
+        raft_nodes = [configure_node(RaftNode(node_id=node_id, peers=peers, host=host, port=port, group=group,
+                                              storage=storage), config)
+                      for group in groups]
+        app = create_sharded_server(raft_nodes)
+        print(f"[{node_id}] 🧩 Hosting Raft groups: {', '.join(groups)}")
+    else:
+        raft_node = configure_node(RaftNode(node_id=node_id, peers=peers, host=host, port=port, storage=storage), config)
+        app = create_raft_server(raft_node)
 
     # Start Flask server
-    app = create_raft_server(raft_node)
     threading.Thread(target=lambda: app.run(host=host, port=port), daemon=True).start()
 
     print(f"[{node_id}] 🚀 Node started with peers: {peers}")
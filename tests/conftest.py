@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Quiet node logging; must be set before raft modules load
+os.environ.setdefault('RAFT_LOG_LEVEL', 'ERROR')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
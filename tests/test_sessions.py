@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from benchmarks.raft_bench import LocalCluster
+from raft.sessions import SessionTable
+from raft.state_machine import StateMachine
+from raft.transport import InMemoryNetwork
+
+
+def test_lookup_does_not_change_the_table():
+    sessions = SessionTable(ttl=10)
+    sessions.record('a', 'add_printer', applied_at=0, index=0)
+    sessions.record('b', 'add_printer', applied_at=5, index=1)
+    assert sessions.lookup('a')['index'] == 0
+    assert [request_id for request_id, _ in sessions.to_list()] == ['a', 'b']
+
+
+def test_entries_expire_by_the_applied_timestamp():
+    sessions = SessionTable(max_entries=2, ttl=10)
+    sessions.record('a', 'add_printer', applied_at=0)
+    sessions.record('b', 'add_printer', applied_at=5)
+    sessions.record('c', 'add_printer', applied_at=12)  # 'a' is past its ttl at this entry's time
+    assert [request_id for request_id, _ in sessions.to_list()] == ['b', 'c']
+    sessions.record('d', 'add_printer', applied_at=13)  # over max_entries
+    assert [request_id for request_id, _ in sessions.to_list()] == ['c', 'd']
+
+
+def test_a_request_logged_twice_applies_once():
+    state = StateMachine()
+    state.apply({'op': 'add_filament', 'data': {'id': 'f1', 'type': 'PLA', 'total_weight_in_grams': 100,
+                                                'remaining_weight_in_grams': 100}}, 1, 0)
+    add_job = {'op': 'add_job', 'request_id': 'r1', 'data': {
+        'id': 'j1', 'printer_id': 'p1', 'filament_id': 'f1', 'filepath': 'x.gcode', 'print_weight_in_grams': 10}}
+    state.apply(add_job, 2, 1)
+    state.jobs.clear()  # Would let add_job reserve again if it were applied a second time
+    state.apply(add_job, 3, 2)
+    assert state.filament_ledger.entries['f1']['reserved'] == 10
+    assert state.sessions.lookup('r1')['index'] == 1
+
+
+@pytest.fixture(scope='module')
+def cluster(tmp_path_factory):
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('cluster'))  # Nodes keep their files in the working directory
+    cluster = LocalCluster(3, InMemoryNetwork())
+    cluster.wait_for_leader()
+    yield cluster
+    for port in cluster.ports:
+        cluster.kill(port)
+    os.chdir(cwd)
+
+
+def post_printer(cluster, printer_id, request_id):
+    client = cluster.clients[cluster.leader()]
+    return client.post('/api/v1/printers', json={'id': printer_id, 'company': 'a', 'model': 'm'},
+                       headers={'X-Request-ID': request_id})
+
+
+def test_retry_of_a_committed_request_gets_its_response(cluster):
+    assert post_printer(cluster, 'p1', 'r-p1').status_code == 201
+    retry = post_printer(cluster, 'p1', 'r-p1')
+    assert retry.status_code == 201
+    assert retry.get_json() == {'success': True, 'duplicate': True}
+
+
+def test_retry_of_a_request_that_failed_to_commit_is_not_a_success(cluster, monkeypatch):
+    leader = cluster.nodes[cluster.leader()]
+    monkeypatch.setattr(leader, 'replicate_command', lambda log_entry: False)
+    assert post_printer(cluster, 'p2', 'r-p2').status_code == 500
+    assert post_printer(cluster, 'p2', 'r-p2').status_code == 500
+
+    monkeypatch.undo()
+    retry = post_printer(cluster, 'p2', 'r-p2')
+    assert retry.status_code == 201
+    assert retry.get_json()['duplicate']
+    assert leader.commit_index > leader.sessions.lookup('r-p2')['index']
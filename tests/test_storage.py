@@ -0,0 +1,140 @@
+import os
+
+import pytest
+
+from raft.sqlite_storage import SqliteStorage
+from raft.storage import FileStorage, WriteAheadLog, encode_record, read_snapshot, write_snapshot
+
+
+def entries(start, count):
+    return [{'index': i, 'term': 1, 'command': {'op': 'add_printer', 'data': {'id': f'p{i}'}}}
+            for i in range(start, start + count)]
+
+
+def open_log(path):
+    wal = WriteAheadLog(str(path))
+    wal.recover()
+    return wal
+
+
+def test_wal_recover_truncates_torn_tail(tmp_path):
+    path = tmp_path / 'log.wal'
+    wal = open_log(path)
+    wal.append(entries(0, 3))
+    wal.sync()
+    valid_size = os.path.getsize(path)
+    wal.close()
+    # A crash mid-append leaves part of a record behind
+    with open(path, 'ab') as f:
+        f.write(encode_record(entries(3, 1)[0])[:20])
+
+    wal = open_log(path)
+    assert len(wal) == 3
+    assert os.path.getsize(path) == valid_size
+    wal.append(entries(3, 1))
+    wal.sync()
+    assert [e['index'] for e in wal.read(0)] == [0, 1, 2, 3]
+    assert wal.peek_last_index() == 3
+
+
+def test_wal_recover_stops_at_corrupt_record(tmp_path):
+    path = tmp_path / 'log.wal'
+    wal = open_log(path)
+    wal.append(entries(0, 3))
+    wal.sync()
+    wal.close()
+    data = bytearray(path.read_bytes())
+    second = data.index(b'\n') + 1
+    data[second + 20] ^= 0x01  # Inside the second record's payload, so its checksum fails
+    path.write_bytes(bytes(data))
+
+    wal = open_log(path)
+    assert len(wal) == 1
+    assert [e['index'] for e in wal.read(0)] == [0]
+
+
+def test_wal_truncate_drops_unsynced_entries(tmp_path):
+    wal = open_log(tmp_path / 'log.wal')
+    wal.append(entries(0, 2))
+    wal.sync()
+    wal.append(entries(2, 2))
+    assert wal.truncate(2) == 2
+    wal.append(entries(2, 1))
+    wal.sync()
+    assert [e['index'] for e in wal.read(0)] == [0, 1, 2]
+
+
+def test_snapshot_falls_back_to_previous(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    write_snapshot(path, 5, {'printers': {'p1': {}}})
+    write_snapshot(path, 9, {'printers': {'p1': {}, 'p2': {}}})
+    assert read_snapshot(path)[0] == 9
+    # Damage the newest snapshot: its last record loses the newline it ends with
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 1)
+    assert read_snapshot(path) == (5, {'printers': {'p1': {}}})
+
+
+def open_engine(engine, tmp_path):
+    files = FileStorage(str(tmp_path / 'meta'), str(tmp_path / 'state.snap'), str(tmp_path / 'log.wal'))
+    return files if engine == 'file' else SqliteStorage(str(tmp_path / 'state.db'), previous=files)
+
+
+def reopen(storage, engine, tmp_path):
+    storage.close()
+    return open_engine(engine, tmp_path)
+
+
+COLLECTIONS = {
+    'printers': {'p1': {'status': 'Busy'}, 'p2': {'status': 'Available'}},
+    'jobs': {'j1': {'printer_id': 'p1', 'status': 'Queued'}},
+    'sessions': [['r2', {'op': 'add_job'}], ['r1', {'op': 'add_printer'}]]
+}
+
+
+@pytest.mark.parametrize('engine', ['file', 'sqlite'])
+def test_snapshot_round_trip(engine, tmp_path):
+    storage = open_engine(engine, tmp_path)
+    storage.save_metadata({'term': 3, 'voted_for': 'node_1'})
+    storage.save_snapshot(7, COLLECTIONS)
+
+    storage = reopen(storage, engine, tmp_path)
+    assert storage.load_metadata() == {'term': 3, 'voted_for': 'node_1'}
+    assert storage.load_snapshot() == (7, COLLECTIONS)
+    storage.close()
+
+
+@pytest.mark.parametrize('engine', ['file', 'sqlite'])
+def test_snapshot_of_changed_keys(engine, tmp_path):
+    storage = open_engine(engine, tmp_path)
+    storage.save_snapshot(7, {**COLLECTIONS, 'sessions': [['r0', {'op': 'add_filament'}], ['r1', {'op': 'add_printer'}],
+                                                          ['r2', {'op': 'add_job'}]]})
+    collections = {
+        'printers': {'p1': {'status': 'Available'}, 'p3': {'status': 'Available'}},
+        'jobs': COLLECTIONS['jobs'],
+        # r1 written again moves to the end; r0 was evicted without being listed as changed
+        'sessions': [['r2', {'op': 'add_job'}], ['r1', {'op': 'add_printer', 'again': True}]]
+    }
+    storage.save_snapshot(9, collections, changed={'printers': {'p1', 'p2', 'p3'}, 'sessions': {'r1'}})
+
+    storage = reopen(storage, engine, tmp_path)
+    assert storage.load_snapshot() == (9, collections)
+    storage.close()
+
+
+def test_sqlite_imports_what_the_file_engine_stored(tmp_path):
+    files = open_engine('file', tmp_path)
+    files.save_metadata({'term': 2, 'voted_for': None})
+    files.save_snapshot(2, COLLECTIONS)
+    files.log.recover()
+    files.log.append(entries(0, 4))
+    files.log.sync()
+    files.close()
+
+    storage = open_engine('sqlite', tmp_path)
+    assert not storage.created
+    assert storage.load_metadata() == {'term': 2, 'voted_for': None}
+    assert storage.load_snapshot() == (2, COLLECTIONS)
+    assert list(storage.log.read(0)) == entries(0, 4)
+    assert storage.log.peek_last_index() == 3
+    storage.close()
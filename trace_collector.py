@@ -0,0 +1,210 @@
+"""Stand-in for an OpenTelemetry collector: receives the spans the cluster exports and explains slow requests.
+
+Start it, then point every process at it:
+
+    python trace_collector.py --port 4318 --output traces.jsonl
+    RAFT_TRACE_EXPORT=http://127.0.0.1:4318/v1/traces python run_node.py 5000
+
+It also reads what RAFT_TRACE_EXPORT=file:<path> wrote, without a server:
+
+    python trace_collector.py --report traces.jsonl
+"""
+import argparse
+import json
+import threading
+from collections import OrderedDict, defaultdict
+
+from flask import Flask, jsonify, request
+
+from raft.tracing import from_otlp
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+
+
+class TraceStore:
+    """The spans of the ``max_traces`` most recent traces, grouped by trace"""
+
+    def __init__(self, max_traces=10000):
+        self.max_traces = max_traces
+        self.lock = threading.Lock()
+        self.traces = OrderedDict()  # trace ID -> spans, least recently updated first
+
+    def add(self, spans):
+        with self.lock:
+            for span in spans:
+                self.traces.setdefault(span['trace_id'], []).append(span)
+                self.traces.move_to_end(span['trace_id'])
+            while len(self.traces) > self.max_traces:
+                self.traces.popitem(last=False)
+
+    def get(self, trace_id):
+        with self.lock:
+            return list(self.traces.get(trace_id, []))
+
+    def all(self):
+        with self.lock:
+            return {trace_id: list(spans) for trace_id, spans in self.traces.items()}
+
+
+def root_of(spans):
+    """The span no other span in the trace is a child of; the longest if the root was not exported"""
+    ids = {span['span_id'] for span in spans}
+    roots = [span for span in spans if span['parent_id'] not in ids]
+    return max(roots, key=lambda span: span['duration_ms']) if roots else None
+
+
+def span_tree(spans):
+    """Spans nested under their parents, each with its self time: what its children do not account for"""
+    children = defaultdict(list)
+    for span in spans:
+        children[span['parent_id']].append(span)
+    ids = {span['span_id'] for span in spans}
+
+    def node(span):
+        kids = sorted(children[span['span_id']], key=lambda s: s['start'])
+        return {**span, 'self_ms': self_time(span, kids), 'children': [node(kid) for kid in kids]}
+
+    return [node(span) for span in sorted(spans, key=lambda s: s['start']) if span['parent_id'] not in ids]
+
+
+def self_time(span, children):
+    """Time in a span outside its children, counting children that overlap (parallel RPCs) once"""
+    covered, end = 0.0, span['start']
+    for child in sorted(children, key=lambda s: s['start']):
+        child_end = child['start'] + child['duration_ms'] / 1000
+        if child_end > end:
+            covered += child_end - max(child['start'], end)
+            end = child_end
+    return round(max(0.0, span['duration_ms'] - covered * 1000), 3)
+
+
+def breakdown(traces, slowest=0.01):
+    """Per span name: latency percentiles, and where the slowest traces spent their time.
+
+    ``slowest`` is the fraction of traces, by root duration, counted as the
+    tail. A span's ``tail_self_ms`` is its mean self time in those traces;
+    compared with ``self_ms`` over all traces it shows which step makes them slow.
+    """
+    roots = {trace_id: root_of(spans) for trace_id, spans in traces.items()}
+    ranked = sorted((root['duration_ms'], trace_id) for trace_id, root in roots.items() if root)
+    tail = {trace_id for _, trace_id in ranked[len(ranked) - max(1, int(len(ranked) * slowest)):]} if ranked else set()
+
+    durations, self_all, self_tail = defaultdict(list), defaultdict(float), defaultdict(float)
+    for trace_id, spans in traces.items():
+        children = defaultdict(list)
+        for span in spans:
+            children[span['parent_id']].append(span)
+        for span in spans:
+            # Spans of the same name on different nodes are one step of the write path
+            name = span['name']
+            own = self_time(span, children[span['span_id']])
+            durations[name].append(span['duration_ms'])
+            self_all[name] += own
+            if trace_id in tail:
+                self_tail[name] += own
+
+    rows = []
+    for name, values in durations.items():
+        rows.append({
+            'span': name,
+            'count': len(values),
+            'p50_ms': percentile(values, 0.5),
+            'p99_ms': percentile(values, 0.99),
+            'max_ms': max(values),
+            'self_ms': round(self_all[name] / len(traces), 3),
+            'tail_self_ms': round(self_tail[name] / len(tail), 3) if tail else None
+        })
+    rows.sort(key=lambda row: -(row['tail_self_ms'] or 0))
+    return {
+        'traces': len(ranked),
+        'tail_traces': len(tail),
+        'p50_ms': percentile([d for d, _ in ranked], 0.5),
+        'p99_ms': percentile([d for d, _ in ranked], 0.99),
+        'spans': rows
+    }
+
+
+def create_collector(store, output=None):
+    app = Flask(__name__)
+    output_lock = threading.Lock()
+
+    @app.route('/v1/traces', methods=['POST'])
+    def receive():
+        """OTLP/HTTP with JSON bodies, as the cluster's exporter sends"""
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({'error': 'Expected an OTLP/JSON body'}), 400
+        try:
+            spans = from_otlp(body)
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Malformed span: {e}'}), 400
+        store.add(spans)
+        if output:
+            with output_lock, open(output, 'a') as f:
+                f.write(''.join(json.dumps(span) + '\n' for span in spans))
+        return jsonify({}), 200
+
+    @app.route('/traces', methods=['GET'])
+    def slowest_traces():
+        """The slowest traces received, by root span duration"""
+        limit = request.args.get('limit', 20, type=int)
+        roots = [(trace_id, root_of(spans), len(spans)) for trace_id, spans in store.all().items()]
+        roots = sorted((r for r in roots if r[1]), key=lambda r: -r[1]['duration_ms'])[:limit]
+        return jsonify([{'trace_id': trace_id, 'name': root['name'], 'service': root['service'],
+                         'start': root['start'], 'duration_ms': root['duration_ms'], 'spans': spans}
+                        for trace_id, root, spans in roots])
+
+    @app.route('/traces/<trace_id>', methods=['GET'])
+    def get_trace(trace_id):
+        spans = store.get(trace_id)
+        if not spans:
+            return jsonify({'error': 'Trace not found'}), 404
+        return jsonify({'trace_id': trace_id, 'spans': span_tree(spans)})
+
+    @app.route('/breakdown', methods=['GET'])
+    def get_breakdown():
+        slowest = request.args.get('slowest', 0.01, type=float)
+        if not 0 < slowest <= 1:
+            return jsonify({'error': 'slowest must be a fraction in (0, 1]'}), 400
+        return jsonify(breakdown(store.all(), slowest))
+
+    return app
+
+
+def read_spans(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def print_report(report):
+    print(f"{report['traces']} traces, p50 {report['p50_ms']} ms, p99 {report['p99_ms']} ms; "
+          f"the slowest {report['tail_traces']} spent their time in:")
+    print(f"{'span':<40} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'self ms':>9} {'tail self':>10}")
+    for row in report['spans']:
+        print(f"{row['span'][:40]:<40} {row['count']:>7} {row['p50_ms']:>9} "
+              f"{row['p99_ms']:>9} {row['self_ms']:>9} {row['tail_self_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Collect and analyze the spans the cluster exports')
+    parser.add_argument('--port', type=int, default=4318, help='Port of the OTLP/HTTP endpoint')
+    parser.add_argument('--output', help='Also append received spans to this JSON-lines file')
+    parser.add_argument('--max-traces', type=int, default=10000, help='Traces kept in memory')
+    parser.add_argument('--report', metavar='FILE', help='Print a latency breakdown of a span file and exit')
+    parser.add_argument('--slowest', type=float, default=0.01, help='Fraction of traces counted as the tail')
+    args = parser.parse_args()
+
+    if args.report:
+        traces = defaultdict(list)
+        for span in read_spans(args.report):
+            traces[span['trace_id']].append(span)
+        print_report(breakdown(traces, args.slowest))
+        return
+    create_collector(TraceStore(args.max_traces), args.output).run(host='127.0.0.1', port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
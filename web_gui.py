@@ -1,14 +1,33 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, redirect, url_for, flash
 import requests
 import json
+import time
+import uuid
 from datetime import datetime
+from client import ClusterView, retry_after
+from raft.tracing import get_tracer, inject
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key'  # Required for flash messages
+tracer = get_tracer('web_gui')
 
 # Welcome server URL
 WELCOME_SERVER_URL = "http://127.0.0.1:5100"
 
+# Requests are retried on these proxy errors, writes under the same request ID.
+# Reads also retry a 404, which the proxy returns while no leader is known; a
+# write's 404 is an answer (e.g. no such job), and retrying it cannot change it.
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+RETRYABLE_STATUS = {404, 429, 502, 503, 504}
+WRITE_RETRYABLE_STATUS = RETRYABLE_STATUS - {404}
+
+# Last body and ETag per GET endpoint, revalidated with If-None-Match
+etag_cache = {}
+
+# Local materialized view fed by the cluster's watch API; pages read from it
+view = ClusterView(WELCOME_SERVER_URL)
+
 def get_client():
     """Get status and connection info from welcome server"""
     try:
@@ -19,45 +38,69 @@ def get_client():
 
 def make_api_request(method, endpoint, data=None):
     """Make API request through welcome server proxy"""
-    try:
-        url = f"{WELCOME_SERVER_URL}/proxy/{endpoint}"
-        if method == "GET":
-            response = requests.get(url)
-        else:
-            response = requests.request(method, url, json=data)
-        return response.json() if response.status_code == 200 else None
-    except requests.RequestException:
-        return None
+    url = f"{WELCOME_SERVER_URL}/proxy/{endpoint}"
+    headers = {} if method == "GET" else {'X-Request-ID': str(uuid.uuid4())}
+    retryable = RETRYABLE_STATUS if method == "GET" else WRITE_RETRYABLE_STATUS
+    # One trace per call; every attempt carries it, so retries show up as siblings under it
+    with tracer.span(f'{method} {endpoint}', root=True):
+        inject(headers)
+        for attempt in range(MAX_RETRIES + 1):
+            delay = RETRY_BACKOFF * (2 ** attempt)
+            try:
+                if method == "GET":
+                    cached = etag_cache.get(endpoint)
+                    if cached:
+                        headers['If-None-Match'] = cached[0]
+                    response = requests.get(url, headers=headers, timeout=10)
+                    if response.status_code == 304 and cached:
+                        return cached[1]
+                else:
+                    response = requests.request(method, url, json=data, headers=headers, timeout=10)
+                if response.status_code not in retryable or attempt == MAX_RETRIES:
+                    body = response.json() if response.ok else None
+                    if method == "GET" and response.status_code == 200 and 'ETag' in response.headers:
+                        etag_cache[endpoint] = (response.headers['ETag'], body)
+                    return body
+                delay = max(delay, retry_after(response))  # Overloaded leaders say when to come back
+            except requests.RequestException:
+                if attempt == MAX_RETRIES:
+                    return None
+            time.sleep(delay)
+
+def read_collection(name):
+    """Read printers/filaments/jobs from the local view, falling back to the leader"""
+    if view.ready.is_set():
+        return getattr(view, name)()
+    return make_api_request("GET", f"api/v1/{name}") or []
+
+def write_and_wait(method, endpoint, data):
+    """Send a write and give the view a moment to catch up so the redirect shows it"""
+    version = view.version
+    response = make_api_request(method, endpoint, data)
+    if response and response.get('success') and view.ready.is_set():
+        view.wait_for_change(version, timeout=2)
+    return response
 
 @app.route('/')
 def index():
     """Dashboard page"""
     status = get_client()
-    printers = make_api_request("GET", "api/v1/printers") or []
-    jobs = make_api_request("GET", "api/v1/jobs") or []
-    filaments = make_api_request("GET", "api/v1/filaments") or []
-    
-    # Calculate statistics
-    active_jobs = sum(1 for job in jobs if job['status'] in ['Queued', 'Running'])
-    available_printers = sum(1 for printer in printers)
-    filament_stats = {
-        'total': len(filaments),
-        'low': sum(1 for f in filaments if f.get('remaining_weight', 0) < 100)  # Less than 100g
-    }
-    
-    return render_template('index.html',
-                         status=status,
-                         printers=printers,
-                         jobs=jobs,
-                         filaments=filaments,
-                         active_jobs=active_jobs,
-                         available_printers=available_printers,
-                         filament_stats=filament_stats)
+    # Counts the cluster maintains as it applies entries, so this is one small request at any farm size
+    summary = make_api_request("GET", "api/v1/summary")
+
+    # Share of its time in the cluster each listed printer has spent printing
+    now = time.time()
+    for printer in (summary or {}).get('printers', {}).get('busiest', []):
+        busy = printer['busy_seconds'] + (now - printer['running_since'] if printer.get('running_since') else 0)
+        age = now - printer['added_at'] if printer.get('added_at') else None
+        printer['utilization'] = min(1.0, busy / age) if age else None
+
+    return render_template('index.html', status=status, summary=summary)
 
 @app.route('/printers')
 def printers():
     """Printers management page"""
-    printers = make_api_request("GET", "api/v1/printers") or []
+    printers = read_collection("printers")
     return render_template('printers.html', printers=printers)
 
 @app.route('/add_printer', methods=['POST'])
@@ -68,7 +111,7 @@ def add_printer():
         'company': request.form['company'],
         'model': request.form['model']
     }
-    response = make_api_request("POST", "api/v1/printers", data)
+    response = write_and_wait("POST", "api/v1/printers", data)
     if response and response.get('success'):
         flash('Printer added successfully!', 'success')
     else:
@@ -78,7 +121,7 @@ def add_printer():
 @app.route('/filaments')
 def filaments():
     """Filaments management page"""
-    filaments = make_api_request("GET", "api/v1/filaments") or []
+    filaments = read_collection("filaments")
     return render_template('filaments.html', filaments=filaments)
 
 @app.route('/add_filament', methods=['POST'])
@@ -91,7 +134,7 @@ def add_filament():
         'total_weight_in_grams': float(request.form['weight']),
         'remaining_weight_in_grams': float(request.form['weight'])
     }
-    response = make_api_request("POST", "api/v1/filaments", data)
+    response = write_and_wait("POST", "api/v1/filaments", data)
     if response and response.get('success'):
         flash('Filament added successfully!', 'success')
     else:
@@ -101,9 +144,9 @@ def add_filament():
 @app.route('/jobs')
 def jobs():
     """Jobs management page"""
-    all_jobs = make_api_request("GET", "api/v1/jobs") or []
-    printers = make_api_request("GET", "api/v1/printers") or []
-    filaments = make_api_request("GET", "api/v1/filaments") or []
+    all_jobs = read_collection("jobs")
+    printers = read_collection("printers")
+    filaments = read_collection("filaments")
     return render_template('jobs.html', 
                          jobs=all_jobs, 
                          printers=printers,
@@ -116,10 +159,18 @@ def add_job():
         'id': request.form['job_id'],
         'printer_id': request.form['printer_id'],
         'filament_id': request.form['filament_id'],
-        'filepath': request.form['filepath'],
-        'print_weight_in_grams': float(request.form['print_weight'])
+        'filepath': request.form['filepath']
     }
-    response = make_api_request("POST", "api/v1/jobs", data)
+    # Left blank, the leader derives the weight from the G-code file
+    if request.form.get('print_weight'):
+        data['print_weight_in_grams'] = float(request.form['print_weight'])
+    response = write_and_wait("POST", "api/v1/jobs", data)
+    for _ in range(30):
+        # The leader is still analyzing a G-code file it had not seen; nothing was committed yet
+        if not response or response.get('status') != 'analyzing':
+            break
+        time.sleep(1)
+        response = write_and_wait("POST", "api/v1/jobs", data)
     if response and response.get('success'):
         flash('Job added successfully!', 'success')
     else:
@@ -131,7 +182,7 @@ def update_job_status():
     """Update job status"""
     job_id = request.form['job_id']
     new_status = request.form['status']
-    response = make_api_request("PATCH", f"api/v1/jobs/{job_id}/status", {'status': new_status})
+    response = write_and_wait("PATCH", f"api/v1/jobs/{job_id}/status", {'status': new_status})
     if response and response.get('success'):
         flash('Job status updated successfully!', 'success')
     else:
@@ -144,6 +195,20 @@ def cluster():
     status = get_client()
     return render_template('cluster.html', status=status)
 
+@app.route('/events')
+def events():
+    """Notify open pages when the local view changes so they refresh only on change"""
+    def generate(version):
+        while True:
+            new_version = view.wait_for_change(version, timeout=15)
+            if new_version == version:
+                yield ': keepalive\n\n'
+            else:
+                version = new_version
+                yield f'data: {version}\n\n'
+    return Response(generate(view.version), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
 @app.template_filter('datetime')
 def format_datetime(timestamp):
     """Format timestamp for templates"""
@@ -152,4 +217,5 @@ def format_datetime(timestamp):
     return timestamp
 
 if __name__ == '__main__':
+    view.start()
     app.run(host='127.0.0.1', port=5200, debug=True)
\ No newline at end of file
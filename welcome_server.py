@@ -1,15 +1,181 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, make_response, request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from raft.aggregates import merge_summaries
+from raft.sharding import ShardMap
+from raft.tracing import extract, get_tracer, inject
 import requests
 import json
+import itertools
+import threading
+import time
+import zlib
 
 app = Flask(__name__)
+tracer = get_tracer('welcome')
+
+# Client headers passed through to the leader (request IDs make retries idempotent)
+FORWARDED_HEADERS = ['X-Request-ID', 'X-Client-ID']
+
+# Leader response headers passed back to the client (Retry-After comes with 202, 429 and 503)
+RETURNED_HEADERS = ['Retry-After']
+
+# Headers passed through unchanged on blob uploads and downloads
+BLOB_REQUEST_HEADERS = ['Upload-Offset', 'Range', 'If-Range', 'If-None-Match', 'Content-Type']
+BLOB_RESPONSE_HEADERS = ['Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag',
+                         'Cache-Control', 'Last-Modified']
+
+# Last body and ETag seen per proxied GET, revalidated against the leader with If-None-Match.
+# Keys include the query string, so the least recently used are evicted past RESPONSE_CACHE_SIZE.
+RESPONSE_CACHE_SIZE = 1024
+response_cache = OrderedDict()
+response_cache_lock = threading.Lock()
+
+# Owning Raft group of each printer, filament and job; empty when the cluster runs one group
+shards = ShardMap()
+
+@app.before_request
+def start_trace():
+    """Continue the caller's trace through the proxy, or start one for a client that sent none"""
+    if request.path.startswith('/proxy/'):
+        g.trace_span = tracer.span(f'{request.method} /proxy', parent=extract(request.headers), root=True,
+                                   path=request.path[len('/proxy'):])
+
+@app.after_request
+def record_trace_status(response):
+    if 'trace_span' in g:
+        g.trace_span.set(status=response.status_code)
+    return response
+
+@app.teardown_request
+def end_trace(exc):
+    span = g.pop('trace_span', None)
+    if span is not None:
+        span.end(exc)
+
+def forwarded_headers():
+    """Client headers to send on, with the trace of this request so the leader's spans join it"""
+    return inject({h: request.headers[h] for h in FORWARDED_HEADERS if h in request.headers})
+
+def group_prefix(group):
+    """Path under which a node serves a Raft group; the root when the cluster is not sharded"""
+    return '' if group is None else f'/groups/{group}'
+
+def status_groups():
+    return shards.groups or [None]
 
 def load_peers():
     """Load peer information from peers.json"""
     with open('config/peers.json', 'r') as f:
         return json.load(f)
 
-def find_current_leader():
+# Cluster status gathered in the background so /NodeStatus and the proxy answer from memory
+STATUS_POLL_INTERVAL = 1.0  # seconds between cluster polls
+STATUS_MAX_AGE = 3.0  # older snapshots are not trusted to name the leader
+READ_REPLICA_MAX_LAG = 100  # learners further behind the leader than this do not serve API reads
+cluster_status = {}  # group (None when not sharded) -> latest snapshot
+status_lock = threading.Lock()
+probe_pool = ThreadPoolExecutor(max_workers=16)
+replica_turn = itertools.count()  # round-robin position over read replicas
+poller_started = False
+
+def probe_node(peer, group=None):
+    """Fetch one node's /status and time the round trip"""
+    node = dict(peer)
+    started = time.perf_counter()
+    try:
+        response = requests.get(f"http://{peer['host']}:{peer['port']}{group_prefix(group)}/status", timeout=1)
+        node['rpc_latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        if response.status_code == 200:
+            data = response.json()
+            node['reachable'] = True
+            for key in ('node_id', 'role', 'learner', 'term', 'log_index', 'commit_index', 'last_applied', 'ready'):
+                node[key] = data.get(key)
+            return node
+    except (requests.RequestException, ValueError):
+        pass
+    node['reachable'] = False
+    return node
+
+def poll_cluster(group=None):
+    """Probe every node in parallel and publish a new status snapshot for one Raft group"""
+    peers = load_peers()['peers']
+    nodes = list(probe_pool.map(lambda peer: probe_node(peer, group), peers))
+
+    leaders = [n for n in nodes if n['reachable'] and n.get('role') == 'leader']
+    leader_node = max(leaders, key=lambda n: n.get('term') or 0) if leaders else None
+    for node in nodes:
+        if leader_node and node['reachable'] and node is not leader_node:
+            node['replication_lag'] = (leader_node.get('log_index') or 0) - (node.get('last_applied') or 0)
+
+    snapshot = {
+        'leader': {
+            'host': leader_node['host'],
+            'port': leader_node['port'],
+            'node_id': leader_node['node_id']
+        } if leader_node else None,
+        'term': leader_node.get('term') if leader_node else max((n.get('term') or 0 for n in nodes), default=0),
+        'commit_index': leader_node.get('commit_index') if leader_node else None,
+        # Learners close enough to the leader to take API reads off it
+        'read_replicas': [
+            {'host': n['host'], 'port': n['port'], 'node_id': n['node_id']} for n in nodes
+            if n['reachable'] and n.get('learner') and n.get('ready')
+            and n.get('replication_lag', READ_REPLICA_MAX_LAG + 1) <= READ_REPLICA_MAX_LAG
+        ],
+        'peers': nodes,
+        'updated_at': time.time()
+    }
+    with status_lock:
+        cluster_status[group] = snapshot
+    return snapshot
+
+def run_status_poller():
+    while True:
+        try:
+            for group in status_groups():
+                poll_cluster(group)
+        except Exception as e:
+            print(f"[welcome] ❌ Cluster status poll failed: {str(e)}")
+        time.sleep(STATUS_POLL_INTERVAL)
+
+def start_status_poller():
+    global poller_started
+    if not poller_started:
+        poller_started = True
+        threading.Thread(target=run_status_poller, daemon=True).start()
+        for group in shards.groups:
+            threading.Thread(target=watch_group_jobs, args=(group,), daemon=True).start()
+
+def current_status(group=None):
+    """Latest snapshot, polling synchronously if the background poller has not produced one"""
+    with status_lock:
+        snapshot = cluster_status.get(group)
+    if snapshot is None or time.time() - snapshot['updated_at'] > STATUS_MAX_AGE:
+        snapshot = poll_cluster(group)
+    return snapshot
+
+def forget_leader(group=None):
+    """Drop a leader that just failed a proxied request so the next lookup re-probes"""
+    with status_lock:
+        if group in cluster_status:
+            cluster_status[group]['leader'] = None
+
+def find_current_leader(group=None):
+    """Return the current leader from the status snapshot, probing directly if it has none"""
+    with tracer.span('find leader', group=group) as span:
+        leader = current_status(group)['leader']
+        if not leader:
+            span.set(probed=True)
+            leader = probe_for_leader(group)
+        return leader
+
+def pick_read_replica(group=None):
+    """Next learner in turn to serve a read, or None when there is none to use"""
+    replicas = current_status(group).get('read_replicas')
+    return replicas[next(replica_turn) % len(replicas)] if replicas else None
+
+def probe_for_leader(group=None):
     """Find the current leader node by checking each peer"""
     peers_data = load_peers()
     for peer in peers_data['peers']:
@@ -17,7 +183,7 @@ def find_current_leader():
             continue
         try:
             response = requests.get(
-                f"http://{peer['host']}:{peer['port']}/status",
+                f"http://{peer['host']}:{peer['port']}{group_prefix(group)}/status",
                 timeout=1
             )
             if response.status_code == 200:
@@ -37,16 +203,11 @@ def find_current_leader():
 @app.route('/NodeStatus', methods=['GET'])
 def get_status():
     """Endpoint to get the status of the nodes"""
-    peers_data = load_peers()
-    leader = find_current_leader()
-
-    status = {
-        'success': True,
-        'leader': leader,
-        'peers': peers_data['peers']
-    }
-
-    return jsonify(status), 200
+    if not shards.sharded:
+        return jsonify({'success': True, **current_status()}), 200
+    # The first group is also reported at the top level, in the unsharded shape
+    groups = {group: current_status(group) for group in shards.groups}
+    return jsonify({'success': True, **groups[shards.groups[0]], 'groups': groups}), 200
 
 @app.route('/peers', methods=['GET'])
 def get_peers():
@@ -60,7 +221,8 @@ def get_peers():
 @app.route('/leader', methods=['GET'])
 def get_leader():
     """Endpoint to get current leader information"""
-    leader = find_current_leader()
+    group = request.args.get('group', shards.groups[0]) if shards.sharded else None
+    leader = find_current_leader(group)
     if leader:
         return jsonify({
             'success': True,
@@ -74,7 +236,33 @@ def get_leader():
 @app.route('/proxy/<path:subpath>', methods=['GET', 'POST', 'PATCH'])
 def proxy_to_leader(subpath):
     """Proxy all API requests to the current leader"""
-    leader = find_current_leader()
+    if subpath.startswith('blobs/'):
+        return proxy_blob(subpath)
+    if shards.sharded:
+        return proxy_to_shard(subpath)
+    return proxy_to_group(None, subpath)
+
+def proxy_to_group(group, subpath, method=None, body=None, query=None):
+    """Forward a request to the leader of one Raft group, or an API read to one of its learners"""
+    method = method or request.method
+    query = request.query_string.decode() if query is None else query
+    path = f"{group_prefix(group)}/{subpath}" + (f'?{query}' if query else '')
+    headers = forwarded_headers()
+    # Nodes rate-limit writes per client, and every proxied request comes from this server's address
+    headers.setdefault('X-Client-ID', request.remote_addr or 'unknown')
+    timeout = 5  # 5 seconds timeout for all requests
+
+    # Telemetry is held only by the leader that ingested it
+    replica = (pick_read_replica(group) if method == 'GET' and subpath.startswith('api/')
+               and not subpath.endswith('/telemetry') else None)
+    if replica:
+        try:
+            return proxy_cached_get(f"http://{replica['host']}:{replica['port']}{path}",
+                                    f"{group_prefix(group)}/{subpath}?{query}", dict(headers), timeout)
+        except requests.RequestException:
+            pass  # Fall back to the leader
+
+    leader = find_current_leader(group)
     if not leader:
         return jsonify({
             'success': False,
@@ -82,28 +270,35 @@ def proxy_to_leader(subpath):
         }), 404
     
     try:
-        leader_url = f"http://{leader['host']}:{leader['port']}/{subpath}"
-        timeout = 5  # 5 seconds timeout for all requests
+        leader_url = f"http://{leader['host']}:{leader['port']}{path}"
+        if body is None and method != 'GET':
+            body = request.json
         
-        if request.method == 'GET':
-            response = requests.get(leader_url, timeout=timeout)
-        elif request.method == 'POST':
-            response = requests.post(leader_url, json=request.json, timeout=timeout)
-        elif request.method == 'PATCH':
-            response = requests.patch(leader_url, json=request.json, timeout=timeout)
+        if method == 'GET':
+            return proxy_cached_get(leader_url, f"{group_prefix(group)}/{subpath}?{query}", headers, timeout)
+        with tracer.span(f'forward {method}', leader=f"{leader['host']}:{leader['port']}") as span:
+            inject(headers)
+            if method == 'POST':
+                response = requests.post(leader_url, json=body, headers=headers, timeout=timeout)
+            elif method == 'PATCH':
+                response = requests.patch(leader_url, json=body, headers=headers, timeout=timeout)
+            span.set(status=response.status_code)
         
+        returned = {h: response.headers[h] for h in RETURNED_HEADERS if h in response.headers}
         try:
-            return jsonify(response.json()), response.status_code
+            return jsonify(response.json()), response.status_code, returned
         except ValueError:
             # Handle case where response is not JSON
-            return response.text, response.status_code
+            return response.text, response.status_code, returned
             
     except requests.Timeout:
+        forget_leader(group)
         return jsonify({
             'success': False,
             'error': 'Request to leader timed out - the leader node might be busy'
         }), 504  # Gateway Timeout
     except requests.ConnectionError:
+        forget_leader(group)
         return jsonify({
             'success': False,
             'error': 'Could not connect to leader - the leader node might have failed'
@@ -114,5 +309,299 @@ def proxy_to_leader(subpath):
             'error': f'Failed to forward request to leader: {str(e)}'
         }), 500
 
+def proxy_blob(subpath):
+    """Forward a blob upload or download byte for byte, streaming what comes back"""
+    # A node process keeps one blob store for all its groups; peers copy blobs between processes
+    group = status_groups()[0]
+    leader = find_current_leader(group)
+    if not leader:
+        return jsonify({'success': False, 'error': 'No leader found'}), 404
+    query = request.query_string.decode()
+    url = f"http://{leader['host']}:{leader['port']}{group_prefix(group)}/{subpath}" + (f'?{query}' if query else '')
+    headers = {h: request.headers[h] for h in BLOB_REQUEST_HEADERS if h in request.headers}
+    try:
+        response = requests.request(request.method, url, data=request.get_data(), headers=headers,
+                                    stream=True, timeout=30)
+    except requests.RequestException as e:
+        forget_leader(group)
+        return jsonify({'success': False, 'error': f'Failed to forward blob request: {str(e)}'}), 502
+    return Response(response.iter_content(1 << 16), status=response.status_code,
+                    headers={h: response.headers[h] for h in BLOB_RESPONSE_HEADERS if h in response.headers})
+
+def fetch_cached(url, cache_key, headers, timeout):
+    """GET a URL, revalidating the local copy; returns ((etag, body), None) or (None, uncacheable response)"""
+    with response_cache_lock:
+        cached = response_cache.get(cache_key)
+        if cached:
+            response_cache.move_to_end(cache_key)
+    if cached:
+        headers['If-None-Match'] = cached[0]
+    response = requests.get(url, headers=headers, timeout=timeout)
+
+    if response.status_code == 304 and cached:
+        return cached, None
+    if response.status_code == 200 and 'ETag' in response.headers:
+        cached = (response.headers['ETag'], response.content)
+        with response_cache_lock:
+            response_cache[cache_key] = cached
+            response_cache.move_to_end(cache_key)
+            if len(response_cache) > RESPONSE_CACHE_SIZE:
+                response_cache.popitem(last=False)
+        return cached, None
+    return None, response
+
+def proxy_cached_get(leader_url, cache_key, headers, timeout):
+    """Forward a GET, answering from the local copy when the leader says it is unchanged"""
+    cached, response = fetch_cached(leader_url, cache_key, headers, timeout)
+    if cached is None:
+        returned = {h: response.headers[h] for h in RETURNED_HEADERS if h in response.headers}
+        try:
+            return jsonify(response.json()), response.status_code, returned
+        except ValueError:
+            return response.text, response.status_code, returned
+
+    etag, body = cached
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers={'ETag': etag})
+    return Response(body, mimetype='application/json', headers={'ETag': etag})
+
+# ------------------ SHARD ROUTING ------------------
+# List endpoints answered by merging every group's records
+SHARDED_LISTS = {'api/v1/printers', 'api/v1/filaments', 'api/v1/jobs'}
+
+def proxy_to_shard(subpath):
+    """Route a request to the Raft group that owns the printer, filament or job it names"""
+    parts = subpath.strip('/').split('/')
+    data = request.get_json(silent=True) or {}
+    group = request.args.get('group')
+    if group is not None and group not in shards.groups:
+        return jsonify({'success': False, 'error': f'Unknown group {group}'}), 400
+
+    if group is None and request.method == 'GET' and '/'.join(parts) in SHARDED_LISTS:
+        return gather_lists('/'.join(parts))
+
+    if group is None and request.method == 'GET' and parts == ['api', 'v1', 'summary']:
+        return gather_lists('api/v1/summary', lambda summaries: merge_summaries(
+            summaries, request.args.get('limit', 5, type=int)))
+
+    if group is None and request.method == 'POST' and parts in (['api', 'v1', 'printers'], ['api', 'v1', 'filaments']):
+        collection = parts[2]
+        group = shards.choose(data.get('id'), data.get('group'))
+        if group is None:
+            return jsonify({'success': False, 'error': f"Unknown group {data.get('group')}"}), 400
+        response = make_response(proxy_to_group(group, subpath))
+        if response.status_code == 201:
+            shards.assign(collection, data['id'], group)
+        return response
+
+    if group is None and request.method == 'POST' and parts == ['api', 'v1', 'jobs']:
+        return submit_sharded_job(data)
+
+    if group is None and request.method == 'PATCH' and parts[:3] == ['api', 'v1', 'jobs'] and parts[4:] == ['status']:
+        return update_sharded_job_status(parts[3], data)
+
+    if group is None and request.method == 'POST' and parts == ['api', 'v1', 'telemetry']:
+        return ingest_sharded_telemetry(data.get('samples'))
+
+    if (group is None and request.method == 'GET' and parts[:3] == ['api', 'v1', 'printers']
+            and (len(parts) == 4 or parts[4:] == ['telemetry'])):
+        group = shards.group_of('printers', parts[3]) or shards.choose(parts[3])
+
+    if group is None:
+        return jsonify({
+            'success': False,
+            'error': 'This endpoint is served per Raft group - pass ?group=<name>',
+            'groups': shards.groups
+        }), 400
+    query = urlencode([(k, v) for k, v in request.args.items(multi=True) if k != 'group'])
+    return proxy_to_group(group, subpath, query=query)
+
+def gather_lists(subpath, merge=None):
+    """Merge a list endpoint (or, given merge, any JSON body) across every group, revalidating each group's copy by ETag"""
+    query = request.query_string.decode()
+    headers = forwarded_headers()
+
+    def fetch(group):
+        leader = pick_read_replica(group) or find_current_leader(group)
+        if not leader:
+            return group, None, None
+        url = f"http://{leader['host']}:{leader['port']}{group_prefix(group)}/{subpath}"
+        try:
+            cached, response = fetch_cached(url + (f'?{query}' if query else ''),
+                                            f"{group_prefix(group)}/{subpath}?{query}", dict(headers), timeout=5)
+        except requests.RequestException:
+            forget_leader(group)
+            return group, None, None
+        return group, cached, response
+
+    bodies, etags = [], []
+    for group, cached, response in probe_pool.map(fetch, shards.groups):
+        if cached is None:
+            return jsonify({
+                'success': False,
+                'error': f'Group {group} has no reachable leader',
+                'status': response.status_code if response is not None else None
+            }), 502
+        etags.append(cached[0])
+        bodies.append(json.loads(cached[1]))
+
+    etag = f'"{zlib.crc32("|".join(etags).encode()):08x}"'
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers={'ETag': etag})
+    merged = merge(bodies) if merge else [record for body in bodies for record in body]
+    return Response(json.dumps(merged), mimetype='application/json', headers={'ETag': etag})
+
+def submit_sharded_job(data):
+    """Create a job in its printer's group, holding its filament first when that lives in another group"""
+    job_id, filament_id = data.get('id'), data.get('filament_id')
+    group = shards.group_of('printers', data.get('printer_id')) or shards.choose(data.get('printer_id'))
+    filament_group = shards.group_of('filaments', filament_id) or shards.choose(filament_id)
+    if not job_id or not filament_id or filament_group == group:
+        response = make_response(proxy_to_group(group, 'api/v1/jobs'))
+    elif not data.get('print_weight_in_grams'):
+        # The filament's group holds the weight before the job's group could analyze the G-code
+        return jsonify({
+            'success': False,
+            'error': 'print_weight_in_grams is required when the filament is in another group than the printer'
+        }), 400
+    else:
+        # Reserve in the filament's group, then create the job; release the hold if creation is refused
+        reserved = make_response(proxy_to_group(
+            filament_group, f'api/v1/filaments/{filament_id}/reservations', method='POST',
+            body={'job_id': job_id, 'weight': data.get('print_weight_in_grams')}, query=''))
+        if reserved.status_code != 201:
+            return reserved
+        shards.assign('reservations', job_id, {'group': filament_group, 'filament_id': filament_id})
+        response = make_response(proxy_to_group(
+            group, 'api/v1/jobs', body={**data, 'filament_group': filament_group}, query=''))
+        # 5xx and timeouts leave it unknown whether the job committed, so the hold is kept
+        if 400 <= response.status_code < 500 and not (reserved.get_json(silent=True) or {}).get('duplicate'):
+            settle_reservation(job_id, 'release')
+    if response.status_code == 201:
+        shards.assign('jobs', job_id, group)
+    return response
+
+def update_sharded_job_status(job_id, data):
+    """Update a job in its own group, then settle any filament hold it has in another group"""
+    path = f'api/v1/jobs/{job_id}/status'
+    group = shards.group_of('jobs', job_id)
+    if group is not None:
+        response = make_response(proxy_to_group(group, path))
+    else:
+        # Placed before the routing table recorded it; the other groups answer 404
+        for group in shards.groups:
+            response = make_response(proxy_to_group(group, path))
+            if response.status_code != 404:
+                break
+
+    new_status = data.get('status', '').capitalize()
+    if response.status_code == 200 and new_status in ('Done', 'Cancelled'):
+        settle_reservation(job_id, 'consume' if new_status == 'Done' else 'release')
+    return response
+
+def ingest_sharded_telemetry(samples):
+    """Split a telemetry batch by the group of each sample's printer and send the parts in parallel"""
+    if not isinstance(samples, list):
+        return jsonify({'success': False, 'error': 'samples must be a list'}), 400
+    by_group = {}
+    for sample in samples:
+        printer_id = sample.get('printer_id') if isinstance(sample, dict) else None
+        by_group.setdefault(shards.group_of('printers', printer_id) or shards.choose(printer_id), []).append(sample)
+
+    client_id = request.headers.get('X-Client-ID') or request.remote_addr or 'unknown'
+
+    def send(group):
+        leader = find_current_leader(group)
+        if not leader:
+            return group, None
+        try:
+            return group, requests.post(f"http://{leader['host']}:{leader['port']}{group_prefix(group)}/api/v1/telemetry",
+                                        json={'samples': by_group[group]}, headers={'X-Client-ID': client_id},
+                                        timeout=5)
+        except requests.RequestException:
+            forget_leader(group)
+            return group, None
+
+    accepted, unknown, failed = 0, [], []
+    for group, response in probe_pool.map(send, list(by_group)):
+        if response is None or response.status_code != 200:
+            failed.append(group)
+            continue
+        body = response.json()
+        accepted += body.get('accepted', 0)
+        unknown.extend(body.get('unknown_printers', []))
+    return jsonify({'success': not failed, 'accepted': accepted, 'unknown_printers': unknown,
+                    'failed_groups': failed}), 200 if not failed else 502
+
+def settle_reservation(job_id, outcome, attempts=3):
+    """Consume or release a job's filament hold in another group; settling twice is harmless"""
+    hold = shards.group_of('reservations', job_id)
+    if hold is None:
+        return True
+    group = hold['group']
+    # Also called from the job watchers, outside any client request, so it talks to the leader directly
+    path = f"{group_prefix(group)}/api/v1/filaments/{hold['filament_id']}/reservations/{job_id}"
+    for attempt in range(attempts):
+        leader = find_current_leader(group)
+        if leader:
+            try:
+                response = requests.patch(f"http://{leader['host']}:{leader['port']}{path}",
+                                          json={'outcome': outcome}, headers=inject({'X-Client-ID': 'welcome'}),
+                                          timeout=5)
+                if response.status_code == 200:
+                    shards.forget('reservations', job_id)  # Settled for good; stop tracking it
+                    return True
+            except requests.RequestException:
+                forget_leader(group)
+        time.sleep(0.2 * (attempt + 1))
+    print(f"[welcome] ❌ Could not {outcome} filament hold of job {job_id} in group {group}")
+    return False
+
+# ------------------ FILAMENT HOLDS ------------------
+HOLD_WATCH_TIMEOUT = 20  # seconds each /watch long-poll of a group waits for changes
+
+def settle_finished_jobs(jobs):
+    """Settle the filament holds of cross-shard jobs that are done or cancelled"""
+    for job_id, job in jobs.items():
+        if job.get('filament_group') and job.get('status') in ('Done', 'Cancelled'):
+            settle_reservation(job_id, 'consume' if job['status'] == 'Done' else 'release')
+
+def watch_group_jobs(group):
+    """Follow what a group commits and settle the holds of its cross-shard jobs as they finish.
+
+    Nodes finish jobs too (printer telemetry, G-code heavier than the free
+    filament), not only clients through the proxy. After a leader change or a
+    gap in the change feed the group's state is read once to catch up.
+    """
+    node_id, next_index = None, None
+    while True:
+        try:
+            leader = find_current_leader(group)
+            if not leader:
+                time.sleep(STATUS_POLL_INTERVAL)
+                continue
+            base = f"http://{leader['host']}:{leader['port']}{group_prefix(group)}"
+            if next_index is None:
+                state = requests.get(f"{base}/state", timeout=5).json()
+                node_id, next_index = state['node_id'], state['log_index']
+                settle_finished_jobs(state['jobs'])
+                continue
+            response = requests.get(f"{base}/watch", params={'from_index': next_index, 'timeout': HOLD_WATCH_TIMEOUT},
+                                    timeout=HOLD_WATCH_TIMEOUT + 5)
+            body = response.json() if response.status_code == 200 else {}
+            # Log indexes are per node, so a new leader means starting over
+            if body.get('node_id') != node_id:
+                next_index = None
+                continue
+            for event in body['events']:
+                settle_finished_jobs(event['changes'].get('jobs', {}))
+            next_index = body['next_index']
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"[welcome] ❌ Watching jobs of group {group} failed: {str(e)}")
+            forget_leader(group)
+            next_index = None
+            time.sleep(STATUS_POLL_INTERVAL)
+
 if __name__ == '__main__':
+    start_status_poller()
     app.run(host='127.0.0.1', port=5100)
\ No newline at end of file